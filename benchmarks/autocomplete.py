@@ -0,0 +1,151 @@
+"""
+User autocomplete latency: ``icontains`` scans against the name index.
+
+The ``icontains`` baseline returns the first ten matches by username, which
+needs a scan of the whole table.
+
+Builds a throwaway sqlite database with ``--users`` users named from a
+small pool of Vietnamese given and family names, indexes their names, gives
+the reader ``--friends`` friends, then times ``--samples`` random one to
+four letter prefixes through both lookups::
+
+    python -m benchmarks.autocomplete --users 1000000
+
+Rows are inserted with raw SQL and foreign key enforcement switched off
+for the throwaway database.
+"""
+import argparse
+import os
+import random
+import tempfile
+from .common import percentile, setup_django, time_calls
+
+BATCH_SIZE = 50000
+FAMILY_NAMES = [
+    "Nguyen", "Tran", "Le", "Pham", "Hoang", "Huynh", "Phan", "Vu", "Vo",
+    "Dang", "Bui", "Do", "Ho", "Ngo", "Duong", "Ly",
+]
+GIVEN_NAMES = [
+    "An", "Anh", "Bao", "Binh", "Chau", "Chi", "Cuong", "Dung", "Duc",
+    "Giang", "Ha", "Hai", "Hanh", "Hieu", "Hoa", "Hung", "Huong", "Khanh",
+    "Khoa", "Lan", "Linh", "Long", "Mai", "Minh", "Nam", "Ngoc", "Nhung",
+    "Phong", "Phuong", "Quang", "Quynh", "Son", "Tam", "Thao", "Thanh",
+    "Trang", "Trung", "Tuan", "Van", "Viet", "Vy", "Yen",
+]
+
+
+def load_rows(connection, users, friends):
+    from source.account.name_index import words
+
+    rng = random.Random(1)
+
+    def people():
+        for pk in range(1, users + 1):
+            first = rng.choice(GIVEN_NAMES)
+            last = rng.choice(FAMILY_NAMES)
+            username = "%s.%s%d" % (first.lower(), last.lower(), pk)
+            yield pk, username, first, last
+
+    def flush(cursor, user_rows, token_rows):
+        cursor.executemany(
+            "INSERT INTO auth_user (id, password, is_superuser, username, "
+            "first_name, last_name, email, is_staff, is_active, date_joined) "
+            "VALUES (%s, '', 0, %s, %s, %s, '', 0, 1, '2018-01-01')",
+            user_rows,
+        )
+        cursor.executemany(
+            "INSERT INTO account_nametoken (token, user_id) VALUES (%s, %s)",
+            token_rows,
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+        user_rows, token_rows = [], []
+        for row in people():
+            user_rows.append(row)
+            token_rows.extend(
+                (token, row[0])
+                for token in {word for name in row[1:] for word in words(name)}
+            )
+            if len(user_rows) == BATCH_SIZE:
+                flush(cursor, user_rows, token_rows)
+                user_rows, token_rows = [], []
+        flush(cursor, user_rows, token_rows)
+        cursor.executemany(
+            "INSERT INTO account_relationship "
+            "(user_one_id, user_two_id, status, is_friends) "
+            "VALUES (1, %s, 1, 1)",
+            [(pk,) for pk in rng.sample(range(2, users + 1), friends)],
+        )
+        cursor.execute("ANALYZE")
+
+
+def icontains(query):
+    from django.contrib.auth.models import User
+    from django.db.models import Q
+
+    return list(
+        User.objects.filter(
+            Q(username__icontains=query)
+            | Q(first_name__icontains=query)
+            | Q(last_name__icontains=query)
+        ).order_by("username").values_list("id", flat=True)[:10]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--friends", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    handle, path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(handle)
+    try:
+        setup_django(path)
+        from django.core.management import call_command
+        from django.db import connection
+        from source.account import name_index
+
+        call_command("migrate", verbosity=0)
+        load_rows(connection, args.users, args.friends)
+
+        rng = random.Random(2)
+        prefixes = [
+            (rng.choice(GIVEN_NAMES + FAMILY_NAMES)[:rng.randint(1, 4)],)
+            for _ in range(args.samples)
+        ]
+        results = [
+            ("icontains", time_calls(icontains, prefixes)),
+            (
+                "name_index",
+                time_calls(
+                    lambda query: name_index.autocomplete(1, query), prefixes
+                ),
+            ),
+        ]
+    finally:
+        os.remove(path)
+
+    print(
+        "%d users, reader with %d friends, %d prefixes"
+        % (args.users, args.friends, args.samples)
+    )
+    print("%-12s %10s %10s %10s" % ("lookup", "p50", "p95", "p99"))
+    for name, latencies in results:
+        print(
+            "%-12s %8.2fms %8.2fms %8.2fms"
+            % (
+                name,
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Helpers shared by the benchmark scripts in this package."""
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(database_name=None):
+    """
+    Configures Django for a benchmark run.
+
+    When ``database_name`` is given, the default sqlite database is swapped
+    for that file so a benchmark never touches the development database.
+    """
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "todo_social_app.settings")
+    from django.conf import settings
+
+    if database_name is not None:
+        settings.DATABASES["default"]["NAME"] = database_name
+    # Benchmarks replay far more writes per client than the limits allow.
+    settings.API_THROTTLE_RATES = {}
+    import django
+
+    django.setup()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return 0.0
+    rank = max(int(round(pct / 100.0 * len(samples))) - 1, 0)
+    return samples[min(rank, len(samples) - 1)]
+
+
+def time_calls(func, args_list):
+    """Calls ``func`` once per args tuple, returns sorted latencies (s)."""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples
@@ -0,0 +1,175 @@
+"""
+Connection setup cost per request: fresh, persistent and pooled.
+
+Serves ``--requests`` anonymous post list reads through the WSGI handler,
+so connections are opened and closed exactly as under gunicorn, once per
+connection mode of the default database:
+
+``fresh``
+    ``CONN_MAX_AGE = 0``, the stock behaviour, a connection per request.
+``persistent``
+    ``CONN_MAX_AGE = 600`` with health checks.
+``pooled``
+    ``POOL_SIZE = --concurrency`` connections shared by the threads.
+
+Run it against Postgres, configured from the environment as in production::
+
+    DATABASE_NAME=todo DATABASE_HOST=127.0.0.1 \\
+        python -m benchmarks.connections --requests 2000 --concurrency 4
+
+The database is migrated and seeded with a few users when it has no posts.
+Response caching is switched off so every request reads the database.
+"""
+import argparse
+import io
+import sys
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+from .common import percentile, setup_django
+
+MODES = {
+    "fresh": {"CONN_MAX_AGE": 0, "POOL_SIZE": 0},
+    "persistent": {"CONN_MAX_AGE": 600, "POOL_SIZE": 0},
+    "pooled": {"CONN_MAX_AGE": 0, "POOL_SIZE": None},
+}
+
+
+def get(application, url):
+    path, _, query = url.partition("?")
+    environ = {
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "wsgi.input": io.BytesIO(),
+    }
+    setup_testing_defaults(environ)
+    environ["SERVER_NAME"] = "localhost"
+    statuses = []
+    response = application(
+        environ, lambda status, headers: statuses.append(status)
+    )
+    try:
+        b"".join(response)
+    finally:
+        # Fires request_finished, which closes or returns connections.
+        response.close()
+    return statuses[0]
+
+
+def run(application, requests, concurrency):
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(count):
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            status = get(application, "/api/v1/posts/?limit=20")
+            samples.append(time.perf_counter() - start)
+            if not status.startswith("200"):
+                errors.append(status)
+                break
+        with lock:
+            latencies.extend(samples)
+
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(requests // concurrency + (i < requests % concurrency),),
+        )
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise RuntimeError("GET /api/v1/posts/ returned %s" % errors[0])
+    latencies.sort()
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--modes", default=",".join(sorted(MODES)),
+        help="Comma separated modes to compare.",
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connection, connections
+    from django.db.backends.signals import connection_created
+    from source.post.models import Post
+    from . import datagen
+
+    settings.CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+    }
+    if connection.vendor != "postgresql":
+        print(
+            "warning: the default database is %s, set DATABASE_NAME to "
+            "benchmark Postgres" % connection.vendor,
+            file=sys.stderr,
+        )
+    call_command("migrate", verbosity=0)
+    if not Post.objects.exists():
+        datagen.generate(users=50, friends=5, posts=5, likes=1, comments=1)
+    connections.close_all()
+
+    # Server connections seen, a pooled connection is handed out again
+    # with the same backend pid. Other databases have no pool, every
+    # connect is a new connection.
+    opened = set()
+
+    def record(sender, connection, **kwargs):
+        if connection.vendor == "postgresql":
+            opened.add(connection.connection.get_backend_pid())
+        else:
+            opened.add(object())
+
+    connection_created.connect(record, weak=False)
+    application = get_wsgi_application()
+    print(
+        "%d requests, %d threads, %s"
+        % (args.requests, args.concurrency, connection.vendor)
+    )
+    print(
+        "%-11s %9s %9s %9s %9s %12s"
+        % ("mode", "p50", "p95", "p99", "req/s", "connects/req")
+    )
+    for mode in args.modes.split(","):
+        overrides = dict(MODES[mode])
+        if overrides["POOL_SIZE"] is None:
+            overrides["POOL_SIZE"] = args.concurrency
+        connections.close_all()
+        for alias in connections:
+            connections[alias].settings_dict.update(overrides)
+        # Warm up imports, url resolution and, when pooled, the pool.
+        run(application, args.concurrency, args.concurrency)
+        opened.clear()
+        latencies, elapsed = run(
+            application, args.requests, args.concurrency
+        )
+        print(
+            "%-11s %7.2fms %7.2fms %7.2fms %9.1f %12.3f"
+            % (
+                mode,
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000,
+                len(latencies) / elapsed,
+                len(opened) / float(len(latencies)),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
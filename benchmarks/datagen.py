@@ -0,0 +1,240 @@
+"""
+Synthetic data for the benchmarks.
+
+Creates users (with profiles and api keys), accepted friendships, posts,
+likes, comments and the matching home feed entries with ``bulk_create``::
+
+    python -m benchmarks.datagen --users 10000 --database /tmp/bench.sqlite3
+
+Every generated user is named ``bench<n>`` and signs in with
+``PASSWORD``. The password is hashed once and shared, so seeding stays
+fast at any scale.
+"""
+import argparse
+import random
+import sys
+from .common import setup_django
+
+PASSWORD = "benchmark-password"
+USERNAME = "bench%d"
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert(model, objs, batch_size):
+    # Let the backend choose the statement size (sqlite caps both the
+    # number of parameters and of compound SELECT terms) and only bound
+    # how many unsaved instances are held in memory at once.
+    for batch in batched(objs, batch_size):
+        model.objects.bulk_create(batch)
+
+
+def generate(
+    users=1000,
+    friends=20,
+    posts=5,
+    likes=3,
+    comments=2,
+    seed=1,
+    batch_size=1000,
+    out=sys.stdout,
+):
+    """
+    Seeds the database. ``friends``, ``posts``, ``likes`` and ``comments``
+    are per user, per user, per post and per post respectively.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from tastypie.models import ApiKey
+    from source.account.models import Profile, Relationship
+    from source.feed.models import FeedEntry
+    from source.post import counters
+    from source.post.models import Post, Like, Comment
+
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    start = User.objects.filter(username__startswith="bench").count()
+    last_user = (
+        User.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    )
+
+    def log(message):
+        out.write(message + "\n")
+
+    with transaction.atomic():
+        insert(
+            User,
+            (
+                User(
+                    username=USERNAME % n,
+                    email="bench%d@example.com" % n,
+                    first_name="Bench",
+                    last_name=str(n),
+                    password=password,
+                )
+                for n in range(start, start + users)
+            ),
+            batch_size,
+        )
+        user_ids = list(
+            User.objects.filter(id__gt=last_user)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        insert(
+            ApiKey,
+            (
+                ApiKey(user_id=user_id, key=ApiKey().generate_key())
+                for user_id in user_ids
+            ),
+            batch_size,
+        )
+        insert(
+            Profile,
+            (Profile(user_id=user_id) for user_id in user_ids),
+            batch_size,
+        )
+        log("%d users" % len(user_ids))
+
+        # Each user befriends the next friends/2 users, giving everyone
+        # about ``friends`` accepted friends without duplicate pairs.
+        friend_map = {user_id: [] for user_id in user_ids}
+        pairs = []
+        for i, user_id in enumerate(user_ids):
+            for step in range(1, friends // 2 + 1):
+                other_id = user_ids[(i + step) % len(user_ids)]
+                if other_id == user_id or other_id in friend_map[user_id]:
+                    continue
+                friend_map[user_id].append(other_id)
+                friend_map[other_id].append(user_id)
+                pairs.append((user_id, other_id))
+        insert(
+            Relationship,
+            (
+                Relationship(
+                    user_one_id=user_one_id,
+                    user_two_id=user_two_id,
+                    status=Relationship.ACCEPTED,
+                    is_friends=True,
+                )
+                for user_one_id, user_two_id in pairs
+            ),
+            batch_size,
+        )
+        log("%d friendships" % len(pairs))
+
+        last_post = (
+            Post.objects.order_by("-id").values_list("id", flat=True).first()
+            or 0
+        )
+        insert(
+            Post,
+            (
+                Post(
+                    author_id=user_id,
+                    title="Post %d of %d" % (n, user_id),
+                    content="Benchmark post " * 10,
+                    image_path="",
+                    image_title="",
+                )
+                for user_id in user_ids
+                for n in range(posts)
+            ),
+            batch_size,
+        )
+        post_rows = list(
+            Post.objects.filter(id__gt=last_post)
+            .order_by("id")
+            .values_list("id", "author_id")
+        )
+        log("%d posts" % len(post_rows))
+
+        insert(
+            FeedEntry,
+            (
+                FeedEntry(owner_id=owner_id, post_id=post_id,
+                          author_id=author_id)
+                for post_id, author_id in post_rows
+                for owner_id in [author_id] + friend_map[author_id]
+            ),
+            batch_size,
+        )
+
+        def likes_of(post_id):
+            for author_id in rng.sample(user_ids, min(likes, len(user_ids))):
+                yield Like(author_id=author_id, post_id=post_id)
+
+        insert(
+            Like,
+            (like for post_id, _ in post_rows for like in likes_of(post_id)),
+            batch_size,
+        )
+        insert(
+            Comment,
+            (
+                Comment(
+                    author_id=rng.choice(user_ids),
+                    post_id=post_id,
+                    text="Benchmark comment",
+                )
+                for post_id, _ in post_rows
+                for n in range(comments)
+            ),
+            batch_size,
+        )
+        counters.reconcile(batch_size=batch_size)
+        log("%d likes, %d comments" % (
+            len(post_rows) * min(likes, len(user_ids)),
+            len(post_rows) * comments,
+        ))
+    return user_ids
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--friends", type=int, default=20,
+                        help="Accepted friends per user.")
+    parser.add_argument("--posts", type=int, default=5,
+                        help="Posts per user.")
+    parser.add_argument("--likes", type=int, default=3,
+                        help="Likes per post.")
+    parser.add_argument("--comments", type=int, default=2,
+                        help="Comments per post.")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    add_arguments(parser)
+    parser.add_argument(
+        "--database",
+        help="Sqlite file to seed instead of the configured database.",
+    )
+    args = parser.parse_args()
+    setup_django(args.database)
+    if args.database:
+        from django.core.management import call_command
+
+        call_command("migrate", verbosity=0)
+    generate(
+        users=args.users,
+        friends=args.friends,
+        posts=args.posts,
+        likes=args.likes,
+        comments=args.comments,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
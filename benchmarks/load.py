@@ -0,0 +1,357 @@
+"""
+Load test for the v1 API.
+
+Replays a weighted mix of ``sign_in``, feed and post list reads,
+``like_post`` and ``send_request`` calls as a pool of benchmark users, then
+reports p50/p95/p99 latency, throughput and (in process) queries per
+request for every operation::
+
+    python -m benchmarks.load --requests 5000
+    python -m benchmarks.load --url http://127.0.0.1:8000 --concurrency 8
+
+Without ``--url`` the requests go through Django's test client against a
+throwaway sqlite database seeded by ``benchmarks.datagen`` (or against
+``--database`` when that file already exists). With ``--url`` they go over
+HTTP to a running server seeded with ``python -m benchmarks.datagen``, pass
+the same ``--users`` to both.
+
+``--save`` writes the results as json and ``--baseline`` compares a run
+against such a file, exiting with status 1 when the p95 latency or the
+queries per request of an operation regress by more than ``--tolerance``.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from .common import percentile, setup_django
+from . import datagen
+
+DEFAULT_MIX = "sign_in=1,feed=6,posts=3,like_post=2,send_request=1"
+
+
+class InProcessTransport(object):
+    """Calls the API through Django's test client and counts queries."""
+
+    def __init__(self):
+        from django.test import Client
+
+        # Tastypie re-raises view errors for "testserver", any other
+        # name gets the regular error responses a server would send.
+        self.client = Client(SERVER_NAME="localhost")
+
+    def request(self, method, path, data=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            if method == "GET":
+                response = self.client.get(path)
+            else:
+                response = self.client.post(
+                    path,
+                    json.dumps(data or {}),
+                    content_type="application/json",
+                )
+        return response.status_code, response.content, len(queries)
+
+
+class HttpTransport(object):
+    """Calls a running server, keeping the session cookie per user."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, method, path, data=None):
+        body = None
+        if method != "GET":
+            body = json.dumps(data or {}).encode("utf-8")
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=body,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read(), None
+        except urllib.error.HTTPError as error:
+            return error.code, error.read(), None
+
+
+class VirtualUser(object):
+    def __init__(self, username, transport):
+        self.username = username
+        self.transport = transport
+        self.user_id = None
+        self.api_key = None
+        self.post_ids = []
+
+    def auth(self):
+        return "username=%s&api_key=%s" % (self.username, self.api_key)
+
+    def remember_posts(self, content):
+        try:
+            objects = json.loads(content.decode("utf-8"))["objects"]
+        except (ValueError, KeyError):
+            return
+        self.post_ids = [obj["id"] for obj in objects] or self.post_ids
+
+
+def sign_in(user, rng, user_ids):
+    status, content, queries = user.transport.request(
+        "POST",
+        "/api/v1/authentication/sign_in/",
+        {"username": user.username, "password": datagen.PASSWORD},
+    )
+    if status == 200:
+        data = json.loads(content.decode("utf-8"))
+        user.user_id, user.api_key = data["id"], data["api_key"]
+    return status, queries
+
+
+def feed(user, rng, user_ids):
+    status, content, queries = user.transport.request(
+        "GET", "/api/v1/feed/?" + user.auth()
+    )
+    user.remember_posts(content)
+    return status, queries
+
+
+def posts(user, rng, user_ids):
+    status, content, queries = user.transport.request(
+        "GET", "/api/v1/posts/?" + user.auth()
+    )
+    user.remember_posts(content)
+    return status, queries
+
+
+def like_post(user, rng, user_ids):
+    if not user.post_ids:
+        return feed(user, rng, user_ids)
+    status, content, queries = user.transport.request(
+        "POST", "/api/v1/posts/%s/liked/" % rng.choice(user.post_ids)
+    )
+    return status, queries
+
+
+def send_request(user, rng, user_ids):
+    status, content, queries = user.transport.request(
+        "POST",
+        "/api/v1/relationship/%s/send_friends/" % rng.choice(user_ids),
+    )
+    return status, queries
+
+
+OPERATIONS = {
+    "sign_in": sign_in,
+    "feed": feed,
+    "posts": posts,
+    "like_post": like_post,
+    "send_request": send_request,
+}
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError("Unknown operation %r" % name)
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def run(users, user_ids, mix, requests, concurrency, seed):
+    """
+    Replays ``requests`` operations drawn from ``mix`` spread over
+    ``concurrency`` threads, sending friend requests to ``user_ids``.
+    Returns the raw samples per operation and the wall clock duration.
+    """
+    names = sorted(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+
+    def worker(index, count):
+        rng = random.Random(seed + index)
+        own = users[index::concurrency]
+        for _ in range(count):
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            status, queries = OPERATIONS[name](rng.choice(own), rng, user_ids)
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[name].append((elapsed, status, queries))
+
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(index, requests // concurrency
+                  + (index < requests % concurrency)),
+        )
+        for index in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, duration):
+    results = {}
+    for name, rows in samples.items():
+        latencies = sorted(row[0] for row in rows)
+        queries = [row[2] for row in rows if row[2] is not None]
+        results[name] = {
+            "requests": len(rows),
+            "errors": sum(1 for row in rows if row[1] >= 500),
+            "rejected": sum(1 for row in rows if 400 <= row[1] < 500),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "queries": (sum(queries) / len(queries)) if queries else None,
+        }
+    total = sum(len(rows) for rows in samples.values())
+    return {
+        "duration_s": duration,
+        "throughput_rps": total / duration if duration else 0.0,
+        "operations": results,
+    }
+
+
+def report(summary, out=sys.stdout):
+    out.write(
+        "%-13s %8s %6s %8s %9s %9s %9s %8s\n"
+        % ("operation", "requests", "errors", "rejected",
+           "p50 ms", "p95 ms", "p99 ms", "queries")
+    )
+    for name, row in sorted(summary["operations"].items()):
+        queries = row["queries"]
+        out.write(
+            "%-13s %8d %6d %8d %9.2f %9.2f %9.2f %8s\n"
+            % (name, row["requests"], row["errors"], row["rejected"],
+               row["p50_ms"], row["p95_ms"], row["p99_ms"],
+               "-" if queries is None else "%.1f" % queries)
+        )
+    out.write(
+        "%.0f requests/s over %.2fs\n"
+        % (summary["throughput_rps"], summary["duration_s"])
+    )
+
+
+def regressions(summary, baseline, tolerance):
+    """Lists the operations that got slower or chattier than ``baseline``."""
+    found = []
+    for name, row in sorted(summary["operations"].items()):
+        before = baseline["operations"].get(name)
+        if before is None:
+            continue
+        if row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(
+                "%s p95 %.2fms > %.2fms"
+                % (name, row["p95_ms"], before["p95_ms"])
+            )
+        if (row["queries"] is not None and before["queries"] is not None
+                and row["queries"] > before["queries"]):
+            found.append(
+                "%s queries %.1f > %.1f"
+                % (name, row["queries"], before["queries"])
+            )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", help="Base url of a running server.")
+    parser.add_argument(
+        "--database",
+        help="Sqlite file for in process runs, seeded when missing.",
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--virtual-users", type=int, default=50,
+        help="Benchmark users signed in and replaying the mix.",
+    )
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--save", help="Write the results to this file.")
+    parser.add_argument("--baseline", help="Results to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    datagen.add_arguments(parser)
+    args = parser.parse_args()
+
+    temporary = None
+    if args.url is None:
+        if args.database is None:
+            handle, temporary = tempfile.mkstemp(suffix=".sqlite3")
+            os.close(handle)
+            os.unlink(temporary)
+        database = args.database or temporary
+        seed_data = not os.path.exists(database)
+        setup_django(database)
+        if seed_data:
+            from django.core.management import call_command
+
+            call_command("migrate", verbosity=0)
+            datagen.generate(
+                users=args.users,
+                friends=args.friends,
+                posts=args.posts,
+                likes=args.likes,
+                comments=args.comments,
+                seed=args.seed,
+            )
+
+    def transport():
+        if args.url:
+            return HttpTransport(args.url)
+        return InProcessTransport()
+
+    try:
+        users = []
+        for n in range(min(args.virtual_users, args.users)):
+            user = VirtualUser(datagen.USERNAME % n, transport())
+            status, _ = sign_in(user, None, None)
+            if status != 200:
+                parser.error("Could not sign in %s (%s)" % (
+                    user.username, status))
+            users.append(user)
+        # datagen creates the users back to back, so their ids are
+        # consecutive and friend requests can target the whole population
+        # rather than only the signed in users, who are mostly friends.
+        user_ids = range(users[0].user_id, users[0].user_id + args.users)
+        summary = summarize(*run(
+            users, user_ids, args.mix, args.requests, args.concurrency,
+            args.seed,
+        ))
+    finally:
+        if temporary and os.path.exists(temporary):
+            os.unlink(temporary)
+
+    report(summary)
+    if args.save:
+        with open(args.save, "w") as handle:
+            json.dump(summary, handle, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as handle:
+            found = regressions(summary, json.load(handle), args.tolerance)
+        for line in found:
+            sys.stderr.write("regression: %s\n" % line)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Relationship and Like lookup latency before and after the composite indexes.
+
+Builds a throwaway sqlite database migrated to the state before
+``account.0004_relationship_indexes`` / ``post.0003_like_unique``, loads
+``--rows`` relationship rows, times the lookups ``RelationshipResource`` and
+``PostResource.like_post`` issue, then applies the index migrations and
+times them again::
+
+    python -m benchmarks.relationship_lookups --rows 10000000
+
+Rows are inserted without matching ``auth_user`` rows, so foreign key
+enforcement is switched off for the throwaway database.
+"""
+import argparse
+import os
+import random
+import tempfile
+from .common import percentile, setup_django, time_calls
+
+BATCH_SIZE = 50000
+
+
+def load_rows(connection, rows, users, likes):
+    def relationships():
+        for i in range(rows):
+            user_one = i % users + 1
+            user_two = (user_one + i // users) % users + 1
+            yield (user_one, user_two, i % 4, i % 4 == 1)
+
+    def liked():
+        for i in range(likes):
+            yield (i % users + 1, i // users + 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+        batch = []
+        for row in relationships():
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(
+                    "INSERT INTO account_relationship "
+                    "(user_one_id, user_two_id, status, is_friends) "
+                    "VALUES (%s, %s, %s, %s)",
+                    batch,
+                )
+                batch = []
+        if batch:
+            cursor.executemany(
+                "INSERT INTO account_relationship "
+                "(user_one_id, user_two_id, status, is_friends) "
+                "VALUES (%s, %s, %s, %s)",
+                batch,
+            )
+        cursor.executemany(
+            "INSERT INTO post_like (author_id, post_id) VALUES (%s, %s)",
+            list(liked()),
+        )
+
+
+def lookups(samples, users):
+    from source.account.models import Relationship
+    from source.post.models import Like
+
+    pairs = [
+        (random.randint(1, users), random.randint(1, users))
+        for _ in range(samples)
+    ]
+    return [
+        (
+            "pair_status",
+            lambda a, b: Relationship.objects.filter(
+                user_one_id=a, user_two_id=b, status=0
+            ).exists(),
+            pairs,
+        ),
+        (
+            "reverse_pair_status",
+            lambda a, b: Relationship.objects.filter(
+                user_one_id=b, user_two_id=a, status=1
+            ).exists(),
+            pairs,
+        ),
+        (
+            "friend_ids",
+            lambda a, b: list(Relationship.objects.friend_ids(a)),
+            pairs,
+        ),
+        (
+            "like_author_post",
+            lambda a, b: Like.objects.filter(
+                author_id=a, post_id=b % 10 + 1
+            ).exists(),
+            pairs,
+        ),
+    ]
+
+
+def measure(samples, users):
+    results = {}
+    for name, func, args_list in lookups(samples, users):
+        latencies = time_calls(func, args_list)
+        results[name] = (
+            percentile(latencies, 50), percentile(latencies, 95)
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=None)
+    parser.add_argument("--likes", type=int, default=None)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+    users = args.users or max(args.rows // 100, 1000)
+    likes = args.likes if args.likes is not None else users * 10
+
+    handle, path = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(handle)
+    try:
+        setup_django(path)
+        from django.core.management import call_command
+        from django.db import connection
+
+        call_command("migrate", "account", "0003", verbosity=0)
+        call_command("migrate", "post", "0002", verbosity=0)
+        load_rows(connection, args.rows, users, likes)
+        before = measure(args.samples, users)
+
+        call_command("migrate", "account", verbosity=0)
+        call_command("migrate", "post", verbosity=0)
+        after = measure(args.samples, users)
+    finally:
+        os.remove(path)
+
+    print(
+        "%d relationship rows, %d likes, %d users, %d samples per lookup"
+        % (args.rows, likes, users, args.samples)
+    )
+    print(
+        "%-22s %12s %12s %12s %12s"
+        % ("lookup", "before p50", "before p95", "after p50", "after p95")
+    )
+    for name in before:
+        print(
+            "%-22s %10.1fus %10.1fus %10.1fus %10.1fus"
+            % (
+                name,
+                before[name][0] * 1e6,
+                before[name][1] * 1e6,
+                after[name][0] * 1e6,
+                after[name][1] * 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
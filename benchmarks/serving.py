@@ -0,0 +1,198 @@
+"""
+Serving modes compared: the Procfile's sync worker against gunicorn.conf.py.
+
+Starts gunicorn once per setup on a throwaway sqlite database seeded by
+``benchmarks.datagen``, replays a read mix of ``benchmarks.load`` over
+HTTP from ``--concurrency`` client threads, then reports requests per
+second, latency and the memory of each worker::
+
+    python -m benchmarks.serving --requests 3000 --concurrency 16
+
+``procfile``
+    ``gunicorn todo_social_app.wsgi``, one sync worker.
+``gthread``
+    ``gunicorn --config gunicorn.conf.py``, ``--workers`` preloaded and
+    warmed up workers of ``--threads`` threads.
+
+Memory is read from ``/proc``: RSS counts pages shared with the master as
+well, PSS splits them between the processes sharing them, which is what
+preloading saves. Needs gunicorn installed and Linux.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from .common import BASE_DIR, setup_django
+from . import datagen, load
+
+DEFAULT_MIX = "feed=2,posts=1"
+
+
+def gunicorn_command(setup, bind):
+    executable = os.path.join(os.path.dirname(sys.executable), "gunicorn")
+    if not os.path.exists(executable):
+        executable = "gunicorn"
+    if setup == "procfile":
+        return [executable, "todo_social_app.wsgi", "--bind", bind]
+    return [
+        executable, "--config", "gunicorn.conf.py", "todo_social_app.wsgi",
+        "--bind", bind,
+    ]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited with %s" % process.returncode)
+        try:
+            urllib.request.urlopen(url + "/api/v1/posts/?limit=1").read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not answer within %ss" % timeout)
+
+
+def children(pid):
+    found = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % name) as handle:
+                # The command may contain spaces, fields follow the ")".
+                fields = handle.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            found.append(int(name))
+    return found
+
+
+def memory_kb(pid):
+    """``(rss, pss)`` of ``pid`` in kB."""
+    values = {}
+    for path in ("/proc/%d/smaps_rollup" % pid, "/proc/%d/status" % pid):
+        try:
+            with open(path) as handle:
+                for line in handle:
+                    key, _, rest = line.partition(":")
+                    if key in ("Rss", "Pss", "VmRSS"):
+                        values.setdefault(key, int(rest.split()[0]))
+        except OSError:
+            continue
+    rss = values.get("Rss", values.get("VmRSS", 0))
+    return rss, values.get("Pss", rss)
+
+
+def serve_and_measure(setup, args, database):
+    port = free_port()
+    url = "http://127.0.0.1:%d" % port
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE="benchmarks.settings",
+        BENCHMARK_DATABASE=database,
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+    )
+    process = subprocess.Popen(
+        gunicorn_command(setup, "127.0.0.1:%d" % port),
+        cwd=BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(url, process)
+        users = []
+        for n in range(min(args.virtual_users, args.users)):
+            user = load.VirtualUser(
+                datagen.USERNAME % n, load.HttpTransport(url)
+            )
+            load.sign_in(user, None, None)
+            users.append(user)
+        user_ids = range(users[0].user_id, users[0].user_id + args.users)
+        summary = load.summarize(*load.run(
+            users, user_ids, args.mix, args.requests, args.concurrency,
+            args.seed,
+        ))
+        workers = [memory_kb(pid) for pid in children(process.pid)]
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+    return summary, workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--virtual-users", type=int, default=50)
+    parser.add_argument("--mix", type=load.parse_mix, default=DEFAULT_MIX)
+    parser.add_argument(
+        "--setups", default="procfile,gthread",
+        help="Comma separated setups to compare.",
+    )
+    datagen.add_arguments(parser)
+    args = parser.parse_args()
+
+    handle, database = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(handle)
+    try:
+        setup_django(database)
+        from django.core.management import call_command
+
+        call_command("migrate", verbosity=0)
+        datagen.generate(
+            users=args.users,
+            friends=args.friends,
+            posts=args.posts,
+            likes=args.likes,
+            comments=args.comments,
+            seed=args.seed,
+        )
+        results = [
+            (setup,) + serve_and_measure(setup, args, database)
+            for setup in args.setups.split(",")
+        ]
+    finally:
+        os.remove(database)
+
+    print(
+        "%-9s %8s %8s %9s %9s %9s %14s %14s"
+        % ("setup", "workers", "req/s", "p50 ms", "p95 ms", "errors",
+           "rss/worker MB", "pss/worker MB")
+    )
+    for setup, summary, workers in results:
+        operations = summary["operations"].values()
+        count = len(workers) or 1
+        print(
+            "%-9s %8d %8.0f %9.2f %9.2f %9d %14.1f %14.1f"
+            % (
+                setup,
+                len(workers),
+                summary["throughput_rps"],
+                max(row["p50_ms"] for row in operations),
+                max(row["p95_ms"] for row in operations),
+                sum(row["errors"] for row in operations),
+                sum(rss for rss, _ in workers) / 1024.0 / count,
+                sum(pss for _, pss in workers) / 1024.0 / count,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""Project settings for benchmark servers, on the ``BENCHMARK_DATABASE``
+sqlite file unless ``DATABASE_NAME`` selects Postgres, without rate limits."""
+import os
+from todo_social_app.settings import *  # noqa: F401,F403
+from todo_social_app.settings import DATABASES
+
+if not os.environ.get("DATABASE_NAME"):
+    DATABASES["default"]["NAME"] = os.environ["BENCHMARK_DATABASE"]
+
+API_THROTTLE_RATES = {}
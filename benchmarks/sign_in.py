@@ -0,0 +1,97 @@
+"""
+Sign in latency and logins per second per core.
+
+Creates ``--users`` users on a throwaway sqlite database, then signs them
+in ``--requests`` times through the API from a single thread, once per
+PBKDF2 iteration count in ``--iterations``::
+
+    python -m benchmarks.sign_in --iterations 36000,100000,200000
+
+Passwords are stored with the count being measured, so no login pays for
+a hash upgrade. Logins per CPU second is what one core sustains, it is
+bound by the hash and sets the cost ``PASSWORD_HASH_ITERATIONS`` can
+afford.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from .common import percentile, setup_django
+from . import datagen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--iterations", default="100000",
+        help="Comma separated PBKDF2 iteration counts to compare.",
+    )
+    args = parser.parse_args()
+
+    handle, database = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(handle)
+    try:
+        setup_django(database)
+        from django.conf import settings
+        from django.contrib.auth.hashers import make_password
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+
+        call_command("migrate", verbosity=0)
+        for n in range(args.users):
+            User.objects.create_user(datagen.USERNAME % n)
+        # Tastypie re-raises view errors for "testserver".
+        client = Client(SERVER_NAME="localhost")
+
+        print(
+            "%-10s %9s %9s %9s %12s %12s"
+            % ("iterations", "p50", "p95", "p99", "logins/cpu-s",
+               "queries")
+        )
+        for iterations in args.iterations.split(","):
+            settings.PASSWORD_HASH_ITERATIONS = int(iterations)
+            User.objects.update(password=make_password(datagen.PASSWORD))
+            latencies, queries = [], 0
+            cpu_start = time.process_time()
+            for n in range(args.requests):
+                body = json.dumps({
+                    "username": datagen.USERNAME % (n % args.users),
+                    "password": datagen.PASSWORD,
+                })
+                client.cookies.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.post(
+                        "/api/v1/authentication/sign_in/",
+                        body,
+                        content_type="application/json",
+                    )
+                    latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    parser.error("sign in returned %s" % response.status_code)
+                queries += len(captured)
+            cpu = time.process_time() - cpu_start
+            latencies.sort()
+            print(
+                "%-10s %7.2fms %7.2fms %7.2fms %12.1f %12.2f"
+                % (
+                    iterations,
+                    percentile(latencies, 50) * 1000,
+                    percentile(latencies, 95) * 1000,
+                    percentile(latencies, 99) * 1000,
+                    args.requests / cpu,
+                    queries / float(args.requests),
+                )
+            )
+    finally:
+        os.remove(database)
+
+
+if __name__ == "__main__":
+    main()
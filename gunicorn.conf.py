@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for serving the api::
+
+    gunicorn --config gunicorn.conf.py todo_social_app.wsgi
+
+Threaded (``gthread``) workers serve ``GUNICORN_THREADS`` requests each at
+once, so a request waiting on the database no longer holds up the whole
+process. The application is loaded and warmed up (see
+``todo_social_app.warmup``) once in the master before it forks, and workers
+are replaced after ``GUNICORN_MAX_REQUESTS`` requests, give or take a
+jitter, to bound memory growth.
+
+With ``DATABASE_POOL_SIZE`` set, keep it at least ``GUNICORN_THREADS``, the
+pool is per worker and each thread holds one connection per request.
+"""
+import multiprocessing
+import os
+
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "8000")
+
+worker_class = "gthread"
+workers = int(
+    os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1)
+)
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+# Read back by the settings, whose checks warn about per worker caches.
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+preload_app = True
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Worker heartbeats go to memory rather than a possibly slow disk.
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")
+errorlog = "-"
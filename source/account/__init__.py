@@ -0,0 +1 @@
+default_app_config = 'source.account.apps.AccountConfig'
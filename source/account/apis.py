@@ -1,43 +1,69 @@
 import re
+from django.conf import settings
 from django.conf.urls import url
 from django.contrib.auth.models import User
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
-from tastypie.resources import ModelResource, ALL
+from django.db import IntegrityError, transaction
+from tastypie.resources import ALL
 from tastypie.http import HttpUnauthorized, HttpForbidden
 from tastypie.authorization import Authorization
-from tastypie.authentication import Authentication, ApiKeyAuthentication
+from tastypie.authentication import Authentication
+from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.paginator import Paginator
 
 # from tastypie.exceptions import BadRequest
 from tastypie.utils import trailing_slash
 from tastypie import fields
+from ..commons import fieldsets
 from ..commons.custom_exception import CustomBadRequest
+from ..commons.resources import BaseModelResource
+from .authentication import CachedApiKeyAuthentication, signed_in_user_id
 from .models import Profile, Relationship
+from . import friend_graph, name_index, relationships
 from .authorization import UserObjectsOnlyAuthorization
 from .validation import UserProfileValidation
 
 
-class ProfileResource(ModelResource):
+USERNAME_RE = re.compile(r"^[\w.@+-]+$")
+EMAIL_RE = re.compile(
+    "^[_a-z0-9-]+(\\.[_a-z0-9-]+)*@[a-z0-9-]+(\\.[a-z0-9-]+)*(\\.[a-z]{2,4})$"
+)
+# sign_in checks passwords itself, sessions load the user through this.
+MODEL_BACKEND = "django.contrib.auth.backends.ModelBackend"
+
+# Keys of the users listed by the relationship routes.
+LISTED_USER_FIELDS = ("id", "username", "first_name", "last_name")
+
+PROFILE_FIELDS = (
+    "other_name",
+    "birthday",
+    "address",
+    "phone_number",
+    "photo_url",
+)
+
+
+class ProfileResource(BaseModelResource):
     class Meta:
         queryset = Profile.objects.all()
         resource_name = "user-profile"
-        fields = [
-            "id",
-            "other_name",
-            "birthday",
-            "address",
-            "phone_number",
-            "photo_url",
-        ]
+        fields = ["id"] + list(PROFILE_FIELDS)
         include_resource_uri = False
-        authentication = ApiKeyAuthentication()
+        authentication = CachedApiKeyAuthentication()
         authorization = Authorization()
+        query_budget = 3
 
 
-class UserResource(ModelResource):
+class UserResource(BaseModelResource):
+    # Profile values are applied by ``hydrate_profile``/``save_profile``
+    # rather than by saving the nested resource, so a payload may leave the
+    # profile out entirely.
     profile = fields.ForeignKey(
-        ProfileResource, attribute="profile", full=True
+        ProfileResource, attribute="profile", full=True, blank=True
     )
 
     class Meta:
@@ -54,21 +80,134 @@ class UserResource(ModelResource):
         allowed_methods = ["get", "post", "put", "patch", "delete"]
         filtering = {"slug": ALL, "username": ALL}
         include_resource_uri = False
-        authentication = ApiKeyAuthentication()
+        authentication = CachedApiKeyAuthentication()
         authorization = UserObjectsOnlyAuthorization()
+        read_from_replica = True
+        # Autocomplete with cold caches: the key, friends, blocks, friend
+        # names, the matching tokens, their users and their friends.
+        query_budget = 7
 
-    def hydrate_profile(self, bundle):
-        profile = Profile.objects.get(user_id=bundle.obj.id)
-        profile.other_name = bundle.data["other_name"]
-        profile.birthday = bundle.data["birthday"]
-        profile.address = bundle.data["address"]
-        profile.phone_number = bundle.data["phone_number"]
-        profile.photo_url = bundle.data["photo_url"]
-        profile.save()
+    def prepend_urls(self):
+        return [
+            url(
+                r"^(?P<resource_name>%s)/autocomplete%s$"
+                % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view("autocomplete"),
+                name="api_user_autocomplete",
+            ),
+        ]
+
+    def autocomplete(self, request, **kwargs):
+        self.method_check(request, allowed=["get"])
+        self.is_authenticated(request)
+        limit = Paginator(
+            request.GET,
+            [],
+            limit=settings.NAME_INDEX_LIMIT,
+            max_limit=settings.NAME_INDEX_MAX_LIMIT,
+        ).get_limit()
+        matches = name_index.autocomplete(
+            request.user.id, request.GET.get("q", ""), limit=limit
+        )
+        objects = [
+            {
+                "id": values["id"],
+                "username": values["username"],
+                "first_name": values["first_name"],
+                "last_name": values["last_name"],
+                "other_name": values["profile__other_name"] or "",
+                "is_friend": is_friend,
+                "mutual_friends": mutual_friends,
+            }
+            for values, is_friend, mutual_friends in matches
+        ]
+        return self.create_response(
+            request, {"meta": {"limit": limit}, "objects": objects}
+        )
+
+    def hydrate(self, bundle):
+        # Runs before any field is set, so this is what the row holds.
+        bundle.loaded_values = {
+            field.name: getattr(bundle.obj, field.attname)
+            for field in User._meta.concrete_fields
+        }
         return super(UserResource, self).hydrate(bundle)
 
+    def hydrate_profile(self, bundle):
+        """
+        Takes the profile values out of the payload, nested under
+        ``profile`` or at the top level. Only the keys that were sent are
+        kept, so a PATCH leaves the other columns alone.
+        """
+        nested = bundle.data.pop("profile", None)
+        values = {
+            name: bundle.data[name]
+            for name in PROFILE_FIELDS
+            if name in bundle.data
+        }
+        if isinstance(nested, dict):
+            values.update(
+                (name, nested[name]) for name in PROFILE_FIELDS
+                if name in nested
+            )
+        bundle.profile_values = values
+        return bundle
+
+    def save_profile(self, bundle):
+        values = getattr(bundle, "profile_values", None)
+        if not values:
+            return
+        try:
+            profile = bundle.obj.profile
+        except Profile.DoesNotExist:
+            profile = Profile(user=bundle.obj)
+        changed = []
+        for name, value in values.items():
+            try:
+                value = Profile._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise CustomBadRequest(error_type="INVALID_DATA", field=name)
+            if getattr(profile, name) != value:
+                setattr(profile, name, value)
+                changed.append(name)
+        if profile._state.adding:
+            profile.save()
+        elif changed:
+            profile.save(update_fields=changed)
+
+    def save(self, bundle, skip_errors=False):
+        """
+        Writes only the user and profile columns that changed, in one
+        transaction.
+        """
+        if bundle.obj._state.adding:
+            with transaction.atomic():
+                bundle = super(UserResource, self).save(bundle, skip_errors)
+                self.save_profile(bundle)
+            return bundle
+
+        self.is_valid(bundle)
+        if bundle.errors and not skip_errors:
+            raise ImmediateHttpResponse(
+                response=self.error_response(bundle.request, bundle.errors)
+            )
+        self.authorized_update_detail(
+            self.get_object_list(bundle.request), bundle
+        )
+        changed = [
+            name
+            for name, value in bundle.loaded_values.items()
+            if getattr(bundle.obj, User._meta.get_field(name).attname)
+            != value
+        ]
+        with transaction.atomic():
+            if changed:
+                bundle.obj.save(update_fields=changed)
+            self.save_profile(bundle)
+        return bundle
+
 
-class AuthenticationResource(ModelResource):
+class AuthenticationResource(BaseModelResource):
     class Meta:
         queryset = User.objects.all()
         excludes = ["password", "is_superuser"]
@@ -111,6 +250,14 @@ class AuthenticationResource(ModelResource):
             ),
         ]
 
+    def start_session(self, request, user):
+        """
+        Logs ``user`` in, unless ``API_SESSION_MODE`` is ``"none"`` and
+        clients sign their requests with the api key instead.
+        """
+        if getattr(settings, "API_SESSION_MODE", "db") != "none":
+            login(request, user, backend=MODEL_BACKEND)
+
     def sign_in(self, request, **kwargs):
         self.method_check(request, allowed=["post"])
         data = self.deserialize(
@@ -123,50 +270,52 @@ class AuthenticationResource(ModelResource):
         password = data.get("password", "")
 
         # Valdate username
-        if bool(re.match(r"^[\w.@+-]+$", username)) is False:
+        if USERNAME_RE.match(username) is None:
             raise CustomBadRequest(error_message="Username invalid")
-        # Sign in by email
-        match = re.match(
-            "^[_a-z0-9-]+(\\.[_a-z0-9-]+)*@[a-z0-9-]+(\\.[a-z0-9-]+)*(\\.[a-z]{2,4})$",
-            username,
+        # Sign in by email or username, the API key comes in the same
+        # query. Passwords are checked against their hash only, the
+        # validators are for choosing one.
+        lookup = "email" if EMAIL_RE.match(username) else "username"
+        user = (
+            User.objects.select_related("api_key")
+            .filter(**{lookup: username})
+            .order_by("pk")
+            .first()
         )
-        if match is not None:
-            if User.objects.filter(email=username).exists():
-                user = User.objects.get(email=username)
-                username = user.username
-            else:
-                raise CustomBadRequest(
-                    error_type="UNAUTHORIZED",
-                    error_message="You were sign in by email, but email is not exist",
-                )
-        # Validate password
-        validate_password(password)
-
-        user = authenticate(username=username, password=password)
-        if user:
-            if user.is_active:
-                login(request, user)
-                return self.create_response(
-                    request,
-                    {
-                        "success": True,
-                        "id": user.id,
-                        "username": user.username,
-                        "api_key": user.api_key.key,
-                    },
-                )
-            else:
-                return self.create_response(
-                    request,
-                    {"success": False, "reason": "disabled"},
-                    HttpForbidden,
-                )
-        else:
+        if user is None and lookup == "email":
+            raise CustomBadRequest(
+                error_type="UNAUTHORIZED",
+                error_message=(
+                    "You were sign in by email, but email is not exist"
+                ),
+            )
+        if user is None:
+            # Hash anyway, so response times do not tell which usernames
+            # exist.
+            make_password(password)
+        # Re-hashes the password when the hasher settings changed.
+        if user is None or not user.check_password(password):
             return self.create_response(
                 request,
                 {"success": False, "reason": "incorrect"},
                 HttpUnauthorized,
             )
+        if not user.is_active:
+            return self.create_response(
+                request,
+                {"success": False, "reason": "disabled"},
+                HttpForbidden,
+            )
+        self.start_session(request, user)
+        return self.create_response(
+            request,
+            {
+                "success": True,
+                "id": user.id,
+                "username": user.username,
+                "api_key": user.api_key.key,
+            },
+        )
 
     def sign_out(self, request, **kwargs):
         self.is_authenticated(request)
@@ -207,48 +356,47 @@ class AuthenticationResource(ModelResource):
         photo_url = data.get("photo_url", "").strip()
 
         # Valdate username
-        if bool(re.match(r"^[\w.@+-]+$", username)) is False:
+        if USERNAME_RE.match(username) is None:
             raise CustomBadRequest(error_message="Username invalid")
-        elif User.objects.filter(username=username).exists():
-            raise CustomBadRequest(
-                error_type="DUPLICATE_VALUE",
-                error_message="Username already exists",
-            )
 
         # Validate password
         validate_password(password)
 
         # Validate email
         validate_email(email)
-        if User.objects.filter(email=email).exists():
-            raise CustomBadRequest(
-                error_type="DUPLICATE_VALUE",
-                error_message="This email already \
-                                   has been registered by another account",
-            )
-        else:
-            User.objects.create_user(
-                username=username,
-                email=email,
-                password=password,
-                first_name=first_name,
-                last_name=last_name,
-            )
-            user = authenticate(username=username, password=password)
-            login(request, user)
-            if user is not None:
+
+        # Duplicate usernames and emails are caught by the unique indexes.
+        # The password is hashed once, by create_user, and the post_save
+        # handlers add the API key and name tokens in the same transaction.
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=username,
+                    email=email,
+                    password=password,
+                    first_name=first_name,
+                    last_name=last_name,
+                )
                 Profile.objects.create(
-                    user_id=user.id,
+                    user=user,
                     other_name=other_name,
                     address=address,
                     birthday=birthday,
                     phone_number=phone_number,
                     photo_url=photo_url,
                 )
-            else:
+        except IntegrityError:
+            if User.objects.filter(username=username).exists():
                 raise CustomBadRequest(
-                    error_message="Can't create userprofile"
+                    error_type="DUPLICATE_VALUE",
+                    error_message="Username already exists",
                 )
+            raise CustomBadRequest(
+                error_type="DUPLICATE_VALUE",
+                error_message="This email already \
+                                   has been registered by another account",
+            )
+        self.start_session(request, user)
 
         return self.create_response(
             request,
@@ -279,20 +427,58 @@ class AuthenticationResource(ModelResource):
         return self.create_response(request, {"success": True})
 
 
-class RelationshipResource(ModelResource):
+class RelationshipResource(BaseModelResource):
     user_one = fields.ForeignKey(UserResource, attribute="user_one", full=True)
     user_two = fields.ForeignKey(UserResource, attribute="user_two", full=True)
 
+    BULK_ACTIONS = {
+        "send_friends": relationships.SEND,
+        "accept_friends": relationships.ACCEPT,
+        "un_friends": relationships.UNFRIEND,
+        "block_friends": relationships.BLOCK,
+    }
+
     class Meta:
         queryset = Relationship.objects.all()
         resource_name = "relationship"
-        authentication = ApiKeyAuthentication()
+        authentication = CachedApiKeyAuthentication()
         authorization = Authorization()
+        # Suggestions with cold caches: the session, the user, friends,
+        # their friends, blocks and the suggested users.
+        query_budget = 6
         always_return_data = True
         include_resource_uri = False
 
     def prepend_urls(self):
         return [
+            # Bulk requests, before the per user routes would take "bulk"
+            # for a user id
+            url(
+                r"^(?P<resource_name>%s)/bulk/(?P<action>send_friends|"
+                r"accept_friends|un_friends|block_friends)/$"
+                % (self._meta.resource_name),
+                self.wrap_view("bulk_request"),
+                name="api_bulk_request",
+            ),
+            # Friend graph
+            url(
+                r"^(?P<resource_name>%s)/friends/$"
+                % (self._meta.resource_name),
+                self.wrap_view("friends"),
+                name="api_friends",
+            ),
+            url(
+                r"^(?P<resource_name>%s)/suggestions/$"
+                % (self._meta.resource_name),
+                self.wrap_view("suggestions"),
+                name="api_friend_suggestions",
+            ),
+            url(
+                r"^(?P<resource_name>%s)/(?P<pk>\d+)/mutual_friends/$"
+                % (self._meta.resource_name),
+                self.wrap_view("mutual_friends"),
+                name="api_mutual_friends",
+            ),
             # Sending Request
             url(
                 r"^(?P<resource_name>%s)/(?P<pk>[\w\d_.-]+)/send_friends/$"
@@ -323,118 +509,170 @@ class RelationshipResource(ModelResource):
             ),
         ]
 
-    def send_request(self, request, **kwargs):
-        self.method_check(request, allowed=["post"])
-        user_one_id = request.user.id
-        if user_one_id is None:
+    def signed_in_user_id(self, request):
+        user_id = signed_in_user_id(request)
+        if user_id is None:
             raise CustomBadRequest(
                 error_type="UNAUTHORIZED", error_message="Please signin first"
             )
-        # user_two_id = request.GET["pk"]
-        user_two_id = request.resolver_match.kwargs["pk"]
-        # Check current relationship
-        rela = Relationship.objects.filter(user_one_id=user_one_id).filter(
-            user_two_id=user_two_id
-        )
-        reverse_rela = Relationship.objects.filter(
-            user_one_id=user_two_id
-        ).filter(user_two_id=user_one_id)
-        if rela.filter(status=0).exists():
-            raise CustomBadRequest(
-                error_type="DOES_NOT_EXITS",
-                error_message="You were send request to this user",
-            )
-        if rela.filter(status=2).exists():
-            new_rela = rela.filter(status=2).get(user_one_id=user_one_id)
-            new_rela.status = 0
-            new_rela.save()
-        elif reverse_rela.filter(status=1):
-            raise CustomBadRequest(
-                error_message="You and this user are friends "
-            )
-        elif reverse_rela.filter(status=3):
-            raise CustomBadRequest(
-                error_type="UNAUTHORIZED",
-                error_message="You can't send request to this user",
-            )
-        else:
-            Relationship.objects.create(
-                user_one_id=user_one_id, user_two_id=user_two_id
+        return user_id
+
+    def users_response(
+        self, request, user_ids, meta, extra=None, extra_fields=()
+    ):
+        """
+        Lists ``user_ids`` in order with their names, one query, plus the
+        ``extra_fields`` ``extra`` has for each of them. Only the keys named
+        in ``?fields=`` are kept, naming another one is a 400.
+        """
+        selection = fieldsets.current(request)
+        if selection.fields is not None:
+            unknown = set(selection.fields).difference(
+                LISTED_USER_FIELDS, extra_fields
             )
-        return self.create_response(request, {"success": True})
+            if unknown:
+                raise CustomBadRequest(
+                    error_message="Unknown fields: %s"
+                    % ", ".join(sorted(unknown))
+                )
+        users = User.objects.in_bulk(user_ids)
+        objects = []
+        for user_id in user_ids:
+            user = users.get(user_id)
+            if user is None:
+                continue
+            obj = {name: getattr(user, name) for name in LISTED_USER_FIELDS}
+            if extra:
+                obj.update(extra[user_id])
+            if selection.fields is not None:
+                obj = {
+                    key: value for key, value in obj.items()
+                    if key in selection.fields
+                }
+            objects.append(obj)
+        return self.create_response(
+            request, {"meta": meta, "objects": objects}
+        )
 
-    def accept_request(self, request, **kwargs):
+    def paginated_users(self, request, user_ids):
+        paginator = Paginator(
+            request.GET,
+            user_ids,
+            resource_uri=request.path,
+            limit=self._meta.limit,
+            max_limit=self._meta.max_limit,
+        )
+        page = paginator.page()
+        return self.users_response(request, page["objects"], page["meta"])
+
+    def friends(self, request, **kwargs):
+        self.method_check(request, allowed=["get"])
+        user_id = self.signed_in_user_id(request)
+        return self.paginated_users(
+            request, list(friend_graph.friend_ids(user_id))
+        )
+
+    def mutual_friends(self, request, **kwargs):
+        self.method_check(request, allowed=["get"])
+        user_id = self.signed_in_user_id(request)
+        other_id = int(kwargs["pk"])
+        return self.paginated_users(
+            request, friend_graph.mutual_friend_ids(user_id, other_id)
+        )
+
+    def suggestions(self, request, **kwargs):
+        self.method_check(request, allowed=["get"])
+        user_id = self.signed_in_user_id(request)
+        limit = Paginator(
+            request.GET,
+            [],
+            limit=self._meta.limit,
+            max_limit=self._meta.max_limit,
+        ).get_limit()
+        ranked = friend_graph.suggestions(user_id, limit=limit)
+        return self.users_response(
+            request,
+            [other_id for other_id, _ in ranked],
+            {"limit": limit},
+            {
+                other_id: {"mutual_friends": count}
+                for other_id, count in ranked
+            },
+            ("mutual_friends",),
+        )
+
+    def transition(self, request, action):
         self.method_check(request, allowed=["post"])
-        user_one_id = request.user.id
-        if user_one_id is None:
-            raise CustomBadRequest(
-                error_type="UNAUTHORIZED", error_message="Please signin first"
-            )
+        user_one_id = self.signed_in_user_id(request)
         user_two_id = request.resolver_match.kwargs["pk"]
-        reverse_rela = Relationship.objects.filter(
-            user_one_id=user_two_id
-        ).filter(user_two_id=user_one_id)
-        if (
-            reverse_rela.filter(status=0).exists()
-            or reverse_rela.filter(status=3).exists()
-        ):
-            new_rela = reverse_rela.get(user_one_id=user_two_id)
-            new_rela.status = 1
-            new_rela.is_friends = True
-            new_rela.save()
-        elif reverse_rela.filter(status=1).exists():
-            raise CustomBadRequest(
-                error_message="You and this user is friends"
-            )
-        else:
+        try:
+            relationships.apply(action, user_one_id, user_two_id)
+        except relationships.InvalidTransition as e:
             raise CustomBadRequest(
-                error_message="You can not accept this request"
+                error_type=e.error_type, error_message=e.error_message
             )
         return self.create_response(request, {"success": True})
 
+    def send_request(self, request, **kwargs):
+        return self.transition(request, relationships.SEND)
+
+    def accept_request(self, request, **kwargs):
+        return self.transition(request, relationships.ACCEPT)
+
     def unfriends_request(self, request, **kwargs):
-        self.method_check(request, allowed=["post"])
-        user_one_id = request.user.id
-        if user_one_id is None:
-            raise CustomBadRequest(
-                error_type="UNAUTHORIZED", error_message="Please signin first"
-            )
-        user_two_id = request.resolver_match.kwargs["pk"]
-        reverse_rela = Relationship.objects.filter(
-            user_one_id=user_two_id
-        ).filter(user_two_id=user_one_id)
-        if (
-            reverse_rela.filter(status=0).exists()
-            or reverse_rela.filter(status=1).exists()
-        ):
-            new_rela = reverse_rela.get(user_one_id=user_two_id)
-            new_rela.status = 2
-            new_rela.is_friends = False
-            new_rela.save()
-        else:
-            raise CustomBadRequest(
-                error_message="You can not accept this request"
-            )
-        return self.create_response(request, {"success": True})
+        return self.transition(request, relationships.UNFRIEND)
 
     def block_request(self, request, **kwargs):
+        return self.transition(request, relationships.BLOCK)
+
+    def bulk_request(self, request, **kwargs):
         self.method_check(request, allowed=["post"])
-        user_one_id = request.user.id
-        if user_one_id is None:
+        user_one_id = self.signed_in_user_id(request)
+        data = self.deserialize(
+            request,
+            request.body,
+            format=request.META.get("CONTENT_TYPE", "application/json"),
+        )
+        ids = data.get("ids")
+        if not isinstance(ids, list) or not ids:
             raise CustomBadRequest(
-                error_type="UNAUTHORIZED", error_message="Please signin first"
+                error_type="MISSING_FIELD", field="ids", obj="request"
             )
-        user_two_id = request.resolver_match.kwargs["pk"]
-        rela = Relationship.objects.filter(user_one_id=user_one_id).filter(
-            user_two_id=user_two_id
-        )
-        if rela.filter(status=3).exists():
+        if len(ids) > settings.RELATIONSHIP_BULK_LIMIT:
             raise CustomBadRequest(
                 error_type="INVALID_DATA",
-                error_message="You were block this user",
+                error_message="Send at most %d ids at once"
+                % settings.RELATIONSHIP_BULK_LIMIT,
             )
-        else:
-            new_rela = rela.get(user_one_id=user_one_id)
-            new_rela.status = 3
-            new_rela.is_friends = False
-            new_rela.save()
+        for other_id in ids:
+            if isinstance(other_id, bool) or not (
+                isinstance(other_id, int)
+                or isinstance(other_id, str) and other_id.isdigit()
+            ):
+                raise CustomBadRequest(
+                    error_type="INVALID_DATA",
+                    error_message="User %s invalid" % (other_id,),
+                )
+        action = self.BULK_ACTIONS[request.resolver_match.kwargs["action"]]
+        try:
+            outcomes = relationships.apply_many(action, user_one_id, ids)
+        except relationships.InvalidTransition as e:
+            raise CustomBadRequest(
+                error_type=e.error_type, error_message=e.error_message
+            )
+        statuses = dict(Relationship.STATUS_IN_RELATIONSHIP)
+        results = {}
+        for other_id, outcome in outcomes.items():
+            if isinstance(outcome, relationships.InvalidTransition):
+                results[str(other_id)] = {
+                    "success": False,
+                    "error_message": outcome.error_message,
+                }
+            else:
+                results[str(other_id)] = {
+                    "success": True,
+                    "status": statuses[outcome],
+                }
+        return self.create_response(
+            request, {"success": True, "results": results}
+        )
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class AccountConfig(AppConfig):
-    name = 'account'
+    name = 'source.account'
+
+    def ready(self):
+        # Registers the deployment checks.
+        from ..commons import checks  # noqa: F401
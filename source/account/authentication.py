@@ -0,0 +1,163 @@
+"""
+API key authentication that keeps the key check off the database.
+
+Successful ``(username, api_key)`` checks are remembered in a per-worker
+``LRUCache`` and, when ``API_KEY_CACHE_ALIAS`` names one of ``CACHES``, in
+that shared cache too, so the other workers skip the database as well.
+Entries only hold a digest of the key, the non-secret ``User`` columns and
+the version of the user's credentials they were made with.
+
+Saving or deleting a ``User`` or its ``ApiKey`` bumps that version in the
+shared cache, and every hit, local ones included, is checked against it:
+a regenerated key, a deactivated user or an old username stop working in
+every worker at once. Without a shared cache the other workers keep their
+entries for up to ``API_KEY_CACHE_TTL`` seconds.
+"""
+from __future__ import absolute_import
+import hashlib
+import hmac
+import uuid
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from tastypie.authentication import ApiKeyAuthentication
+from ..commons.lru import LRUCache
+
+USER_FIELDS = (
+    "id",
+    "username",
+    "first_name",
+    "last_name",
+    "email",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+)
+
+local_cache = LRUCache(
+    maxsize=getattr(settings, "API_KEY_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "API_KEY_CACHE_TTL", 60),
+)
+
+
+def get_shared_cache():
+    alias = getattr(settings, "API_KEY_CACHE_ALIAS", None)
+    return caches[alias] if alias else None
+
+
+def shared_cache_key(username):
+    return "apikey-auth:%s" % hashlib.sha256(
+        username.encode("utf-8")
+    ).hexdigest()
+
+
+def version_key(user_id):
+    return "apikey-version:%s" % user_id
+
+
+def key_digest(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def credentials_version(shared, user_id):
+    """The version of the credentials of ``user_id``, made on first use."""
+    key = version_key(user_id)
+    version = shared.get(key)
+    if version is None:
+        shared.add(key, uuid.uuid4().hex, None)
+        version = shared.get(key)
+    return version
+
+
+def forget_api_key(sender, instance, update_fields=None, **kwargs):
+    """Signal handler dropping cached credentials of a User or ApiKey."""
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    user = instance if isinstance(instance, User) else instance.user
+    local_cache.delete(user.username)
+    local_cache.delete_where(lambda entry: entry["user"]["id"] == user.pk)
+    shared = get_shared_cache()
+    if shared is not None:
+        # Entries stored under any earlier username go stale with it.
+        shared.set(version_key(user.pk), uuid.uuid4().hex, None)
+        shared.delete(shared_cache_key(user.username))
+
+
+class CachedApiKeyAuthentication(ApiKeyAuthentication):
+    """
+    ``ApiKeyAuthentication`` backed by the credential caches. On a cache
+    hit ``request.user`` is rebuilt from the cached columns and has no
+    password, so it must be reloaded before being saved.
+    """
+
+    def get_cached_user(self, username, api_key):
+        shared = get_shared_cache()
+        entry = local_cache.get(username)
+        if entry is None and shared is not None:
+            entry = shared.get(shared_cache_key(username))
+            if entry is not None:
+                local_cache.set(username, entry)
+        if entry is None or not hmac.compare_digest(
+            entry["key"], key_digest(api_key)
+        ):
+            return None
+        if shared is not None and entry.get("version") != shared.get(
+            version_key(entry["user"]["id"])
+        ):
+            local_cache.delete(username)
+            return None
+        user = User(**entry["user"])
+        user._state.adding = False
+        return user
+
+    def remember(self, username, api_key, user):
+        shared = get_shared_cache()
+        entry = {
+            "key": key_digest(api_key),
+            "user": {name: getattr(user, name) for name in USER_FIELDS},
+            "version": None,
+        }
+        if shared is not None:
+            entry["version"] = credentials_version(shared, user.pk)
+        local_cache.set(username, entry)
+        if shared is not None:
+            shared.set(
+                shared_cache_key(username),
+                entry,
+                getattr(settings, "API_KEY_CACHE_SHARED_TTL", 300),
+            )
+
+    def is_authenticated(self, request, **kwargs):
+        try:
+            username, api_key = self.extract_credentials(request)
+        except ValueError:
+            return self._unauthorized()
+
+        if username and api_key:
+            user = self.get_cached_user(username, api_key)
+            if user is not None:
+                request.user = user
+                return True
+
+        authenticated = super(
+            CachedApiKeyAuthentication, self
+        ).is_authenticated(request, **kwargs)
+        if authenticated is True:
+            self.remember(username, api_key, request.user)
+        return authenticated
+
+
+api_key_authentication = CachedApiKeyAuthentication()
+
+
+def signed_in_user_id(request):
+    """
+    Id of the user signed in by the session or, when there is none, by the
+    api key the request carries. ``None`` when neither signs anyone in.
+    """
+    if request.user.id is None and (
+        request.GET.get("api_key") or request.META.get("HTTP_AUTHORIZATION")
+    ):
+        # Sets ``request.user`` when the key is valid.
+        api_key_authentication.is_authenticated(request)
+    return request.user.id
@@ -0,0 +1,165 @@
+"""
+Friend graph answered from cached adjacency lists.
+
+Each user's accepted friends are kept as a sorted ``array`` of ids in the
+cache named by ``FRIEND_GRAPH_CACHE_ALIAS``, loaded from ``Relationship``
+on first use. Relationship transitions that make or end a friendship drop
+the lists of both users (again on commit, so a read racing the transaction
+can't cache the old list), and the next read reloads them with one indexed
+query. Friends, mutual friends and two hop suggestions are then set
+operations on those lists instead of self joins over ``Relationship``.
+
+The users each user blocked or was blocked by are cached the same way, as
+a ``frozenset`` that read authorizations exclude from lists.
+"""
+from __future__ import absolute_import
+from array import array
+from collections import Counter
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from .models import Relationship
+
+# Users per ``IN (...)`` when loading missing lists, below sqlite's limit
+# of 999 parameters for the two lookups.
+LOAD_BATCH_SIZE = 400
+
+
+def get_cache():
+    return caches[getattr(settings, "FRIEND_GRAPH_CACHE_ALIAS", "default")]
+
+
+def cache_key(user_id):
+    return "friend-graph:%s" % user_id
+
+
+def block_cache_key(user_id):
+    return "block-set:%s" % user_id
+
+
+def load(user_ids):
+    """Reads the adjacency lists of ``user_ids`` from the database."""
+    friends = {user_id: [] for user_id in user_ids}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), LOAD_BATCH_SIZE):
+        batch = user_ids[start:start + LOAD_BATCH_SIZE]
+        rows = Relationship.objects.filter(
+            Q(user_one_id__in=batch) | Q(user_two_id__in=batch),
+            status=Relationship.ACCEPTED,
+        ).values_list("user_one_id", "user_two_id")
+        for user_one_id, user_two_id in rows:
+            if user_one_id in friends:
+                friends[user_one_id].append(user_two_id)
+            if user_two_id in friends:
+                friends[user_two_id].append(user_one_id)
+    return {
+        user_id: array("l", sorted(set(ids)))
+        for user_id, ids in friends.items()
+    }
+
+
+def get_many(user_ids):
+    """Sorted friend id arrays of ``user_ids``, loading the missing ones."""
+    cache = get_cache()
+    keys = {cache_key(user_id): user_id for user_id in user_ids}
+    found = {
+        keys[key]: friends for key, friends in cache.get_many(keys).items()
+    }
+    missing = [user_id for user_id in user_ids if user_id not in found]
+    if missing:
+        loaded = load(missing)
+        cache.set_many(
+            {
+                cache_key(user_id): friends
+                for user_id, friends in loaded.items()
+            },
+            getattr(settings, "FRIEND_GRAPH_CACHE_TTL", 86400),
+        )
+        found.update(loaded)
+    return found
+
+
+def friend_ids(user_id):
+    return get_many([user_id])[user_id]
+
+
+def mutual_friend_ids(user_id, other_id):
+    lists = get_many([user_id, other_id])
+    return sorted(set(lists[user_id]).intersection(lists[other_id]))
+
+
+def excluded_ids(user_id):
+    """Users with a pending or blocked relationship to ``user_id``."""
+    rows = Relationship.objects.filter(
+        Q(user_one_id=user_id) | Q(user_two_id=user_id)
+    ).exclude(status__in=(Relationship.ACCEPTED, Relationship.UNFRIEND))
+    excluded = set()
+    for user_one_id, user_two_id in rows.values_list(
+        "user_one_id", "user_two_id"
+    ):
+        excluded.add(user_one_id)
+        excluded.add(user_two_id)
+    return excluded
+
+
+def suggestions(user_id, limit=20):
+    """
+    Friends of friends of ``user_id`` who aren't friends yet, most mutual
+    friends first, as ``(user_id, mutual_count)`` pairs.
+
+    Only ``FRIEND_GRAPH_SUGGESTION_SAMPLE`` friends are walked, so users
+    with thousands of friends still answer in one cache round trip.
+    """
+    friends = friend_ids(user_id)
+    sample = list(friends[:getattr(
+        settings, "FRIEND_GRAPH_SUGGESTION_SAMPLE", 1000
+    )])
+    counts = Counter()
+    for ids in get_many(sample).values():
+        counts.update(ids)
+    skip = set(friends) | excluded_ids(user_id)
+    skip.add(user_id)
+    ranked = sorted(
+        (
+            (other_id, count)
+            for other_id, count in counts.items()
+            if other_id not in skip
+        ),
+        key=lambda item: (-item[1], item[0]),
+    )
+    return ranked[:limit]
+
+
+def blocked_ids(user_id):
+    """Users ``user_id`` blocked or was blocked by, as a frozenset."""
+    cache = get_cache()
+    key = block_cache_key(user_id)
+    blocked = cache.get(key)
+    if blocked is None:
+        rows = Relationship.objects.filter(
+            Q(user_one_id=user_id) | Q(user_two_id=user_id),
+            status=Relationship.BLOCKED,
+        ).values_list("user_one_id", "user_two_id")
+        blocked = frozenset(
+            user_two_id if user_one_id == user_id else user_one_id
+            for user_one_id, user_two_id in rows
+        )
+        cache.set(
+            key, blocked, getattr(settings, "FRIEND_GRAPH_CACHE_TTL", 86400)
+        )
+    return blocked
+
+
+def drop(keys):
+    get_cache().delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def forget(user_ids):
+    drop([cache_key(user_id) for user_id in user_ids])
+
+
+def forget_blocks(user_ids):
+    drop([block_cache_key(user_id) for user_id in user_ids])
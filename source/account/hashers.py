@@ -0,0 +1,24 @@
+"""
+Password hashing with a tunable cost.
+
+``PASSWORD_HASH_ITERATIONS`` sets the PBKDF2 iterations of new hashes.
+Hashes made with another count still verify, and Django re-hashes them
+with the current count when their user next signs in, so the cost can be
+raised or lowered without touching stored passwords.
+"""
+from __future__ import absolute_import
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # Same algorithm name as the stock hasher, which it replaces in
+    # ``PASSWORD_HASHERS``, so existing hashes are recognized.
+
+    @property
+    def iterations(self):
+        return getattr(
+            settings,
+            "PASSWORD_HASH_ITERATIONS",
+            PBKDF2PasswordHasher.iterations,
+        )
@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+from multiprocessing import Pool
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from tastypie.models import ApiKey
+from ...apis import PROFILE_FIELDS
+from ...models import NameToken, Profile
+from ...name_index import words
+
+USER_FIELDS = ("username", "email", "first_name", "last_name")
+
+
+def read_rows(path, file_format):
+    with io.open(path, encoding="utf-8", newline="") as handle:
+        if file_format == "csv":
+            for row in csv.DictReader(handle):
+                yield row
+            return
+        for number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                raise CommandError("Line %d is not valid json." % number)
+
+
+def hash_password(row):
+    """
+    Replaces the raw password of ``row`` by its hash. Runs in the worker
+    processes, rows keep a ``password_hash`` made elsewhere as it is.
+    """
+    row = dict(row)
+    password = row.pop("password", None)
+    if not row.get("password_hash"):
+        # No password gives an unusable one.
+        row["password_hash"] = make_password(password or None)
+    return row
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates users, with their API key and profile, from a CSV file "
+        "with a header row or a file of one json object per line."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Defaults to the extension of the file.",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processes hashing passwords.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users written per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"]
+        if file_format is None:
+            file_format = "csv" if path.endswith(".csv") else "jsonl"
+        rows = read_rows(path, file_format)
+        self.created = self.skipped = 0
+        if options["processes"] > 1:
+            # Workers are forked, none may inherit an open connection.
+            connections.close_all()
+            with Pool(options["processes"]) as pool:
+                self.write(
+                    pool.imap(hash_password, rows, chunksize=64),
+                    options["batch_size"],
+                )
+        else:
+            self.write(map(hash_password, rows), options["batch_size"])
+        self.stdout.write(
+            "Created %d users, skipped %d." % (self.created, self.skipped)
+        )
+
+    def write(self, rows, batch_size):
+        seen_usernames, seen_emails = set(), set()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            usernames = {row.get("username") for row in batch}
+            emails = {row.get("email") for row in batch if row.get("email")}
+            seen_usernames.update(
+                User.objects.filter(username__in=usernames).values_list(
+                    "username", flat=True
+                )
+            )
+            seen_emails.update(
+                User.objects.filter(email__in=emails).values_list(
+                    "email", flat=True
+                )
+            )
+            users = []
+            for row in batch:
+                username, email = row.get("username"), row.get("email")
+                if (
+                    not username
+                    or username in seen_usernames
+                    or (email and email in seen_emails)
+                ):
+                    self.skipped += 1
+                    self.stderr.write("Skipped %s" % (username or row))
+                    continue
+                seen_usernames.add(username)
+                if email:
+                    seen_emails.add(email)
+                users.append(row)
+            with transaction.atomic():
+                self.create(users)
+            self.created += len(users)
+
+    def create(self, rows):
+        User.objects.bulk_create(
+            User(
+                password=row["password_hash"],
+                **{name: row.get(name) or "" for name in USER_FIELDS}
+            )
+            for row in rows
+        )
+        ids = dict(
+            User.objects.filter(
+                username__in=[row["username"] for row in rows]
+            ).values_list("username", "pk")
+        )
+        ApiKey.objects.bulk_create(
+            ApiKey(user_id=ids[row["username"]], key=ApiKey().generate_key())
+            for row in rows
+        )
+        Profile.objects.bulk_create(
+            Profile(
+                user_id=ids[row["username"]],
+                birthday=row.get("birthday") or None,
+                **{
+                    name: row.get(name) or ""
+                    for name in PROFILE_FIELDS
+                    if name != "birthday"
+                }
+            )
+            for row in rows
+        )
+        NameToken.objects.bulk_create(
+            NameToken(user_id=ids[row["username"]], token=token)
+            for row in rows
+            for token in {
+                word
+                for name in ("username", "first_name", "last_name",
+                             "other_name")
+                if row.get(name)
+                for word in words(row[name])
+            }
+        )
@@ -0,0 +1,44 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes expired database sessions in batches, or every one of "
+        "them with --all after moving to another API_SESSION_MODE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of sessions deleted per transaction.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Delete live sessions too, signing their users out.",
+        )
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.all()
+        if not options["all"]:
+            sessions = sessions.filter(expire_date__lt=timezone.now())
+        # Short transactions instead of one DELETE locking the whole table
+        # for as long as it takes.
+        deleted = 0
+        while True:
+            keys = list(
+                sessions.values_list("session_key", flat=True)[
+                    : options["batch_size"]
+                ]
+            )
+            if not keys:
+                break
+            with transaction.atomic():
+                Session.objects.filter(session_key__in=keys).delete()
+            deleted += len(keys)
+        self.stdout.write("Deleted %d sessions." % deleted)
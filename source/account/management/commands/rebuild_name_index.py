@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ...name_index import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recomputes the name tokens used by the user autocomplete."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of tokens written per INSERT statement.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = rebuild(batch_size=options["batch_size"])
+        self.stdout.write("Indexed the names of %d users." % users)
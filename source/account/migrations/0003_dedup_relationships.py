@@ -0,0 +1,28 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def dedup_relationships(apps, schema_editor):
+    """Keep only the newest row of each (user_one, user_two) pair."""
+    Relationship = apps.get_model("account", "Relationship")
+    duplicates = (
+        Relationship.objects.values("user_one_id", "user_two_id")
+        .annotate(rows=Count("id"), keep_id=Max("id"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for pair in duplicates.iterator():
+        Relationship.objects.filter(
+            user_one_id=pair["user_one_id"], user_two_id=pair["user_two_id"]
+        ).exclude(id=pair["keep_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_auto_20181007_0048'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedup_relationships, migrations.RunPython.noop),
+    ]
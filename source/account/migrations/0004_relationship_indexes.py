@@ -0,0 +1,38 @@
+# Generated by Django 2.0.5 on 2026-10-18 16:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('account', '0003_dedup_relationships'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='relationship',
+            name='user_one',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_one', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='relationship',
+            name='user_two',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_two', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='relationship',
+            unique_together={('user_one', 'user_two')},
+        ),
+        migrations.AddIndex(
+            model_name='relationship',
+            index=models.Index(fields=['user_one', 'user_two', 'status'], name='rela_pair_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relationship',
+            index=models.Index(fields=['user_two', 'status'], name='rela_user_two_status_idx'),
+        ),
+    ]
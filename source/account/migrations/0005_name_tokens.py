@@ -0,0 +1,68 @@
+# Generated by Django 2.0.13 on 2026-10-18 16:47
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# A copy of the tokenizer of source.account.name_index as it was when this
+# migration was written, later changes to it must not change this one.
+def fold(text):
+    text = text.lower().replace("đ", "d")
+    return "".join(
+        char
+        for char in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(char)
+    )
+
+
+def words(text):
+    return [word[:64] for word in re.findall(r"\w+", fold(text))]
+
+
+def index_existing_users(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    NameToken = apps.get_model("account", "NameToken")
+    batch = []
+    for row in User.objects.values_list(
+        "pk", "username", "first_name", "last_name", "profile__other_name"
+    ).iterator():
+        batch.extend(
+            NameToken(user_id=row[0], token=token)
+            for token in {
+                word for name in row[1:] if name for word in words(name)
+            }
+        )
+        if len(batch) >= 1000:
+            NameToken.objects.bulk_create(batch)
+            batch = []
+    NameToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('account', '0004_relationship_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='nametoken',
+            unique_together={('token', 'user')},
+        ),
+        migrations.RunPython(
+            index_existing_users, migrations.RunPython.noop
+        ),
+    ]
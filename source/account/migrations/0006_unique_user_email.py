@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.db import migrations
+
+# Users without an email may share the empty one. Fails when two accounts
+# already share an address, those have to be merged by hand first.
+CREATE_INDEX = (
+    "CREATE UNIQUE INDEX auth_user_email_uniq ON auth_user (email) "
+    "WHERE email <> ''"
+)
+DROP_INDEX = "DROP INDEX auth_user_email_uniq"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('account', '0005_name_tokens'),
+    ]
+
+    operations = [
+        migrations.RunSQL([CREATE_INDEX], [DROP_INDEX]),
+    ]
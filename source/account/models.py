@@ -1,10 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models import signals
-from tastypie.models import create_api_key
+from tastypie.models import ApiKey, create_api_key
+from .authentication import forget_api_key
 
 # Create your models here.
 signals.post_save.connect(create_api_key, sender=User)
+for model in (User, ApiKey):
+    signals.post_save.connect(forget_api_key, sender=model)
+    signals.post_delete.connect(forget_api_key, sender=model)
 
 
 class Profile(models.Model):
@@ -21,25 +25,100 @@ class Profile(models.Model):
         return self.user.get_full_name()
 
 
+class RelationshipQuerySet(models.QuerySet):
+    def friend_ids(self, user_id):
+        """Ids of every user with an accepted relationship to ``user_id``."""
+        accepted = self.filter(status=Relationship.ACCEPTED)
+        return accepted.filter(user_one_id=user_id).values_list(
+            "user_two_id", flat=True
+        ).union(
+            accepted.filter(user_two_id=user_id).values_list(
+                "user_one_id", flat=True
+            )
+        )
+
+
 class Relationship(models.Model):
+    SENDING = 0
+    ACCEPTED = 1
+    UNFRIEND = 2
+    BLOCKED = 3
     STATUS_IN_RELATIONSHIP = (
-        (0, "sending"),
-        (1, "accepted"),
-        (2, "unfriend"),
-        (3, "blocked"),
+        (SENDING, "sending"),
+        (ACCEPTED, "accepted"),
+        (UNFRIEND, "unfriend"),
+        (BLOCKED, "blocked"),
     )
+    # Both user columns lead one of the composite indexes in ``Meta``, so
+    # the single column foreign key indexes would only slow writes down.
     user_one = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="user_one"
+        User, on_delete=models.CASCADE, related_name="user_one",
+        db_index=False,
     )
     user_two = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name="user_two"
+        User, on_delete=models.CASCADE, related_name="user_two",
+        db_index=False,
     )
     status = models.IntegerField(choices=STATUS_IN_RELATIONSHIP, default=0)
     is_friends = models.BooleanField(default=False)
 
+    objects = RelationshipQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ("user_one", "user_two")
+        indexes = [
+            # Covers the (user_one, user_two, status) state checks.
+            models.Index(
+                fields=["user_one", "user_two", "status"],
+                name="rela_pair_status_idx",
+            ),
+            models.Index(
+                fields=["user_two", "status"],
+                name="rela_user_two_status_idx",
+            ),
+        ]
+
     def __str__(self):
         return "%s and %s: %s" % (
             self.user_one.get_full_name(),
             self.user_two.get_full_name(),
             self.get_status_display(),
         )
+
+
+class NameToken(models.Model):
+    """
+    One folded word of a user's username, first, last or other name.
+
+    The unique (token, user) index answers prefix lookups as a range scan,
+    see ``name_index``.
+    """
+
+    token = models.CharField(max_length=64)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="name_tokens"
+    )
+
+    class Meta:
+        unique_together = ("token", "user")
+
+    def __str__(self):
+        return "%s: %s" % (self.user_id, self.token)
+
+
+NAME_FIELDS = {"username", "first_name", "last_name", "other_name"}
+
+
+def index_names(sender, instance, update_fields=None, **kwargs):
+    """Signal handler keeping the name tokens of a User or Profile."""
+    if update_fields and not NAME_FIELDS & set(update_fields):
+        return
+    # Imported here, name_index needs the models of this module.
+    from . import name_index
+
+    user_id = instance.pk if isinstance(instance, User) else instance.user_id
+    name_index.reindex(user_id)
+
+
+signals.post_save.connect(index_names, sender=User)
+signals.post_save.connect(index_names, sender=Profile)
@@ -0,0 +1,241 @@
+"""
+Prefix index over user names for typeahead.
+
+Every word of ``username``, ``first_name``, ``last_name`` and
+``Profile.other_name`` is lowercased, stripped of diacritics and stored as
+a ``NameToken``. A prefix then becomes the range ``prefix <= token <
+prefix + U+10FFFF`` over the unique (token, user) index, which every
+database answers with an index range scan, unlike ``icontains`` or a case
+insensitive ``LIKE``.
+
+Matches are ranked by friend proximity: friends first, then by the number
+of mutual friends, then exact username matches and shorter usernames.
+The tokens of each user's friends are cached as one sorted list, so the
+friends matching a prefix are found with a bisection instead of a query
+over thousands of ids. Friendship changes drop that list, renames of
+friends show up within ``NAME_INDEX_FRIENDS_TTL`` seconds.
+"""
+from __future__ import absolute_import
+import re
+import unicodedata
+from bisect import bisect_left
+from django.conf import settings
+from django.contrib.auth.models import User
+from . import friend_graph
+from .models import NameToken
+
+MAX_TOKEN_LENGTH = NameToken._meta.get_field("token").max_length
+# Highest code point, sorts after any token starting with the prefix.
+UPPER_BOUND = "\U0010ffff"
+# Words of a query used for matching, the rest are ignored.
+MAX_QUERY_WORDS = 3
+# Friends whose tokens are loaded per query, below sqlite's limit of 999
+# parameters.
+FRIEND_BATCH_SIZE = 900
+
+
+def fold(text):
+    text = text.lower().replace("đ", "d")
+    return "".join(
+        char
+        for char in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(char)
+    )
+
+
+def words(text):
+    return [word[:MAX_TOKEN_LENGTH] for word in re.findall(r"\w+", fold(text))]
+
+
+def tokens_of(user_id):
+    user = User.objects.filter(pk=user_id).values_list(
+        "username", "first_name", "last_name", "profile__other_name"
+    ).first()
+    if user is None:
+        return set()
+    return {word for name in user if name for word in words(name)}
+
+
+def reindex(user_id):
+    """Brings the tokens of ``user_id`` in line with their names."""
+    wanted = tokens_of(user_id)
+    existing = set(
+        NameToken.objects.filter(user_id=user_id).values_list(
+            "token", flat=True
+        )
+    )
+    if existing - wanted:
+        NameToken.objects.filter(
+            user_id=user_id, token__in=existing - wanted
+        ).delete()
+    if wanted - existing:
+        NameToken.objects.bulk_create(
+            NameToken(user_id=user_id, token=token)
+            for token in wanted - existing
+        )
+
+
+def prefix_range(word):
+    return {"token__gte": word, "token__lt": word + UPPER_BOUND}
+
+
+def matching_user_ids(query_words, limit):
+    """
+    Up to ``limit`` users having a token starting with every word of
+    ``query_words``.
+    """
+    matches = None
+    # The longest word is the most selective, start the scan with it.
+    for word in sorted(query_words, key=len, reverse=True):
+        tokens = NameToken.objects.filter(**prefix_range(word))
+        if matches is not None:
+            tokens = tokens.filter(user_id__in=matches)
+        ids = tokens.order_by("token").values_list("user_id", flat=True)
+        if matches is None:
+            ids = ids[:limit]
+        found = set(ids)
+        matches = found if matches is None else matches & found
+        if not matches:
+            break
+    return matches or set()
+
+
+def friend_names_key(user_id):
+    return "friend-names:%s" % user_id
+
+
+def friend_tokens(user_id, friend_ids):
+    """
+    Sorted ``(token, friend_id)`` pairs of every friend of ``user_id`` and
+    the friends' usernames by id.
+    """
+    cache = friend_graph.get_cache()
+    key = friend_names_key(user_id)
+    cached = cache.get(key)
+    if cached is None:
+        tokens, usernames = [], {}
+        for start in range(0, len(friend_ids), FRIEND_BATCH_SIZE):
+            rows = NameToken.objects.filter(
+                user_id__in=friend_ids[start:start + FRIEND_BATCH_SIZE]
+            ).values_list("token", "user_id", "user__username")
+            for token, friend_id, username in rows:
+                tokens.append((token, friend_id))
+                usernames[friend_id] = username
+        tokens.sort()
+        cached = (tokens, usernames)
+        cache.set(
+            key, cached, getattr(settings, "NAME_INDEX_FRIENDS_TTL", 300)
+        )
+    return cached
+
+
+def matching_friend_ids(query_words, tokens):
+    matches = None
+    for word in query_words:
+        found = set()
+        index = bisect_left(tokens, (word,))
+        while index < len(tokens) and tokens[index][0].startswith(word):
+            found.add(tokens[index][1])
+            index += 1
+        matches = found if matches is None else matches & found
+    return matches
+
+
+def forget(user_ids):
+    friend_graph.drop([friend_names_key(user_id) for user_id in user_ids])
+
+
+def autocomplete(user_id, query, limit=10):
+    """
+    Users matching ``query`` as ``(values, is_friend, mutual_friends)``,
+    closest to ``user_id`` first: matching friends, then up to
+    ``NAME_INDEX_CANDIDATES`` other matches by number of mutual friends.
+    ``mutual_friends`` is None for friends.
+    """
+    query_words = words(query)[:MAX_QUERY_WORDS]
+    if not query_words:
+        return []
+    exact = fold(query).strip()
+
+    def by_username(usernames):
+        return lambda other_id: (
+            fold(usernames[other_id]) != exact,
+            len(usernames[other_id]),
+            other_id,
+        )
+
+    friend_ids = list(friend_graph.friend_ids(user_id))
+    skip = friend_graph.blocked_ids(user_id) | {user_id}
+    tokens, friend_usernames = friend_tokens(user_id, friend_ids)
+    friends = sorted(
+        matching_friend_ids(query_words, tokens) - skip,
+        key=by_username(friend_usernames),
+    )[:limit]
+
+    strangers = set()
+    if len(friends) < limit:
+        strangers = matching_user_ids(
+            query_words,
+            limit=getattr(settings, "NAME_INDEX_CANDIDATES", 50),
+        )
+        strangers -= skip
+        strangers.difference_update(friend_ids)
+    users = {
+        row["id"]: row
+        for row in User.objects.filter(
+            id__in=strangers.union(friends)
+        ).values(
+            "id", "username", "first_name", "last_name", "profile__other_name"
+        )
+    }
+    if strangers:
+        # Only strangers are ranked by mutual friends, so only their
+        # friend lists are needed.
+        lists = friend_graph.get_many(list(strangers))
+        friend_set = set(friend_ids)
+        mutual = {
+            other_id: len(friend_set.intersection(lists[other_id]))
+            for other_id in strangers
+        }
+        usernames = {
+            other_id: users[other_id]["username"]
+            for other_id in strangers
+            if other_id in users
+        }
+        ranked = sorted(
+            usernames,
+            key=lambda other_id: (-mutual[other_id],)
+            + by_username(usernames)(other_id),
+        )
+        strangers = ranked[:limit - len(friends)]
+
+    return [
+        (users[other_id], True, None)
+        for other_id in friends
+        if other_id in users
+    ] + [
+        (users[other_id], False, mutual[other_id]) for other_id in strangers
+    ]
+
+
+def rebuild(batch_size=1000):
+    """Recomputes every token in bulk, returns the number of users."""
+    NameToken.objects.all().delete()
+    rows = User.objects.order_by("pk").values_list(
+        "pk", "username", "first_name", "last_name", "profile__other_name"
+    )
+    users = 0
+    batch = []
+    for row in rows.iterator():
+        users += 1
+        batch.extend(
+            NameToken(user_id=row[0], token=token)
+            for token in {
+                word for name in row[1:] if name for word in words(name)
+            }
+        )
+        if len(batch) >= batch_size:
+            NameToken.objects.bulk_create(batch)
+            batch = []
+    NameToken.objects.bulk_create(batch)
+    return users
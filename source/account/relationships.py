@@ -0,0 +1,299 @@
+"""
+Friendship state machine.
+
+Every action reads both directions of a pair with one query, decides the
+transition in ``plan`` and writes it with a single conditional ``UPDATE``
+or an ``INSERT``, all inside one transaction. The ``status`` guard on the
+``UPDATE`` and the unique (user_one, user_two) pair turn concurrent
+requests for the same pair into an ``InvalidTransition`` instead of a
+lost update or a duplicate row.
+"""
+from __future__ import absolute_import
+from collections import namedtuple
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from ..feed import fanout
+from .models import Relationship
+from . import friend_graph, name_index
+
+SEND = "send"
+ACCEPT = "accept"
+UNFRIEND = "unfriend"
+BLOCK = "block"
+
+# ``row`` is the relationship to update, or None to insert a new row from
+# the acting user to the other one. ``ends`` is a row the other way round
+# to turn into UNFRIEND at the same time, or None.
+Plan = namedtuple("Plan", ["row", "status", "ends"])
+Plan.__new__.__defaults__ = (None,)
+
+
+class InvalidTransition(Exception):
+    def __init__(self, error_message, error_type=None):
+        super(InvalidTransition, self).__init__(error_message)
+        self.error_message = error_message
+        self.error_type = error_type
+
+
+def plan(action, forward, reverse):
+    """
+    Decides how ``action`` changes a pair.
+
+    ``forward`` is the row from the acting user to the other user and
+    ``reverse`` the row the other way round, either may be None.
+    """
+    forward_status = forward.status if forward else None
+    reverse_status = reverse.status if reverse else None
+
+    if action == SEND:
+        if forward_status == Relationship.SENDING:
+            raise InvalidTransition(
+                "You were send request to this user", "DOES_NOT_EXITS"
+            )
+        if forward_status == Relationship.UNFRIEND:
+            return Plan(forward, Relationship.SENDING)
+        if reverse_status == Relationship.ACCEPTED:
+            raise InvalidTransition("You and this user are friends ")
+        if reverse_status == Relationship.BLOCKED:
+            raise InvalidTransition(
+                "You can't send request to this user", "UNAUTHORIZED"
+            )
+        if forward is not None:
+            raise InvalidTransition(
+                "You can't send request to this user", "INVALID_DATA"
+            )
+        return Plan(None, Relationship.SENDING)
+
+    if action == ACCEPT:
+        # A block is not a request, accepting it would undo it.
+        if reverse_status == Relationship.SENDING:
+            return Plan(reverse, Relationship.ACCEPTED)
+        if reverse_status == Relationship.ACCEPTED:
+            raise InvalidTransition("You and this user is friends")
+        raise InvalidTransition("You can not accept this request")
+
+    if action == UNFRIEND:
+        if reverse_status in (Relationship.SENDING, Relationship.ACCEPTED):
+            return Plan(reverse, Relationship.UNFRIEND)
+        if forward_status == Relationship.ACCEPTED:
+            return Plan(forward, Relationship.UNFRIEND)
+        raise InvalidTransition("You can not accept this request")
+
+    if action == BLOCK:
+        if forward_status == Relationship.BLOCKED:
+            raise InvalidTransition("You were block this user", "INVALID_DATA")
+        # The pair stops being friends, whichever side sent the request.
+        ends = None
+        if reverse_status in (Relationship.SENDING, Relationship.ACCEPTED):
+            ends = reverse
+        return Plan(forward, Relationship.BLOCKED, ends)
+
+    raise ValueError("Unknown relationship action '%s'" % action)
+
+
+def split_pair(rows, user_id):
+    """Returns the (forward, reverse) rows of a pair seen from ``user_id``."""
+    forward = reverse = None
+    for row in rows:
+        if row.user_one_id == user_id:
+            forward = row
+        else:
+            reverse = row
+    return forward, reverse
+
+
+def end(row):
+    """Turns ``row`` into UNFRIEND unless it changed since it was read."""
+    updated = Relationship.objects.filter(
+        pk=row.pk, status=row.status
+    ).update(status=Relationship.UNFRIEND, is_friends=False)
+    if not updated:
+        raise InvalidTransition(
+            "This relationship has just changed, please try again"
+        )
+
+
+def write(plan_, user_id, other_id):
+    """
+    Applies a ``Plan`` with one conditional UPDATE or one INSERT, plus an
+    UPDATE of the row it ends.
+    """
+    if plan_.ends is not None:
+        end(plan_.ends)
+    is_friends = plan_.status == Relationship.ACCEPTED
+    if plan_.row is None:
+        Relationship.objects.create(
+            user_one_id=user_id,
+            user_two_id=other_id,
+            status=plan_.status,
+            is_friends=is_friends,
+        )
+        return
+    updated = Relationship.objects.filter(
+        pk=plan_.row.pk, status=plan_.row.status
+    ).update(status=plan_.status, is_friends=is_friends)
+    if not updated:
+        raise InvalidTransition(
+            "This relationship has just changed, please try again"
+        )
+
+
+def after_transition(user_id, other_ids, status):
+    """Side effects of transitions to ``status``, in their transaction."""
+    if status in (Relationship.UNFRIEND, Relationship.BLOCKED):
+        fanout.prune(user_id, other_ids)
+    elif status == Relationship.ACCEPTED:
+        fanout.backfill(user_id, other_ids)
+    if status in (
+        Relationship.ACCEPTED,
+        Relationship.UNFRIEND,
+        Relationship.BLOCKED,
+    ):
+        friend_graph.forget([user_id] + list(other_ids))
+        name_index.forget([user_id] + list(other_ids))
+    # Any transition may start or lift a block.
+    friend_graph.forget_blocks([user_id] + list(other_ids))
+
+
+def clean_other_id(user_id, other_id):
+    try:
+        other_id = int(other_id)
+    except (TypeError, ValueError):
+        raise InvalidTransition("User %s invalid" % other_id, "INVALID_DATA")
+    if other_id == user_id:
+        raise InvalidTransition(
+            "You can't do this with yourself", "INVALID_OPERATOR"
+        )
+    return other_id
+
+
+def apply(action, user_id, other_id):
+    """Runs ``action`` from ``user_id`` on ``other_id``, returns new status."""
+    other_id = clean_other_id(user_id, other_id)
+
+    try:
+        with transaction.atomic():
+            rows = Relationship.objects.select_for_update().filter(
+                Q(user_one_id=user_id, user_two_id=other_id)
+                | Q(user_one_id=other_id, user_two_id=user_id)
+            )
+            plan_ = plan(action, *split_pair(rows, user_id))
+            write(plan_, user_id, other_id)
+            after_transition(user_id, [other_id], plan_.status)
+    except IntegrityError:
+        raise InvalidTransition(
+            "Can not find this user or the relationship has just changed"
+        )
+    return plan_.status
+
+
+def apply_many(action, user_id, other_ids):
+    """
+    Runs ``action`` from ``user_id`` on each of ``other_ids`` at once.
+
+    The current state of every pair is read with one ``IN`` query, new
+    rows are written with ``bulk_create`` and changed rows with one
+    ``UPDATE`` per (old status, new status) group. Returns a dict mapping
+    each requested id to its new status or to an ``InvalidTransition``.
+    """
+    results = {}
+    targets = []
+    for other_id in other_ids:
+        try:
+            cleaned = clean_other_id(user_id, other_id)
+        except InvalidTransition as e:
+            results[other_id] = e
+            continue
+        if cleaned not in targets:
+            targets.append(cleaned)
+        results[other_id] = cleaned
+
+    existing = set(
+        User.objects.filter(id__in=targets).values_list("id", flat=True)
+    )
+    pairs = {other_id: [] for other_id in targets if other_id in existing}
+    plans = {}
+    try:
+        with transaction.atomic():
+            rows = Relationship.objects.select_for_update().filter(
+                Q(user_one_id=user_id, user_two_id__in=list(pairs))
+                | Q(user_one_id__in=list(pairs), user_two_id=user_id)
+            )
+            for row in rows:
+                other_id = (
+                    row.user_two_id
+                    if row.user_one_id == user_id
+                    else row.user_one_id
+                )
+                pairs[other_id].append(row)
+            for other_id, pair in pairs.items():
+                try:
+                    plans[other_id] = plan(action, *split_pair(pair, user_id))
+                except InvalidTransition as e:
+                    plans[other_id] = e
+            write_many(
+                [
+                    (other_id, plan_)
+                    for other_id, plan_ in plans.items()
+                    if isinstance(plan_, Plan)
+                ],
+                user_id,
+            )
+    except IntegrityError:
+        raise InvalidTransition(
+            "These relationships have just changed, please try again"
+        )
+
+    for other_id, cleaned in results.items():
+        if isinstance(cleaned, InvalidTransition):
+            continue
+        outcome = plans.get(cleaned)
+        if outcome is None:
+            results[other_id] = InvalidTransition(
+                "Can not find this user", "DOES_NOT_EXITS"
+            )
+        elif isinstance(outcome, Plan):
+            results[other_id] = outcome.status
+        else:
+            results[other_id] = outcome
+    return results
+
+
+def write_many(plans, user_id):
+    """Writes many ``(other_id, Plan)`` pairs in a few statements."""
+    inserts = []
+    updates = {}
+    for other_id, plan_ in plans:
+        if plan_.ends is not None:
+            updates.setdefault(
+                (plan_.ends.status, Relationship.UNFRIEND), []
+            ).append(plan_.ends.pk)
+        if plan_.row is None:
+            inserts.append(
+                Relationship(
+                    user_one_id=user_id,
+                    user_two_id=other_id,
+                    status=plan_.status,
+                    is_friends=plan_.status == Relationship.ACCEPTED,
+                )
+            )
+        else:
+            updates.setdefault(
+                (plan_.row.status, plan_.status), []
+            ).append(plan_.row.pk)
+    if inserts:
+        Relationship.objects.bulk_create(inserts, batch_size=500)
+    for (old_status, status), pks in updates.items():
+        updated = Relationship.objects.filter(
+            pk__in=pks, status=old_status
+        ).update(status=status, is_friends=status == Relationship.ACCEPTED)
+        if updated != len(pks):
+            raise InvalidTransition(
+                "These relationships have just changed, please try again"
+            )
+    by_status = {}
+    for other_id, plan_ in plans:
+        by_status.setdefault(plan_.status, []).append(other_id)
+    for status, other_ids in by_status.items():
+        after_transition(user_id, other_ids, status)
@@ -0,0 +1,10 @@
+"""Helpers shared by the test modules of the apps."""
+from __future__ import absolute_import
+from django.contrib.auth.models import User
+from .models import Profile
+
+
+def create_user(username):
+    user = User.objects.create_user(username)
+    Profile.objects.create(user=user)
+    return user
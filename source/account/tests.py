@@ -1,3 +1,822 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from tastypie.models import ApiKey
+from .models import NameToken, Profile, Relationship
+from .testing import create_user
+from ..commons import checks
+from . import authentication, friend_graph, name_index, relationships
 
-# Create your tests here.
+
+class RelationshipTransitionTestCase(TransactionTestCase):
+    """
+    Runs outside a wrapping test transaction, so the query counts are
+    those of a real request: BEGIN, the pair SELECT and one write, plus
+    the feed prune for transitions that end a friendship.
+    """
+
+    def setUp(self):
+        self.me = create_user("me")
+        self.other = create_user("other")
+
+    def status(self, user_one, user_two):
+        return Relationship.objects.get(
+            user_one=user_one, user_two=user_two
+        ).status
+
+    def test_send_request(self):
+        with self.assertNumQueries(3):
+            relationships.apply(relationships.SEND, self.me.id, self.other.id)
+        self.assertEqual(
+            self.status(self.me, self.other), Relationship.SENDING
+        )
+        with self.assertNumQueries(2):
+            with self.assertRaises(relationships.InvalidTransition):
+                relationships.apply(
+                    relationships.SEND, self.me.id, self.other.id
+                )
+
+    def test_accept_request(self):
+        relationships.apply(relationships.SEND, self.other.id, self.me.id)
+        # Plus the high fanout authors and latest posts of the backfill.
+        with self.assertNumQueries(5):
+            relationships.apply(
+                relationships.ACCEPT, self.me.id, self.other.id
+            )
+        relationship = Relationship.objects.get()
+        self.assertEqual(relationship.status, Relationship.ACCEPTED)
+        self.assertTrue(relationship.is_friends)
+        with self.assertRaises(relationships.InvalidTransition):
+            relationships.apply(
+                relationships.SEND, self.me.id, self.other.id
+            )
+
+    def test_unfriend_from_either_side(self):
+        relationships.apply(relationships.SEND, self.other.id, self.me.id)
+        relationships.apply(relationships.ACCEPT, self.me.id, self.other.id)
+        with self.assertNumQueries(4):
+            relationships.apply(
+                relationships.UNFRIEND, self.other.id, self.me.id
+            )
+        self.assertEqual(
+            self.status(self.other, self.me), Relationship.UNFRIEND
+        )
+        with self.assertNumQueries(3):
+            relationships.apply(
+                relationships.SEND, self.other.id, self.me.id
+            )
+        self.assertEqual(
+            self.status(self.other, self.me), Relationship.SENDING
+        )
+
+    def test_block_without_relationship(self):
+        with self.assertNumQueries(4):
+            relationships.apply(
+                relationships.BLOCK, self.me.id, self.other.id
+            )
+        self.assertEqual(
+            self.status(self.me, self.other), Relationship.BLOCKED
+        )
+        with self.assertRaises(relationships.InvalidTransition):
+            relationships.apply(
+                relationships.SEND, self.other.id, self.me.id
+            )
+
+    def test_block_ends_friendship(self):
+        relationships.apply(relationships.SEND, self.other.id, self.me.id)
+        relationships.apply(relationships.ACCEPT, self.me.id, self.other.id)
+        relationships.apply(relationships.BLOCK, self.me.id, self.other.id)
+        self.assertEqual(
+            self.status(self.other, self.me), Relationship.UNFRIEND
+        )
+        self.assertFalse(
+            Relationship.objects.filter(is_friends=True).exists()
+        )
+        with self.assertRaises(relationships.InvalidTransition):
+            relationships.apply(
+                relationships.ACCEPT, self.other.id, self.me.id
+            )
+        self.assertEqual(
+            self.status(self.me, self.other), Relationship.BLOCKED
+        )
+
+    def test_invalid_targets(self):
+        with self.assertRaises(relationships.InvalidTransition):
+            relationships.apply(relationships.SEND, self.me.id, self.me.id)
+        with self.assertRaises(relationships.InvalidTransition):
+            relationships.apply(relationships.SEND, self.me.id, "abc")
+        with self.assertRaises(relationships.InvalidTransition):
+            relationships.apply(relationships.SEND, self.me.id, 999)
+        self.assertFalse(Relationship.objects.exists())
+
+
+class BulkRelationshipTestCase(TransactionTestCase):
+    def setUp(self):
+        self.me = create_user("me")
+        self.others = [create_user("other%d" % i) for i in range(50)]
+        self.ids = [user.id for user in self.others]
+
+    def test_send_many_in_constant_queries(self):
+        # The user lookup, BEGIN, the pair SELECT and one INSERT.
+        with self.assertNumQueries(4):
+            results = relationships.apply_many(
+                relationships.SEND, self.me.id, self.ids
+            )
+        self.assertEqual(set(results.values()), {Relationship.SENDING})
+        self.assertEqual(Relationship.objects.count(), 50)
+
+    def test_accept_many(self):
+        for other in self.others[:10]:
+            relationships.apply(relationships.SEND, other.id, self.me.id)
+        with self.assertNumQueries(6):
+            results = relationships.apply_many(
+                relationships.ACCEPT, self.me.id, self.ids[:20]
+            )
+        accepted = [
+            other_id
+            for other_id, outcome in results.items()
+            if outcome == Relationship.ACCEPTED
+        ]
+        self.assertEqual(sorted(accepted), self.ids[:10])
+        self.assertTrue(
+            all(
+                isinstance(outcome, relationships.InvalidTransition)
+                for other_id, outcome in results.items()
+                if other_id not in accepted
+            )
+        )
+
+    def test_block_many_mixed_states(self):
+        relationships.apply(relationships.SEND, self.me.id, self.ids[0])
+        relationships.apply(relationships.BLOCK, self.me.id, self.ids[1])
+        results = relationships.apply_many(
+            relationships.BLOCK,
+            self.me.id,
+            self.ids[:3] + [self.me.id, 999, "abc"],
+        )
+        self.assertEqual(results[self.ids[0]], Relationship.BLOCKED)
+        self.assertIsInstance(
+            results[self.ids[1]], relationships.InvalidTransition
+        )
+        self.assertEqual(results[self.ids[2]], Relationship.BLOCKED)
+        for invalid in (self.me.id, 999, "abc"):
+            self.assertIsInstance(
+                results[invalid], relationships.InvalidTransition
+            )
+
+
+class RelationshipResourceTestCase(TestCase):
+    def setUp(self):
+        self.me = create_user("me")
+        self.other = create_user("other")
+        self.client.force_login(self.me)
+
+    def test_send_request(self):
+        url = "/api/v1/relationship/%s/send_friends/" % self.other.id
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(Relationship.objects.count(), 1)
+
+    def test_block_request(self):
+        url = "/api/v1/relationship/%s/block_friends/" % self.other.id
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(Relationship.objects.get().status, 3)
+
+    def test_bulk_send_request(self):
+        response = self.client.post(
+            "/api/v1/relationship/bulk/send_friends/",
+            json.dumps({"ids": [self.other.id, 999]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content.decode("utf-8"))["results"]
+        self.assertEqual(
+            results[str(self.other.id)],
+            {"success": True, "status": "sending"},
+        )
+        self.assertFalse(results["999"]["success"])
+
+    @override_settings(API_THROTTLE_RATES={})
+    def test_bulk_rejects_malformed_ids(self):
+        for other_id in ([1], {"id": 1}, None, True, 1.5, "abc", "-1"):
+            response = self.client.post(
+                "/api/v1/relationship/bulk/send_friends/",
+                json.dumps({"ids": [self.other.id, other_id]}),
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Relationship.objects.exists())
+
+    @override_settings(RELATIONSHIP_BULK_LIMIT=1)
+    def test_bulk_limit(self):
+        response = self.client.post(
+            "/api/v1/relationship/bulk/send_friends/",
+            json.dumps({"ids": [self.other.id, 999]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(API_QUERY_BUDGET_ENFORCED=True)
+class AccountQueryBudgetTestCase(TestCase):
+    def test_lists_stay_within_budget(self):
+        users = [create_user("user%d" % i) for i in range(20)]
+        for user in users[1:]:
+            Relationship.objects.create(user_one=users[0], user_two=user)
+        auth = {"username": users[0].username, "api_key": users[0].api_key.key}
+        for url in ("/api/v1/auth/users/", "/api/v1/relationship/"):
+            response = self.client.get(url, auth)
+            self.assertEqual(response.status_code, 200, url)
+
+
+class UserFieldsetTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user("me")
+        self.auth = {"username": "me", "api_key": self.user.api_key.key}
+
+    def get(self, **params):
+        params.update(self.auth)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/auth/users/", params)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode())
+        return data["objects"][0], [query["sql"] for query in queries]
+
+    def test_fields_prune_the_query(self):
+        user, queries = self.get(fields="id,username")
+        self.assertEqual(user, {"id": self.user.id, "username": "me"})
+        listed = [sql for sql in queries if "FROM \"auth_user\"" in sql][-1]
+        self.assertNotIn("account_profile", listed)
+        self.assertNotIn("email", listed)
+
+    def test_nested_fields(self):
+        user, _ = self.get(fields="username,profile.photo_url")
+        self.assertEqual(
+            user, {"username": "me", "profile": {"photo_url": ""}}
+        )
+
+    def test_expand_nothing(self):
+        # Profiles have no URI to stand for them.
+        user, _ = self.get(expand="")
+        self.assertNotIn("profile", user)
+        self.assertIn("email", user)
+
+    def test_unknown_fields(self):
+        for params in (
+            {"fields": "bogus"},
+            {"fields": "username,profile.bogus"},
+            {"fields": "username.bogus"},
+            {"expand": "bogus"},
+        ):
+            params.update(self.auth)
+            response = self.client.get("/api/v1/auth/users/", params)
+            self.assertEqual(response.status_code, 400, params)
+        response = self.client.get(
+            "/api/v1/relationship/friends/", dict(self.auth, fields="bogus")
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class CachedApiKeyAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user("cached")
+        self.url = "/api/v1/relationship/"
+
+    def get(self, api_key):
+        return self.client.get(
+            self.url, {"username": "cached", "api_key": api_key}
+        )
+
+    def test_second_request_skips_the_key_lookup(self):
+        key = self.user.api_key.key
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.get(key).status_code, 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.get(key).status_code, 200)
+        self.assertEqual(len(second), len(first) - 1)
+
+    def test_wrong_key_is_not_served_from_cache(self):
+        self.get(self.user.api_key.key)
+        self.assertEqual(self.get("wrong").status_code, 401)
+
+    def test_regenerated_key_invalidates_cache(self):
+        old_key = self.user.api_key.key
+        self.get(old_key)
+        api_key = ApiKey.objects.get(user=self.user)
+        api_key.key = None
+        api_key.save()
+        self.assertEqual(self.get(old_key).status_code, 401)
+        self.assertEqual(self.get(api_key.key).status_code, 200)
+
+    def test_deactivated_user_invalidates_cache(self):
+        key = self.user.api_key.key
+        self.get(key)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(key).status_code, 401)
+
+    def test_other_workers_see_a_regenerated_key(self):
+        old_key = self.user.api_key.key
+        self.get(old_key)
+        entry = authentication.local_cache.get("cached")
+        api_key = ApiKey.objects.get(user=self.user)
+        api_key.key = None
+        api_key.save()
+        # Another worker still has the entry in its own LRU.
+        authentication.local_cache.set("cached", entry)
+        self.assertEqual(self.get(old_key).status_code, 401)
+
+    def test_old_username_stops_working(self):
+        key = self.user.api_key.key
+        self.get(key)
+        self.user.username = "renamed"
+        self.user.save()
+        authentication.local_cache.clear()
+        self.assertEqual(self.get(key).status_code, 401)
+        response = self.client.get(
+            self.url, {"username": "renamed", "api_key": key}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class SignInTestCase(TestCase):
+    def setUp(self):
+        # Short enough for the password validators to refuse it.
+        self.user = User.objects.create_user("signer", "signer@x.com", "pw")
+        self.url = "/api/v1/authentication/sign_in/"
+
+    def sign_in(self, username, password="pw"):
+        return self.client.post(
+            self.url,
+            json.dumps({"username": username, "password": password}),
+            content_type="application/json",
+        )
+
+    def test_one_query_loads_user_and_api_key(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.sign_in("signer")
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(data["api_key"], self.user.api_key.key)
+        selects = [
+            query["sql"] for query in queries
+            if query["sql"].startswith("SELECT")
+            and "django_session" not in query["sql"]
+        ]
+        self.assertEqual(len(selects), 1)
+        self.assertIn("tastypie_apikey", selects[0])
+
+    def test_sign_in_by_email(self):
+        response = self.sign_in("signer@x.com")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session["_auth_user_id"],
+                         str(self.user.pk))
+
+    def test_wrong_password_and_unknown_user(self):
+        self.assertEqual(self.sign_in("signer", "wrong").status_code, 401)
+        self.assertEqual(self.sign_in("nobody").status_code, 401)
+
+    def test_disabled_user(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.sign_in("signer").status_code, 403)
+
+    def test_hash_is_upgraded_to_current_iterations(self):
+        with self.settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(self.sign_in("signer").status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$2000$"))
+        self.assertEqual(self.sign_in("signer").status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$1000$"))
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class SessionModeTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("signer", "signer@x.com", "pw")
+        self.other = create_user("other")
+        self.send_url = "/api/v1/relationship/%s/send_friends/" % (
+            self.other.id
+        )
+
+    def sign_in(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/api/v1/authentication/sign_in/",
+                json.dumps({"username": "signer", "password": "pw"}),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            [q for q in queries if "django_session" in q["sql"]]
+        )
+        return response
+
+    @override_settings(API_SESSION_MODE="none")
+    def test_no_session_clients_use_the_api_key(self):
+        response = self.sign_in()
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        api_key = json.loads(response.content.decode("utf-8"))["api_key"]
+        self.assertEqual(self.client.post(self.send_url).status_code, 400)
+        response = self.client.post(
+            self.send_url + "?username=signer&api_key=%s" % api_key
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(
+        SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies"
+    )
+    def test_signed_cookie_sessions(self):
+        self.sign_in()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(self.send_url).status_code, 200)
+        self.assertFalse(
+            [q for q in queries if "django_session" in q["sql"]]
+        )
+        self.assertFalse(Session.objects.exists())
+
+    def test_modes_are_checked(self):
+        self.assertEqual(checks.check_session_mode(None), [])
+        with self.settings(API_SESSION_MODE="redis"):
+            errors = checks.check_session_mode(None)
+        self.assertEqual([error.id for error in errors], ["commons.E002"])
+        with self.settings(API_SESSION_MODE="cache"):
+            errors = checks.check_session_mode(None)
+        self.assertEqual([error.id for error in errors], ["commons.E003"])
+        shared = {
+            "BACKEND": "django.core.cache.backends.memcached.MemcachedCache"
+        }
+        with self.settings(
+            API_SESSION_MODE="cache",
+            CACHES={"default": shared},
+            SESSION_CACHE_ALIAS="default",
+        ):
+            self.assertEqual(checks.check_session_mode(None), [])
+
+
+class PurgeSessionsTestCase(TestCase):
+    def test_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        for n in range(5):
+            Session.objects.create(
+                session_key="expired%d" % n,
+                session_data="",
+                expire_date=now - timedelta(days=1),
+            )
+        Session.objects.create(
+            session_key="live", session_data="",
+            expire_date=now + timedelta(days=1),
+        )
+        out = StringIO()
+        call_command("purge_sessions", "--batch-size", "2", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Deleted 5 sessions.")
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)),
+            ["live"],
+        )
+        call_command("purge_sessions", "--all", stdout=out)
+        self.assertFalse(Session.objects.exists())
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class SignUpTestCase(TestCase):
+    def sign_up(self, username, email, **extra):
+        data = {"username": username, "email": email,
+                "password": "a long passphrase 42", "other_name": "Nick"}
+        data.update(extra)
+        return self.client.post(
+            "/api/v1/authentication/sign_up/",
+            json.dumps(data),
+            content_type="application/json",
+        )
+
+    def test_creates_user_key_and_profile_hashing_once(self):
+        with mock.patch(
+            "django.contrib.auth.hashers.PBKDF2PasswordHasher.encode",
+            autospec=True,
+            side_effect=PBKDF2PasswordHasher.encode,
+        ) as encode:
+            response = self.sign_up("newbie", "newbie@x.com")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(encode.call_count, 1)
+        user = User.objects.get(username="newbie")
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(data["api_key"], user.api_key.key)
+        self.assertEqual(user.profile.other_name, "Nick")
+        self.assertEqual(self.client.session["_auth_user_id"], str(user.pk))
+
+    def test_duplicates_are_rejected_without_partial_rows(self):
+        self.sign_up("first", "same@x.com")
+        for username, email in (("first", "other@x.com"),
+                                ("second", "same@x.com")):
+            response = self.sign_up(username, email)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("already", response.content.decode("utf-8"))
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(Profile.objects.count(), 1)
+        self.assertEqual(ApiKey.objects.count(), 1)
+
+    def test_users_without_email_do_not_collide(self):
+        User.objects.create_user("a")
+        User.objects.create_user("b")
+        self.assertEqual(User.objects.filter(email="").count(), 2)
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class ProvisionUsersTestCase(TestCase):
+    def provision(self, content, suffix, *args):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, "w") as out:
+            out.write(content)
+        try:
+            stdout, stderr = StringIO(), StringIO()
+            call_command(
+                "provision_users", path, *args, stdout=stdout, stderr=stderr
+            )
+        finally:
+            os.remove(path)
+        return stdout.getvalue()
+
+    def test_csv_with_process_pool(self):
+        create_user("taken")
+        output = self.provision(
+            "username,email,password,first_name,other_name\n"
+            "an,an@x.com,secret-an,An,Nhi\n"
+            "taken,taken@x.com,secret,,\n"
+            "binh,an@x.com,secret,,\n"
+            "chi,,,Chi,\n",
+            ".csv",
+            "--processes", "2", "--batch-size", "2",
+        )
+        self.assertEqual(output.strip(), "Created 2 users, skipped 2.")
+        an = User.objects.get(username="an")
+        self.assertTrue(an.check_password("secret-an"))
+        self.assertEqual(an.profile.other_name, "Nhi")
+        self.assertTrue(ApiKey.objects.filter(user=an).exists())
+        chi = User.objects.get(username="chi")
+        self.assertFalse(chi.has_usable_password())
+        self.assertEqual(
+            set(NameToken.objects.filter(user=an).values_list(
+                "token", flat=True)),
+            {"an", "nhi"},
+        )
+
+    def test_jsonl_keeps_existing_hashes(self):
+        self.provision(
+            json.dumps({"username": "hashed", "password_hash": "md5$x$y"})
+            + "\n",
+            ".jsonl",
+            "--processes", "1",
+        )
+        self.assertEqual(
+            User.objects.get(username="hashed").password, "md5$x$y"
+        )
+
+
+class UserProfileUpdateTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user("me")
+        Profile.objects.filter(user=self.user).update(
+            other_name="old", address="Hue"
+        )
+        self.url = "/api/v1/auth/users/%s/?username=me&api_key=%s" % (
+            self.user.id,
+            self.user.api_key.key,
+        )
+
+    def send(self, method, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(
+                self.url, json.dumps(data), content_type="application/json"
+            )
+        self.assertIn(response.status_code, (202, 204))
+        # Name token upkeep is left out, it is covered by NameIndexTestCase.
+        return [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(("UPDATE", "INSERT"))
+            and "account_nametoken" not in query["sql"]
+        ]
+
+    def test_patch_profile_field_is_one_targeted_update(self):
+        writes = self.send("patch", {"profile": {"address": "Da Nang"}})
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"address"', writes[0])
+        self.assertNotIn('"other_name"', writes[0])
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.other_name, profile.address),
+                         ("old", "Da Nang"))
+
+    def test_patch_user_field_leaves_profile_alone(self):
+        writes = self.send("patch", {"first_name": "New"})
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"auth_user"', writes[0])
+        self.assertNotIn('"password"', writes[0])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "New")
+
+    def test_unchanged_payload_writes_nothing(self):
+        self.assertEqual(
+            self.send("patch", {"first_name": "", "other_name": "old"}), []
+        )
+
+    def test_put_with_flat_profile_fields(self):
+        self.send(
+            "put",
+            {
+                "username": "me",
+                "email": "me@example.com",
+                "birthday": "1997-06-21",
+            },
+        )
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(str(profile.birthday), "1997-06-21")
+        self.assertEqual(profile.other_name, "old")
+
+    def test_invalid_profile_value(self):
+        response = self.client.patch(
+            self.url,
+            json.dumps({"birthday": "yesterday"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class FriendGraphTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.a, self.b, self.c, self.d, self.e = [
+            create_user(name) for name in "abcde"
+        ]
+        for user_one, user_two in (
+            (self.a, self.b),
+            (self.c, self.a),
+            (self.b, self.d),
+            (self.c, self.d),
+            (self.c, self.e),
+        ):
+            Relationship.objects.create(
+                user_one=user_one,
+                user_two=user_two,
+                status=Relationship.ACCEPTED,
+            )
+        Relationship.objects.create(
+            user_one=self.a, user_two=self.e, status=Relationship.SENDING
+        )
+
+    def test_friend_ids_are_cached(self):
+        self.assertEqual(
+            list(friend_graph.friend_ids(self.a.id)), [self.b.id, self.c.id]
+        )
+        with self.assertNumQueries(0):
+            friend_graph.friend_ids(self.a.id)
+
+    def test_mutual_friends(self):
+        self.assertEqual(
+            friend_graph.mutual_friend_ids(self.a.id, self.d.id),
+            [self.b.id, self.c.id],
+        )
+
+    def test_suggestions_skip_friends_and_pending(self):
+        self.assertEqual(
+            friend_graph.suggestions(self.a.id), [(self.d.id, 2)]
+        )
+
+    def test_transitions_refresh_the_lists(self):
+        friend_graph.friend_ids(self.a.id)
+        friend_graph.friend_ids(self.b.id)
+        relationships.apply(relationships.UNFRIEND, self.a.id, self.b.id)
+        self.assertEqual(list(friend_graph.friend_ids(self.a.id)), [self.c.id])
+        self.assertEqual(list(friend_graph.friend_ids(self.b.id)), [self.d.id])
+        relationships.apply(relationships.ACCEPT, self.e.id, self.a.id)
+        self.assertEqual(
+            list(friend_graph.friend_ids(self.a.id)), [self.c.id, self.e.id]
+        )
+
+    def test_endpoints(self):
+        self.client.force_login(self.a)
+        data = json.loads(
+            self.client.get("/api/v1/relationship/friends/").content.decode()
+        )
+        self.assertEqual(data["meta"]["total_count"], 2)
+        self.assertEqual(
+            [obj["username"] for obj in data["objects"]], ["b", "c"]
+        )
+        data = json.loads(
+            self.client.get(
+                "/api/v1/relationship/%s/mutual_friends/" % self.d.id
+            ).content.decode()
+        )
+        self.assertEqual([obj["id"] for obj in data["objects"]],
+                         [self.b.id, self.c.id])
+        data = json.loads(
+            self.client.get("/api/v1/relationship/suggestions/")
+            .content.decode()
+        )
+        self.assertEqual(data["objects"][0]["username"], "d")
+        self.assertEqual(data["objects"][0]["mutual_friends"], 2)
+
+    def test_endpoints_return_selected_fields(self):
+        self.client.force_login(self.a)
+        data = json.loads(
+            self.client.get(
+                "/api/v1/relationship/suggestions/",
+                {"fields": "id,mutual_friends"},
+            ).content.decode()
+        )
+        self.assertEqual(
+            data["objects"], [{"id": self.d.id, "mutual_friends": 2}]
+        )
+
+
+class NameIndexTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = create_user("me")
+        self.friend = create_user("thao.friend")
+        self.stranger = create_user("thao")
+        self.mutual = create_user("thao.mutual")
+        for user_one, user_two in (
+            (self.me, self.friend),
+            (self.friend, self.mutual),
+        ):
+            Relationship.objects.create(
+                user_one=user_one,
+                user_two=user_two,
+                status=Relationship.ACCEPTED,
+            )
+
+    def usernames(self, query):
+        return [
+            values["username"]
+            for values, _, _ in name_index.autocomplete(self.me.id, query)
+        ]
+
+    def test_tokens_follow_user_and_profile(self):
+        self.stranger.first_name = "Huỳnh Quang"
+        self.stranger.save()
+        profile = Profile.objects.get(user=self.stranger)
+        profile.other_name = "Best Android"
+        profile.save(update_fields=["other_name"])
+        self.assertEqual(
+            set(
+                NameToken.objects.filter(user=self.stranger).values_list(
+                    "token", flat=True
+                )
+            ),
+            {"thao", "huynh", "quang", "best", "android"},
+        )
+        self.stranger.first_name = ""
+        self.stranger.save()
+        self.assertFalse(
+            NameToken.objects.filter(user=self.stranger, token="huynh")
+        )
+
+    def test_last_login_saves_skip_the_index(self):
+        with self.assertNumQueries(1):
+            self.me.save(update_fields=["last_login"])
+
+    def test_ranked_by_friend_proximity(self):
+        self.assertEqual(
+            self.usernames("Thao"),
+            ["thao.friend", "thao.mutual", "thao"],
+        )
+        self.assertEqual(self.usernames("mut tha"), ["thao.mutual"])
+        self.assertEqual(self.usernames("me"), [])
+
+    def test_blocked_users_are_left_out(self):
+        Relationship.objects.create(
+            user_one=self.stranger,
+            user_two=self.me,
+            status=Relationship.BLOCKED,
+        )
+        self.assertNotIn("thao", self.usernames("thao"))
+
+    def test_endpoint(self):
+        response = self.client.get(
+            "/api/v1/auth/users/autocomplete/",
+            {"q": "tha", "username": "me", "api_key": self.me.api_key.key},
+        )
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(data["objects"][0]["username"], "thao.friend")
+        self.assertTrue(data["objects"][0]["is_friend"])
+        self.assertEqual(data["objects"][1]["mutual_friends"], 1)
+
+    def test_rebuild_command(self):
+        NameToken.objects.all().delete()
+        call_command("rebuild_name_index", stdout=StringIO())
+        self.assertEqual(self.usernames("thao.m"), ["thao.mutual"])
@@ -0,0 +1,93 @@
+"""
+System checks of the deployment settings.
+
+Caches meant to be shared by the workers should not be process local once
+more than one worker serves the api, or every worker keeps its own copy:
+invalidations miss the other workers and limits multiply by their number.
+That is the default without ``CACHE_LOCATION``, so it is only a warning.
+Sessions kept in a cache always need one shared cache named on purpose,
+and ``API_SESSION_MODE`` must be one of ``SESSION_MODES``.
+"""
+from __future__ import absolute_import
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+# Settings naming a cache every worker must share, with their defaults.
+SHARED_ALIASES = (
+    ("API_KEY_CACHE_ALIAS", None),
+    ("API_RESPONSE_CACHE_ALIAS", "default"),
+    # The name index caches friend names in the friend graph cache.
+    ("FRIEND_GRAPH_CACHE_ALIAS", "default"),
+    ("API_THROTTLE_CACHE_ALIAS", "default"),
+)
+SESSION_MODES = ("db", "cookie", "cache", "none")
+SESSION_CACHE_ENGINES = (
+    "django.contrib.sessions.backends.cache",
+    "django.contrib.sessions.backends.cached_db",
+)
+
+
+def is_local(alias):
+    return settings.CACHES.get(alias, {}).get("BACKEND") in LOCAL_BACKENDS
+
+
+def shared_aliases():
+    aliases = [
+        (name, getattr(settings, name, default))
+        for name, default in SHARED_ALIASES
+    ]
+    if settings.SESSION_ENGINE in SESSION_CACHE_ENGINES:
+        aliases.append(("SESSION_CACHE_ALIAS", settings.SESSION_CACHE_ALIAS))
+    return aliases
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    workers = getattr(settings, "WEB_WORKERS", 1)
+    if workers <= 1:
+        return []
+    warnings = []
+    for name, alias in shared_aliases():
+        if not alias:
+            continue
+        if is_local(alias):
+            warnings.append(
+                Warning(
+                    "%s names the %r cache, which is local to each of the "
+                    "%d workers." % (name, alias, workers),
+                    hint="Set CACHE_LOCATION to a shared cache.",
+                    id="commons.W001",
+                )
+            )
+    return warnings
+
+
+@register()
+def check_session_mode(app_configs, **kwargs):
+    mode = getattr(settings, "API_SESSION_MODE", "db")
+    if mode not in SESSION_MODES:
+        return [
+            Error(
+                "Unknown API_SESSION_MODE %r." % mode,
+                hint="Use one of %s." % ", ".join(SESSION_MODES),
+                id="commons.E002",
+            )
+        ]
+    if mode == "cache" and (
+        not settings.is_overridden("SESSION_CACHE_ALIAS")
+        or settings.SESSION_CACHE_ALIAS not in settings.CACHES
+        or is_local(settings.SESSION_CACHE_ALIAS)
+    ):
+        return [
+            Error(
+                "API_SESSION_MODE 'cache' needs SESSION_CACHE_ALIAS to name "
+                "a cache shared by the workers.",
+                hint="Set CACHE_LOCATION and SESSION_CACHE_ALIAS.",
+                id="commons.E003",
+            )
+        ]
+    return []
@@ -26,4 +26,8 @@ ERRORS_CODE = {
         "code": 408,
         "message": "Client performed a invalid operation",
     },
+    "TOO_MANY_REQUESTS": {
+        "code": 429,
+        "message": "Too many requests, retry after the Retry-After delay.",
+    },
 }
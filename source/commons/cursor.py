@@ -0,0 +1,23 @@
+from __future__ import absolute_import
+import base64
+import binascii
+from tastypie.exceptions import BadRequest
+
+
+def encode_cursor(*values):
+    """Packs ``values`` into an opaque, url-safe pagination cursor."""
+    raw = "\n".join(str(value) for value in values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, size=1):
+    """Unpacks a cursor made by ``encode_cursor`` into ``size`` strings."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = base64.urlsafe_b64decode(padded.encode("ascii"))
+        values = values.decode("utf-8").split("\n")
+    except (binascii.Error, UnicodeError, ValueError):
+        values = None
+    if not values or len(values) != size:
+        raise BadRequest("Invalid cursor '%s' provided." % cursor)
+    return values
@@ -1,8 +1,25 @@
 from __future__ import absolute_import
-import json
 from tastypie.exceptions import TastypieError
 from tastypie.http import HttpBadRequest
 from .constants import ERRORS_CODE
+from .serializers import default_serializer
+
+
+def render(code, message):
+    return default_serializer.dumps(
+        {"error": {"code": code, "message": message}}
+    )
+
+
+# Bodies of the errors raised without a field, object or custom message,
+# rendered once instead of on every raise.
+RENDERED_ERRORS = {
+    error_type: render(
+        error["code"], error["message"].format(field="", obj="Object")
+    )
+    for error_type, error in ERRORS_CODE.items()
+}
+RENDERED_ERRORS[None] = render(400, "Nothing")
 
 
 class CustomBadRequest(TastypieError):
@@ -19,14 +36,19 @@ class CustomBadRequest(TastypieError):
         else:
             code = 400
             message = "Nothing"
+            error_type = None
 
         if error_message is not None:
             message = error_message
 
         self._response = {"error": {"code": code, "message": message}}
+        self._content = None
+        if error_message is None and field == "" and obj == "Object":
+            self._content = RENDERED_ERRORS[error_type]
 
     @property
     def response(self):
-        return HttpBadRequest(
-            json.dumps(self._response), content_type="application/json"
-        )
+        content = self._content
+        if content is None:
+            content = render(**self._response["error"])
+        return HttpBadRequest(content, content_type="application/json")
@@ -0,0 +1,89 @@
+"""
+Sparse fieldsets, picked per request with ``?fields=`` and ``?expand=``.
+
+``fields`` lists the fields to return, with dotted names reaching into
+related resources: ``fields=id,title,author.username``. ``expand`` lists
+the related fields to embed in full, every other related field comes back
+as a URI: ``expand=author`` embeds the author but not the author's
+profile. Without ``expand`` related fields keep their declared ``full``,
+and asking for fields of a related resource always embeds it.
+
+Relations to resources that have no URIs, because they aren't registered
+with the api, are left out rather than rendered as empty URIs unless they
+are embedded. ``BaseModelResource`` answers names it has no field for with
+a 400. The selection of the resource being read sits
+at the bottom of a stack kept on the request, and each related field
+pushes its own part of the selection while its resource dehydrates.
+"""
+from __future__ import absolute_import
+
+
+def parse(value):
+    """
+    ``"id,author.username"`` as ``{"id": {}, "author": {"username": {}}}``.
+    """
+    if value is None:
+        return None
+    tree = {}
+    for path in value.split(","):
+        node = tree
+        for name in path.strip().split("."):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+class Selection(object):
+    __slots__ = ("fields", "expand")
+
+    def __init__(self, fields=None, expand=None):
+        # ``None`` means every field, or the declared fullness.
+        self.fields = fields
+        self.expand = expand
+
+    @property
+    def is_default(self):
+        return self.fields is None and self.expand is None
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name, default):
+        if self.fields and self.fields.get(name):
+            return True
+        if self.expand is None:
+            return default
+        return name in self.expand
+
+    def child(self, name):
+        fields = None
+        if self.fields is not None:
+            fields = self.fields.get(name) or None
+        expand = None
+        if self.expand is not None:
+            expand = self.expand.get(name, {})
+        return Selection(fields, expand)
+
+
+def current(request):
+    """The selection the resource dehydrating now should follow."""
+    if request is None:
+        return Selection()
+    stack = getattr(request, "_api_selections", None)
+    if stack is None:
+        stack = request._api_selections = [
+            Selection(
+                parse(request.GET.get("fields")),
+                parse(request.GET.get("expand")),
+            )
+        ]
+    return stack[-1]
+
+
+def push(request, selection):
+    current(request)
+    request._api_selections.append(selection)
+
+
+def pop(request):
+    request._api_selections.pop()
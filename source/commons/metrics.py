@@ -0,0 +1,239 @@
+"""
+Per route request metrics.
+
+``RequestMetricsMiddleware`` measures every request by the url name it
+resolved to, qualified by its Tastypie resource, such as
+``posts:api_like_post`` or ``comments:api_dispatch_list``: its wall time,
+the number and total time of its SQL queries and the time spent
+serializing the response. It sends them back in a ``Server-Timing``
+header, logs requests slower than ``API_METRICS_SLOW_REQUEST_MS`` with
+their SQL, and adds them to the histograms ``metrics_view`` serves in the
+Prometheus text format.
+
+Histograms are kept per process, a scraper going through a load balancer
+reads one worker at a time. Queries and serialization done while a
+streamed response is being sent are not counted.
+"""
+from __future__ import absolute_import
+import bisect
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Statements kept per request for the slow request log.
+MAX_LOGGED_QUERIES = 100
+
+_state = threading.local()
+
+
+class Histogram(object):
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # Route: [count per bucket, the last one for +Inf], sum.
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, route, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(route)
+            if series is None:
+                series = self.series[route] = [
+                    [0] * (len(self.buckets) + 1), 0
+                ]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s histogram" % self.name,
+        ]
+        with self.lock:
+            series = sorted(
+                (route, list(counts), total)
+                for route, (counts, total) in self.series.items()
+            )
+        for route, counts, total in series:
+            label = 'route="%s"' % route.replace("\\", "\\\\").replace(
+                '"', '\\"'
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    '%s_bucket{%s,le="%s"} %d'
+                    % (self.name, label, bound, cumulative)
+                )
+            lines.append("%s_sum{%s} %s" % (self.name, label, repr(total)))
+            lines.append("%s_count{%s} %d" % (self.name, label, cumulative))
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "api_request_duration_seconds",
+    "Wall time of requests.",
+    SECONDS_BUCKETS,
+)
+SQL_SECONDS = Histogram(
+    "api_request_sql_duration_seconds",
+    "Time spent in SQL queries per request.",
+    SECONDS_BUCKETS,
+)
+SERIALIZE_SECONDS = Histogram(
+    "api_request_serialize_duration_seconds",
+    "Time spent serializing the response per request.",
+    SECONDS_BUCKETS,
+)
+QUERIES = Histogram(
+    "api_request_queries",
+    "SQL queries per request.",
+    QUERY_BUCKETS,
+)
+HISTOGRAMS = (REQUEST_SECONDS, SQL_SECONDS, SERIALIZE_SECONDS, QUERIES)
+# Functions returning more lines of the exposition, see ``register``.
+COLLECTORS = []
+
+
+class RequestMetrics(object):
+    __slots__ = ("queries", "sql_seconds", "serialize_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.statements = []
+
+    def record_query(self, execute, sql, params, many, context):
+        """``execute_wrapper`` timing every query of the request."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.sql_seconds += duration
+            if len(self.statements) < MAX_LOGGED_QUERIES:
+                self.statements.append((sql, duration))
+
+
+@contextmanager
+def serializing():
+    """Counts the time spent in the block as serialization."""
+    metrics = getattr(_state, "metrics", None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serialize_seconds += time.perf_counter() - start
+
+
+def route_of(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    route = match.url_name or "unnamed"
+    # Every resource names its routes api_dispatch_list and the like.
+    resource_name = match.kwargs.get("resource_name")
+    if resource_name:
+        route = "%s:%s" % (resource_name, route)
+    return route
+
+
+def server_timing(metrics, elapsed):
+    return (
+        'db;dur=%.2f;desc="%d queries", serialize;dur=%.2f, total;dur=%.2f'
+        % (
+            metrics.sql_seconds * 1000,
+            metrics.queries,
+            metrics.serialize_seconds * 1000,
+            elapsed * 1000,
+        )
+    )
+
+
+def log_slow_request(request, route, metrics, elapsed):
+    logger.warning(
+        "Slow request %s %s (%s) took %.1fms, %d queries in %.1fms:\n%s",
+        request.method,
+        request.path,
+        route,
+        elapsed * 1000,
+        metrics.queries,
+        metrics.sql_seconds * 1000,
+        "\n".join(
+            "%.1fms %s" % (duration * 1000, sql)
+            for sql, duration in metrics.statements
+        ),
+    )
+
+
+class RequestMetricsMiddleware(object):
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        previous = getattr(_state, "metrics", None)
+        _state.metrics = metrics
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            _state.metrics = previous
+        elapsed = time.perf_counter() - start
+
+        route = route_of(request)
+        REQUEST_SECONDS.observe(route, elapsed)
+        SQL_SECONDS.observe(route, metrics.sql_seconds)
+        SERIALIZE_SECONDS.observe(route, metrics.serialize_seconds)
+        QUERIES.observe(route, metrics.queries)
+        if getattr(settings, "API_SERVER_TIMING", True):
+            response["Server-Timing"] = server_timing(metrics, elapsed)
+        slow_ms = getattr(settings, "API_METRICS_SLOW_REQUEST_MS", None)
+        if slow_ms is not None and elapsed * 1000 >= slow_ms:
+            log_slow_request(request, route, metrics, elapsed)
+        return response
+
+
+def register(collector):
+    """Adds the lines ``collector()`` returns to every ``render``."""
+    COLLECTORS.append(collector)
+    return collector
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for collector in COLLECTORS:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """The metrics, for clients in ``API_METRICS_ALLOWED_IPS`` only."""
+    allowed = getattr(settings, "API_METRICS_ALLOWED_IPS", ("127.0.0.1",))
+    if request.META.get("REMOTE_ADDR") not in allowed:
+        raise Http404
+    return HttpResponse(
+        render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
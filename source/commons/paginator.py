@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+from django.db.models import Q
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
+from .cursor import encode_cursor, decode_cursor
+
+
+class CursorPaginator(Paginator):
+    """
+    Keyset paginator, newest objects first.
+
+    Pages are read with ``WHERE (created_at, id) < (cursor)`` instead of an
+    ``OFFSET``, so the deepest page costs the same as the first one. The
+    position is handed to clients as an opaque ``cursor`` and the
+    ``COUNT(*)`` is only run when the client asks for it with ``count=1``.
+    """
+
+    ordering = ("created_at", "id")
+
+    def get_cursor_values(self):
+        cursor = self.request_data.get("cursor")
+        if not cursor:
+            return None
+        values = decode_cursor(cursor, size=len(self.ordering))
+        try:
+            return [
+                self.objects.model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise BadRequest("Invalid cursor '%s' provided." % cursor)
+
+    def get_keyset_filter(self, values):
+        """``(f1, f2, ...) < (v1, v2, ...)`` spelled out for the ORM."""
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            same = dict(zip(self.ordering[:i], values[:i]))
+            same["%s__lt" % name] = values[i]
+            condition |= Q(**same)
+        return condition
+
+    def get_next_cursor(self, obj):
+        return encode_cursor(*[getattr(obj, name) for name in self.ordering])
+
+    def wants_count(self):
+        return self.request_data.get("count") in ("1", "true", "True")
+
+    def page(self):
+        limit = self.get_limit()
+        objects = self.objects.order_by(
+            *["-%s" % name for name in self.ordering]
+        )
+        values = self.get_cursor_values()
+        if values is not None:
+            objects = objects.filter(self.get_keyset_filter(values))
+
+        if limit:
+            page = list(objects[: limit + 1])
+        else:
+            page = list(objects)
+        next_cursor = None
+        if limit and len(page) > limit:
+            page = page[:limit]
+            next_cursor = self.get_next_cursor(page[-1])
+
+        meta = {"limit": limit, "next": next_cursor}
+        if self.wants_count():
+            meta["total_count"] = self.get_count()
+        return {self.collection_name: page, "meta": meta}
+
+
+class IdCursorPaginator(CursorPaginator):
+    """``CursorPaginator`` for models without a creation timestamp."""
+
+    ordering = ("id",)
@@ -0,0 +1,132 @@
+"""
+Postgres backend with connection health checks and an optional pool.
+
+Two extra keys of the ``DATABASES`` entry turn them on:
+
+``HEALTH_CHECKS``
+    A persistent connection (``CONN_MAX_AGE``) is checked with a
+    ``SELECT 1`` the first time a request uses it and replaced when the
+    server dropped it, instead of failing that request.
+
+``POOL_SIZE``
+    Connections are borrowed from a pool of at most ``POOL_SIZE``
+    connections shared by the threads of the process, and handed back at
+    the end of each request rather than closed. Threads wait up to
+    ``POOL_TIMEOUT`` seconds for a free connection. Use it with
+    ``CONN_MAX_AGE = 0``, the pool keeps the connections open.
+"""
+from __future__ import absolute_import
+import threading
+from django.db.backends.postgresql import base
+from psycopg2 import OperationalError
+from psycopg2.pool import ThreadedConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool(object):
+    def __init__(self, size, timeout, conn_params):
+        self.pool = ThreadedConnectionPool(0, size, **conn_params)
+        self.slots = threading.BoundedSemaphore(size)
+        self.timeout = timeout
+
+    def get(self, check=False):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError(
+                "No free connection in the pool after %s seconds."
+                % self.timeout
+            )
+        try:
+            connection = self.pool.getconn()
+            if check and not is_alive(connection):
+                self.pool.putconn(connection, close=True)
+                connection = self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        return connection
+
+    def put(self, connection, close=False):
+        try:
+            self.pool.putconn(connection, close=close or connection.closed)
+        finally:
+            self.slots.release()
+
+
+def is_alive(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+
+def get_pool(alias, settings_dict, conn_params):
+    size = settings_dict.get("POOL_SIZE") or 0
+    if size <= 0:
+        return None
+    key = (alias, size)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                size, settings_dict.get("POOL_TIMEOUT", 10), conn_params
+            )
+        return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.health_check_done = False
+        self.pool = None
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, self.settings_dict, conn_params)
+        if self.pool is None:
+            return super(DatabaseWrapper, self).get_new_connection(
+                conn_params
+            )
+        connection = self.pool.get(
+            check=self.settings_dict.get("HEALTH_CHECKS", False)
+        )
+        # As the stock backend does after connecting.
+        options = self.settings_dict["OPTIONS"]
+        try:
+            self.isolation_level = options["isolation_level"]
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def connect(self):
+        super(DatabaseWrapper, self).connect()
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and not self.health_check_done
+            and self.settings_dict.get("HEALTH_CHECKS", False)
+        ):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super(DatabaseWrapper, self).ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        super(DatabaseWrapper, self).close_if_unusable_or_obsolete()
+        # Runs when a request starts and ends, check again on next use.
+        self.health_check_done = False
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super(DatabaseWrapper, self)._close()
+        with self.wrap_database_errors:
+            self.pool.put(
+                self.connection,
+                close=self.errors_occurred and not self.is_usable(),
+            )
@@ -0,0 +1,398 @@
+from __future__ import absolute_import
+import copy
+import functools
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.test.utils import CaptureQueriesContext
+from tastypie import fields, http
+from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.resources import ModelResource, Resource, convert_post_to_put
+from tastypie.serializers import Serializer
+from tastypie.utils.mime import build_content_type
+from . import fieldsets, metrics, routers, throttle
+from .custom_exception import CustomBadRequest
+from .response_cache import is_anonymous
+from .serializers import FastJSONSerializer, default_serializer
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def has_uri(resource_class):
+    """
+    Whether ``resource_class`` has URIs, which it doesn't unless it is
+    registered with an api.
+    """
+    return bool(resource_class().get_resource_uri())
+
+
+def includes(selection, name, field):
+    """
+    Whether ``selection`` keeps ``field``. A relation to a resource without
+    URIs is left out unless it is embedded.
+    """
+    if not selection.includes(name):
+        return False
+    return (
+        not getattr(field, "is_related", False)
+        or has_uri(field.to_class)
+        or selection.expands(name, field.full)
+    )
+
+
+def unknown_fields(resource_class, tree, prefix=""):
+    """Dotted names of ``tree`` that ``resource_class`` has no field for."""
+    unknown = []
+    for name, children in tree.items():
+        field = resource_class.base_fields.get(name)
+        if field is None:
+            unknown.append(prefix + name)
+        elif children and not getattr(field, "is_related", False):
+            unknown.extend(
+                "%s%s.%s" % (prefix, name, child) for child in children
+            )
+        elif children:
+            unknown.extend(
+                unknown_fields(field.to_class, children, prefix + name + ".")
+            )
+    return unknown
+
+
+def related_lookups(resource_class, selection=None, prefix="", seen=()):
+    """
+    Returns the ``(select_related, prefetch_related)`` lookups needed to
+    dehydrate ``resource_class`` without a query per object.
+
+    Every to-one field is joined since even its URI needs the related row.
+    Related resources declared with ``full=True`` are followed so their own
+    relations are loaded up front too. Given a ``fieldsets.Selection``,
+    fields left out of it aren't loaded and fullness follows the selection.
+    """
+    select, prefetch = [], []
+    for name, field in resource_class.base_fields.items():
+        if not getattr(field, "is_related", False):
+            continue
+        if not isinstance(field.attribute, str):
+            continue
+        if selection is not None and not includes(selection, name, field):
+            continue
+        lookup = prefix + field.attribute.replace(".", "__")
+        to_class = field.to_class
+        if isinstance(field, fields.ToManyField):
+            prefetch.append(lookup)
+        else:
+            select.append(lookup)
+        full = field.full
+        if selection is not None:
+            full = selection.expands(name, full)
+        if not full or to_class in seen:
+            continue
+        nested_select, nested_prefetch = related_lookups(
+            to_class,
+            selection.child(name) if selection is not None else None,
+            lookup + "__",
+            seen + (resource_class,),
+        )
+        if isinstance(field, fields.ToManyField):
+            prefetch.extend(nested_select)
+        else:
+            select.extend(nested_select)
+        prefetch.extend(nested_prefetch)
+    return select, prefetch
+
+
+def selected_columns(resource_class, selection, prefix=""):
+    """
+    The ``only()`` lookups loading what ``selection`` dehydrates from
+    ``resource_class``, or None when a selected field isn't a plain model
+    field and every column has to be loaded.
+    """
+    opts = resource_class._meta.object_class._meta
+    columns = [prefix + opts.pk.name]
+    for name, field in resource_class.base_fields.items():
+        attribute = field.attribute
+        # Fields without an attribute, like ``resource_uri``, are filled
+        # in by ``dehydrate_<name>`` methods.
+        if attribute is None or not includes(selection, name, field):
+            continue
+        if not isinstance(attribute, str) or "." in attribute:
+            return None
+        try:
+            model_field = opts.get_field(attribute)
+        except FieldDoesNotExist:
+            return None
+        if not getattr(field, "is_related", False):
+            if not model_field.concrete:
+                return None
+            columns.append(prefix + attribute)
+            continue
+        if isinstance(field, fields.ToManyField):
+            continue
+        # Traversed foreign keys can't be deferred, reverse one to ones
+        # have no column to name.
+        if model_field.concrete:
+            columns.append(prefix + attribute)
+        lookup = prefix + attribute + "__"
+        if not selection.expands(name, field.full):
+            related_pk = field.to_class._meta.object_class._meta.pk.name
+            columns.append(lookup + related_pk)
+            continue
+        nested = selected_columns(
+            field.to_class, selection.child(name), lookup
+        )
+        if nested is not None:
+            columns.extend(nested)
+    return columns
+
+
+class JSONResourceMixin(object):
+    """
+    Serializes with ``FastJSONSerializer`` unless ``Meta.serializer`` names
+    another one, and streams lists of ``API_STREAM_MIN_OBJECTS`` objects or
+    more instead of rendering them into one string. Serialization time is
+    reported to ``metrics``.
+    """
+
+    def __init__(self, api_name=None):
+        super(JSONResourceMixin, self).__init__(api_name)
+        if type(self._meta.serializer) is Serializer:
+            self._meta.serializer = default_serializer
+
+    def create_response(
+        self, request, data, response_class=HttpResponse, **response_kwargs
+    ):
+        serializer = self._meta.serializer
+        if (
+            isinstance(serializer, FastJSONSerializer)
+            and not response_kwargs
+            and serializer.should_stream(data)
+        ):
+            desired_format = self.determine_format(request)
+            return StreamingHttpResponse(
+                serializer.stream(data),
+                content_type=build_content_type(desired_format),
+                status=response_class.status_code,
+            )
+        return super(JSONResourceMixin, self).create_response(
+            request, data, response_class, **response_kwargs
+        )
+
+    def serialize(self, request, data, format, options=None):
+        with metrics.serializing():
+            return super(JSONResourceMixin, self).serialize(
+                request, data, format, options
+            )
+
+    def dispatch(self, request_type, request, **kwargs):
+        """
+        Tastypie's ``dispatch``, except that streamed responses are passed
+        through instead of being replaced with a 204.
+        """
+        allowed_methods = getattr(
+            self._meta, "%s_allowed_methods" % request_type, None
+        )
+        if "HTTP_X_HTTP_METHOD_OVERRIDE" in request.META:
+            request.method = request.META["HTTP_X_HTTP_METHOD_OVERRIDE"]
+        request_method = self.method_check(request, allowed=allowed_methods)
+        method = getattr(self, "%s_%s" % (request_method, request_type), None)
+        if method is None:
+            raise ImmediateHttpResponse(response=http.HttpNotImplemented())
+
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        request = convert_post_to_put(request)
+        response = method(request, **kwargs)
+        self.log_throttled_access(request)
+        if not isinstance(response, HttpResponseBase):
+            return http.HttpNoContent()
+        return response
+
+
+class BaseResource(JSONResourceMixin, Resource):
+    """``Resource`` serialized and throttled like the model resources."""
+
+    def wrap_view(self, view):
+        return throttle.throttled(super(BaseResource, self).wrap_view(view))
+
+
+class BaseModelResource(JSONResourceMixin, ModelResource):
+    """
+    ``ModelResource`` that loads the relations it dehydrates up front and
+    can fail a GET that runs more queries than ``Meta.query_budget``.
+
+    The budget counts the queries of every database and is only checked
+    when ``API_QUERY_BUDGET_ENFORCED`` is set, which the project's test
+    runner does, so a regression fails tests rather than production
+    requests.
+
+    Anonymous list and detail GETs are served from ``Meta.response_cache``
+    when the resource sets one, and GETs read from a replica when it sets
+    ``Meta.read_from_replica`` (see ``routers``).
+
+    GETs return the fields picked with ``?fields=`` and ``?expand=`` (see
+    ``fieldsets``) and only load the columns and relations those need.
+    Naming a field the resource doesn't have is a bad request.
+
+    Routes listed in ``API_THROTTLE_RATES`` are rate limited before any
+    of this runs (see ``throttle``).
+    """
+
+    def get_object_list(self, request):
+        selection = fieldsets.current(request)
+        if selection.is_default or request.method != "GET":
+            if not hasattr(self, "_related_lookups"):
+                self._related_lookups = related_lookups(type(self))
+            select, prefetch = self._related_lookups
+            columns = None
+        else:
+            for tree in (selection.fields, selection.expand):
+                unknown = unknown_fields(type(self), tree or {})
+                if unknown:
+                    raise CustomBadRequest(
+                        error_message="Unknown fields: %s"
+                        % ", ".join(sorted(unknown))
+                    )
+            select, prefetch = related_lookups(type(self), selection)
+            columns = selected_columns(type(self), selection)
+        object_list = super(BaseModelResource, self).get_object_list(request)
+        if select:
+            object_list = object_list.select_related(*select)
+        if prefetch:
+            object_list = object_list.prefetch_related(*prefetch)
+        if columns is not None:
+            # The cursor paginator orders and pages by these.
+            columns.extend(getattr(self._meta.paginator_class, "ordering", ()))
+            object_list = object_list.only(*columns)
+        return object_list
+
+    def selected_field(self, name, field, selection):
+        """``field``, or a copy of it embedding as ``selection`` says."""
+        full = selection.expands(name, field.full)
+        if full == field.full:
+            return field
+        variants = self.__dict__.setdefault("_field_variants", {})
+        if (name, full) not in variants:
+            variant = copy.copy(field)
+            variant.full = full
+            variant.full_list = variant.full_detail = lambda bundle: True
+            variants[(name, full)] = variant
+        return variants[(name, full)]
+
+    def full_dehydrate(self, bundle, for_list=False):
+        """
+        Tastypie's ``full_dehydrate`` restricted to the selected fields.
+        """
+        selection = fieldsets.current(bundle.request)
+        if selection.is_default:
+            return super(BaseModelResource, self).full_dehydrate(
+                bundle, for_list
+            )
+
+        for field_name, field_object in self.fields.items():
+            if not includes(selection, field_name, field_object):
+                continue
+            field_use_in = field_object.use_in
+            if callable(field_use_in):
+                if not field_use_in(bundle):
+                    continue
+            elif field_use_in not in ["all", "list" if for_list else "detail"]:
+                continue
+
+            if field_object.dehydrated_type == "related":
+                field_object = self.selected_field(
+                    field_name, field_object, selection
+                )
+                field_object.api_name = self._meta.api_name
+                field_object.resource_name = self._meta.resource_name
+                fieldsets.push(bundle.request, selection.child(field_name))
+                try:
+                    bundle.data[field_name] = field_object.dehydrate(
+                        bundle, for_list=for_list
+                    )
+                finally:
+                    fieldsets.pop(bundle.request)
+            else:
+                bundle.data[field_name] = field_object.dehydrate(
+                    bundle, for_list=for_list
+                )
+
+            method = getattr(self, "dehydrate_%s" % field_name, None)
+            if method:
+                bundle.data[field_name] = method(bundle)
+
+        return self.dehydrate(bundle)
+
+    def cache_responses(self, view, response_cache):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or not is_anonymous(request):
+                return view(request, *args, **kwargs)
+            return response_cache.fetch(
+                request,
+                self.determine_format(request),
+                lambda: view(request, *args, **kwargs),
+                pk=kwargs.get("pk"),
+            )
+
+        return wrapper
+
+    def read_from_replica(self, view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET":
+                return view(request, *args, **kwargs)
+            with routers.replica_reads():
+                return view(request, *args, **kwargs)
+
+        return wrapper
+
+    def wrap_view(self, view):
+        wrapped = super(BaseModelResource, self).wrap_view(view)
+        response_cache = getattr(self._meta, "response_cache", None)
+        if response_cache is not None and view in (
+            "dispatch_list",
+            "dispatch_detail",
+        ):
+            wrapped = self.cache_responses(wrapped, response_cache)
+        if getattr(self._meta, "read_from_replica", False):
+            wrapped = self.read_from_replica(wrapped)
+
+        @functools.wraps(wrapped)
+        def wrapper(request, *args, **kwargs):
+            budget = getattr(self._meta, "query_budget", None)
+            if (
+                budget is None
+                or request.method != "GET"
+                or not getattr(settings, "API_QUERY_BUDGET_ENFORCED", False)
+            ):
+                return wrapped(request, *args, **kwargs)
+            with ExitStack() as stack:
+                captured = [
+                    stack.enter_context(CaptureQueriesContext(connection))
+                    for connection in connections.all()
+                ]
+                response = wrapped(request, *args, **kwargs)
+            queries = [
+                query
+                for context in captured
+                for query in context.captured_queries
+            ]
+            if len(queries) > budget:
+                raise QueryBudgetExceeded(
+                    "%s ran %d queries, its budget is %d:\n%s"
+                    % (
+                        request.path,
+                        len(queries),
+                        budget,
+                        "\n".join(query["sql"] for query in queries),
+                    )
+                )
+            return response
+
+        return throttle.throttled(wrapper)
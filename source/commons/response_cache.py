@@ -0,0 +1,238 @@
+"""
+Shared cache of serialized GET responses for anonymous readers.
+
+Responses are keyed by path, query string and serialization format, under
+version tokens that writes replace: changing an object invalidates its
+detail responses and every list, nothing else. Each response carries an
+``ETag`` so clients revalidating with ``If-None-Match`` get a 304.
+"""
+from __future__ import absolute_import
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from . import metrics
+
+CACHED_HEADERS = ("Content-Type", "Vary", "Cache-Control")
+
+logger = logging.getLogger(__name__)
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Whether ``if_none_match`` lists ``etag`` or is ``*``, comparing tags
+    weakly as ``If-None-Match`` does.
+    """
+    tags = parse_etags(if_none_match)
+    if tags == ["*"]:
+        return True
+    etag = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags
+    )
+
+
+class ResponseCacheStats(object):
+    """
+    Per-process hit/miss counters and latencies of a ``ResponseCache``,
+    served by ``/metrics`` and logged every
+    ``API_RESPONSE_CACHE_REPORT_EVERY`` requests.
+    """
+
+    instances = []
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+        ResponseCacheStats.instances.append(self)
+
+    def reset(self):
+        self.counts = {"hit": 0, "miss": 0}
+        self.seconds = {"hit": 0.0, "miss": 0.0}
+        self.not_modified = 0
+
+    def record(self, outcome, seconds, not_modified=False):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.seconds[outcome] += seconds
+            if not_modified:
+                self.not_modified += 1
+            total = self.counts["hit"] + self.counts["miss"]
+        every = getattr(settings, "API_RESPONSE_CACHE_REPORT_EVERY", 1000)
+        if every and total % every == 0:
+            logger.info("%s response cache: %s", self.name, self.snapshot())
+
+    def snapshot(self):
+        with self._lock:
+            total = self.counts["hit"] + self.counts["miss"]
+            data = {
+                "hits": self.counts["hit"],
+                "misses": self.counts["miss"],
+                "not_modified": self.not_modified,
+                "hit_ratio": self.counts["hit"] / total if total else 0.0,
+            }
+            for outcome in ("hit", "miss"):
+                count = self.counts[outcome]
+                data["avg_%s_ms" % outcome] = (
+                    self.seconds[outcome] * 1000 / count if count else 0.0
+                )
+            return data
+
+
+@metrics.register
+def render_stats():
+    """The counters of every response cache, for ``/metrics``."""
+    snapshots = [
+        (stats.name, stats.snapshot())
+        for stats in ResponseCacheStats.instances
+    ]
+    lines = [
+        "# HELP api_response_cache_requests_total Requests served through "
+        "the response cache.",
+        "# TYPE api_response_cache_requests_total counter",
+    ]
+    for name, snapshot in snapshots:
+        for outcome, field in (("hit", "hits"), ("miss", "misses")):
+            lines.append(
+                'api_response_cache_requests_total{cache="%s",outcome="%s"} '
+                "%d" % (name, outcome, snapshot[field])
+            )
+    lines += [
+        "# HELP api_response_cache_average_milliseconds Average time to "
+        "serve a request through the response cache.",
+        "# TYPE api_response_cache_average_milliseconds gauge",
+    ]
+    for name, snapshot in snapshots:
+        for outcome in ("hit", "miss"):
+            lines.append(
+                'api_response_cache_average_milliseconds{cache="%s",'
+                'outcome="%s"} %s'
+                % (name, outcome, repr(snapshot["avg_%s_ms" % outcome]))
+            )
+    lines += [
+        "# HELP api_response_cache_hit_ratio Share of the requests served "
+        "from the response cache.",
+        "# TYPE api_response_cache_hit_ratio gauge",
+    ]
+    for name, snapshot in snapshots:
+        lines.append(
+            'api_response_cache_hit_ratio{cache="%s"} %s'
+            % (name, repr(snapshot["hit_ratio"]))
+        )
+    return lines
+
+
+class ResponseCache(object):
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.stats = ResponseCacheStats(namespace)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "API_RESPONSE_CACHE_ALIAS", "default")]
+
+    def version_key(self, scope):
+        return "api-response:%s:version:%s" % (self.namespace, scope)
+
+    def get_versions(self, pk=None):
+        scope = "list" if pk is None else pk
+        keys = [self.version_key("all"), self.version_key(scope)]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # A lost version must never resurrect older entries.
+                versions[key] = uuid.uuid4().hex
+                self.cache.set(key, versions[key], None)
+        return ":".join(versions[key] for key in keys)
+
+    def bump(self, scopes):
+        self.cache.set_many(
+            {self.version_key(scope): uuid.uuid4().hex for scope in scopes},
+            None,
+        )
+        # Bump again on commit, so a read racing the transaction can't keep
+        # the old rows cached.
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self.bump(scopes))
+
+    def invalidate(self, pk=None):
+        """Invalidates every list and, given ``pk``, that object's details."""
+        self.bump(["list"] if pk is None else ["list", pk])
+
+    def invalidate_all(self):
+        self.bump(["all"])
+
+    def get_key(self, request, format, pk=None):
+        query = sorted(request.GET.lists())
+        fingerprint = hashlib.sha1(
+            repr((request.path, query, format)).encode("utf-8")
+        ).hexdigest()
+        return "api-response:%s:%s:%s" % (
+            self.namespace,
+            self.get_versions(pk),
+            fingerprint,
+        )
+
+    def fetch(self, request, format, view, pk=None):
+        """
+        Serves ``request`` from the cache, or from ``view`` and stores the
+        result. Answers 304 when the ``If-None-Match`` ETag still matches.
+        """
+        start = time.perf_counter()
+        key = self.get_key(request, format, pk)
+        entry = self.cache.get(key)
+        outcome = "hit"
+        if entry is None:
+            outcome = "miss"
+            response = view()
+            if response.status_code != 200 or response.streaming:
+                return response
+            entry = {
+                "content": response.content,
+                "etag": quote_etag(
+                    hashlib.md5(response.content).hexdigest()
+                ),
+                "headers": {
+                    name: response[name]
+                    for name in CACHED_HEADERS
+                    if response.has_header(name)
+                },
+            }
+            self.cache.set(
+                key,
+                entry,
+                getattr(settings, "API_RESPONSE_CACHE_TTL", 300),
+            )
+
+        not_modified = etag_matches(
+            entry["etag"], request.META.get("HTTP_IF_NONE_MATCH", "")
+        )
+        if not_modified:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(entry["content"])
+        for name, value in entry["headers"].items():
+            response[name] = value
+        response["ETag"] = entry["etag"]
+        response["X-Cache"] = outcome.upper()
+        self.stats.record(
+            outcome, time.perf_counter() - start, not_modified
+        )
+        return response
+
+
+def is_anonymous(request):
+    """True for requests carrying neither an api key nor a session."""
+    return not (
+        request.GET.get("api_key")
+        or request.GET.get("username")
+        or request.META.get("HTTP_AUTHORIZATION")
+        or settings.SESSION_COOKIE_NAME in request.COOKIES
+    )
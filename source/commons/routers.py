@@ -0,0 +1,50 @@
+"""
+Read replica routing.
+
+Reads made inside ``replica_reads()`` go to one of the aliases listed in
+``DATABASE_REPLICAS``, picked once per block so a request reads from a
+single replica. Writes, reads outside such a block and reads inside a
+transaction on the default database stay on the default database, so a
+request never reads back a stale copy of what it just wrote.
+"""
+from __future__ import absolute_import
+import random
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+@contextmanager
+def replica_reads():
+    previous = getattr(_state, "alias", None)
+    replicas = getattr(settings, "DATABASE_REPLICAS", ())
+    _state.alias = previous or (random.choice(replicas) if replicas else None)
+    try:
+        yield _state.alias
+    finally:
+        _state.alias = previous
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        alias = getattr(_state, "alias", None)
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Without an answer Django writes an instance back to the database
+        # it was read from, which may be a replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the default database.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in getattr(settings, "DATABASE_REPLICAS", ()):
+            return False
+        return None
@@ -0,0 +1,24 @@
+"""
+Test runner of the project, ``TEST_RUNNER`` in the settings.
+"""
+from __future__ import absolute_import
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    ``DiscoverRunner`` enforcing the ``query_budget`` of every resource, so
+    a GET going over its budget fails the test that makes it.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super(TestRunner, self).setup_test_environment(**kwargs)
+        self.budget_override = override_settings(
+            API_QUERY_BUDGET_ENFORCED=True
+        )
+        self.budget_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.budget_override.disable()
+        super(TestRunner, self).teardown_test_environment(**kwargs)
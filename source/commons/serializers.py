@@ -0,0 +1,134 @@
+"""
+JSON only serializer for the v1 api, backed by the fastest encoder around.
+
+``API_JSON_ENCODER`` picks ``orjson``, ``ujson`` or the stdlib ``json``;
+left to ``None`` the first one installed wins. Tastypie's ``to_simple``
+runs first, so every encoder only ever sees dicts, lists, strings, numbers,
+booleans and None, and all of them produce the same document: sorted keys,
+no whitespace, UTF-8 without ASCII escaping.
+
+Lists with at least ``API_STREAM_MIN_OBJECTS`` objects are written by
+``stream`` a chunk of objects at a time, so a large page never sits in
+memory as one string.
+"""
+from __future__ import absolute_import
+import json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from tastypie.exceptions import BadRequest
+from tastypie.serializers import Serializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def dumps_json(data):
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def dumps_ujson(data):
+    try:
+        return ujson.dumps(
+            data,
+            sort_keys=True,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+        ).encode("utf-8")
+    except (TypeError, OverflowError):
+        return dumps_json(data)
+
+
+def dumps_orjson(data):
+    try:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    except TypeError:
+        # Non string keys or integers over 64 bits.
+        return dumps_json(data)
+
+
+ENCODERS = {
+    "json": (dumps_json, json.loads),
+}
+if ujson is not None:
+    ENCODERS["ujson"] = (dumps_ujson, ujson.loads)
+if orjson is not None and hasattr(orjson, "OPT_SORT_KEYS"):
+    ENCODERS["orjson"] = (dumps_orjson, orjson.loads)
+
+
+def get_encoder(name=None):
+    """``(dumps, loads)`` of ``name``, or of the fastest one installed."""
+    name = name or getattr(settings, "API_JSON_ENCODER", None)
+    if name:
+        return ENCODERS[name]
+    for name in ("orjson", "ujson", "json"):
+        if name in ENCODERS:
+            return ENCODERS[name]
+
+
+class FastJSONSerializer(Serializer):
+    formats = ["json"]
+    content_types = {"json": "application/json"}
+
+    def __init__(self, encoder=None, **kwargs):
+        super(FastJSONSerializer, self).__init__(**kwargs)
+        self.dumps, self.loads = get_encoder(encoder)
+
+    def to_json(self, data, options=None):
+        return self.dumps(self.to_simple(data, options or {}))
+
+    def from_json(self, content):
+        if isinstance(content, bytes):
+            content = content.decode("utf-8")
+        try:
+            return self.loads(content)
+        except ValueError:
+            raise BadRequest("Request is not valid JSON.")
+
+    def should_stream(self, data):
+        return (
+            isinstance(data, dict)
+            and isinstance(data.get("objects"), list)
+            and len(data["objects"])
+            >= getattr(settings, "API_STREAM_MIN_OBJECTS", 200)
+        )
+
+    def stream(self, data, options=None, chunk_size=100):
+        """
+        Yields the same document as ``to_json(data)`` in pieces, turning
+        ``data["objects"]`` into JSON ``chunk_size`` objects at a time.
+        """
+        options = options or {}
+        yield b"{"
+        for index, key in enumerate(sorted(data)):
+            yield (b"," if index else b"") + self.dumps(key) + b":"
+            if key != "objects":
+                yield self.dumps(self.to_simple(data[key], options))
+                continue
+            objects = data[key]
+            yield b"["
+            for start in range(0, len(objects), chunk_size):
+                chunk = self.dumps(
+                    [
+                        self.to_simple(obj, options)
+                        for obj in objects[start:start + chunk_size]
+                    ]
+                )
+                yield (b"," if start else b"") + chunk[1:-1]
+            yield b"]"
+        yield b"}"
+
+
+default_serializer = FastJSONSerializer()
@@ -0,0 +1,228 @@
+import time
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.checks import WARNING
+from django.db import connection, router
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from todo_social_app.urls import v1_api
+from ..account.testing import create_user
+from ..post.models import Like, Post
+from ..post.testing import create_post
+from . import checks, metrics, routers, throttle
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterTestCase(SimpleTestCase):
+    def test_reads_inside_replica_reads_go_to_a_replica(self):
+        self.assertEqual(router.db_for_read(Post), "default")
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(Post), "replica")
+            self.assertEqual(router.db_for_write(Post), "default")
+            with mock.patch.object(connection, "in_atomic_block", True):
+                self.assertEqual(router.db_for_read(Post), "default")
+        self.assertEqual(router.db_for_read(Post), "default")
+
+
+class WarmUpTestCase(TestCase):
+    def test_warm_up_does_not_query_and_caches_lookups(self):
+        from todo_social_app.warmup import warm_up
+
+        resource = v1_api._registry["posts"]
+        with CaptureQueriesContext(connection) as queries:
+            warm_up()
+        self.assertEqual(len(queries), 0)
+        self.assertTrue(hasattr(resource, "_related_lookups"))
+        response = self.client.get("/api/v1/posts/")
+        self.assertEqual(response.status_code, 200)
+
+
+class SharedCacheCheckTestCase(SimpleTestCase):
+    def test_local_caches_with_many_workers(self):
+        self.assertEqual(checks.check_shared_caches(None), [])
+        with self.settings(WEB_WORKERS=4):
+            warnings = checks.check_shared_caches(None)
+        self.assertEqual(
+            {warning.level for warning in warnings}, {WARNING}
+        )
+        self.assertEqual(
+            [warning.msg.split()[0] for warning in warnings],
+            [
+                "API_KEY_CACHE_ALIAS",
+                "API_RESPONSE_CACHE_ALIAS",
+                "FRIEND_GRAPH_CACHE_ALIAS",
+                "API_THROTTLE_CACHE_ALIAS",
+            ],
+        )
+        shared = {
+            "BACKEND": "django.core.cache.backends.memcached.MemcachedCache"
+        }
+        with self.settings(WEB_WORKERS=4, CACHES={"default": shared}):
+            self.assertEqual(checks.check_shared_caches(None), [])
+
+
+class TestRunnerTestCase(SimpleTestCase):
+    def test_query_budgets_are_enforced(self):
+        self.assertTrue(settings.API_QUERY_BUDGET_ENFORCED)
+
+
+@override_settings(
+    API_THROTTLE_RATES={"api_like_post": {"user": (2, 60), "ip": (3, 60)}}
+)
+class ThrottleTestCase(TestCase):
+    def setUp(self):
+        self.clients = []
+        for n in range(2):
+            client = Client()
+            client.force_login(create_user("u%d" % n))
+            self.clients.append(client)
+        self.posts = [create_post(User.objects.first()) for _ in range(4)]
+        cache.clear()
+
+    def like(self, client, post, **extra):
+        return client.post("/api/v1/posts/%s/liked/" % post.id, **extra)
+
+    def test_user_and_ip_buckets(self):
+        first, second = self.clients
+        self.assertEqual(self.like(first, self.posts[0]).status_code, 200)
+        self.assertEqual(self.like(first, self.posts[1]).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.like(first, self.posts[2])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertEqual(len(queries), 0)
+        # The address has one token left, shared with any other session.
+        self.assertEqual(self.like(second, self.posts[0]).status_code, 200)
+        self.assertEqual(self.like(second, self.posts[1]).status_code, 429)
+        third = Client(REMOTE_ADDR="10.0.0.1")
+        third.force_login(create_user("u2"))
+        self.assertEqual(self.like(third, self.posts[1]).status_code, 200)
+        self.assertEqual(Like.objects.count(), 4)
+
+    @override_settings(API_THROTTLE_TRUSTED_PROXIES=1)
+    def test_address_behind_a_proxy(self):
+        request = RequestFactory().get(
+            "/", HTTP_X_FORWARDED_FOR="1.1.1.1, 2.2.2.2"
+        )
+        self.assertEqual(throttle.client_address(request), "2.2.2.2")
+
+    def test_buckets_refill(self):
+        client = self.clients[0]
+        now = time.time()
+        with mock.patch("time.time", return_value=now):
+            for post in self.posts[:3]:
+                self.like(client, post)
+        self.assertEqual(Like.objects.count(), 2)
+        with mock.patch("time.time", return_value=now + 30):
+            self.assertEqual(self.like(client, self.posts[2]).status_code, 200)
+
+    def test_shared_and_local_buckets(self):
+        for post in self.posts[:2]:
+            self.like(self.clients[0], post)
+        self.assertTrue(cache.get("throttle:api_like_post:ip:127.0.0.1"))
+        with self.settings(API_THROTTLE_CACHE_ALIAS=None):
+            statuses = [
+                self.like(self.clients[1], post).status_code
+                for post in self.posts[:3]
+            ]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_session_is_the_user_bucket_before_the_api_key(self):
+        user = User.objects.first()
+        request = RequestFactory().get(
+            "/", {"username": user.username, "api_key": "forged"}
+        )
+        by_key = throttle.client_credentials(request)
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = "session"
+        by_session = throttle.client_credentials(request)
+        self.assertNotEqual(by_key, by_session)
+        request.GET = request.GET.copy()
+        request.GET["api_key"] = "other"
+        self.assertEqual(throttle.client_credentials(request), by_session)
+
+    def test_other_routes_are_not_throttled(self):
+        for _ in range(5):
+            response = self.clients[0].get("/api/v1/posts/")
+            self.assertEqual(response.status_code, 200)
+
+
+class RequestMetricsTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user("measured")
+        self.post = create_post(self.user)
+        self.client.force_login(self.user)
+
+    def count(self, route):
+        prefix = 'api_request_queries_count{route="%s"} ' % route
+        for line in metrics.render().splitlines():
+            if line.startswith(prefix):
+                return int(line[len(prefix):])
+        return 0
+
+    def test_server_timing_counts_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/posts/")
+        timing = response["Server-Timing"]
+        self.assertIn('desc="%d queries"' % len(queries), timing)
+        self.assertRegex(timing, r"serialize;dur=[\d.]+, total;dur=[\d.]+$")
+
+    def test_histograms_by_route(self):
+        before = self.count("posts:api_like_post")
+        self.client.post("/api/v1/posts/%s/liked/" % self.post.id)
+        self.assertEqual(self.count("posts:api_like_post"), before + 1)
+        response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"].split(";")[0], "text/plain")
+        body = response.content.decode("utf-8")
+        self.assertIn("# TYPE api_request_duration_seconds histogram", body)
+        self.assertIn(
+            'api_request_duration_seconds_bucket{route="posts:api_like_post",'
+            'le="+Inf"}',
+            body,
+        )
+
+    def test_resources_have_their_own_series(self):
+        before = {
+            route: self.count(route)
+            for route in (
+                "posts:api_dispatch_list",
+                "relationship:api_dispatch_list",
+            )
+        }
+        self.client.get("/api/v1/posts/")
+        self.client.get("/api/v1/relationship/")
+        self.client.get("/api/v1/relationship/")
+        self.assertEqual(
+            self.count("posts:api_dispatch_list"),
+            before["posts:api_dispatch_list"] + 1,
+        )
+        self.assertEqual(
+            self.count("relationship:api_dispatch_list"),
+            before["relationship:api_dispatch_list"] + 2,
+        )
+
+    def test_metrics_are_local_only(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(API_METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs("source.commons.metrics", "WARNING") as logs:
+            self.client.get("/api/v1/posts/%s/" % self.post.id)
+        self.assertIn("(posts:api_dispatch_detail)", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("h", "Help.", (1, 5))
+        for value in (0.5, 1, 3, 7):
+            histogram.observe("r", value)
+        self.assertEqual(histogram.render()[2:], [
+            'h_bucket{route="r",le="1"} 2',
+            'h_bucket{route="r",le="5"} 3',
+            'h_bucket{route="r",le="+Inf"} 4',
+            'h_sum{route="r"} 11.5',
+            'h_count{route="r"} 4',
+        ])
@@ -0,0 +1,174 @@
+"""
+Token bucket rate limits for API routes.
+
+``API_THROTTLE_RATES`` maps url names to the buckets a request of that
+route draws a token from, each given as ``(capacity, seconds)``: bursts of
+up to ``capacity`` requests, refilled at ``capacity`` per ``seconds``::
+
+    "api_like_post": {"user": (60, 60), "ip": (300, 60)},
+
+The ``user`` bucket belongs to the credentials authentication will use,
+the session cookie before the api key, read without looking them up so
+that a rejected request costs no query, and the ``ip`` bucket to the
+client address. Forged credentials get a bucket of their own but still
+drain the one of their address.
+
+Buckets live in the cache named by ``API_THROTTLE_CACHE_ALIAS``, shared by
+every worker, or in each process when it is None, which lets a client
+make the limits times the number of workers. A check reads
+and writes one entry per bucket. Concurrent checks of the same shared
+bucket may both pass, the limits are not meant to be exact. A request
+over a limit gets a 429 with ``Retry-After`` before its view runs.
+"""
+from __future__ import absolute_import
+import functools
+import hashlib
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from tastypie.http import HttpTooManyRequests
+from .custom_exception import RENDERED_ERRORS
+from .lru import LRUCache
+
+# Longer than any bucket takes to refill, an expired bucket is a full one.
+LOCAL_BUCKET_TTL = 3600
+
+
+class LocalBuckets(object):
+    def __init__(self, maxsize):
+        self.buckets = LRUCache(maxsize=maxsize, ttl=LOCAL_BUCKET_TTL)
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self.lock:
+            state = self.buckets.get(key)
+            tokens, wait = refill(state, capacity, rate, now)
+            self.buckets.set(key, (tokens, now))
+        return wait
+
+    def clear(self):
+        self.buckets.clear()
+
+
+class CacheBuckets(object):
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, capacity, rate, now):
+        key = "throttle:%s" % key
+        tokens, wait = refill(self.cache.get(key), capacity, rate, now)
+        self.cache.set(
+            key, (tokens, now), int(math.ceil(capacity / rate)) + 1
+        )
+        return wait
+
+
+def refill(state, capacity, rate, now):
+    """
+    Tokens left in a bucket after taking one, and the seconds to wait when
+    there was none to take.
+    """
+    if state is None:
+        tokens = capacity
+    else:
+        tokens, stamp = state
+        tokens = min(capacity, tokens + (now - stamp) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+local_buckets = LocalBuckets(
+    getattr(settings, "API_THROTTLE_LOCAL_SIZE", 100000)
+)
+
+
+def get_buckets():
+    alias = getattr(settings, "API_THROTTLE_CACHE_ALIAS", "default")
+    return CacheBuckets(alias) if alias else local_buckets
+
+
+def client_address(request):
+    proxies = getattr(settings, "API_THROTTLE_TRUSTED_PROXIES", 0)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if proxies and forwarded:
+        # Each trusted proxy appended the address it was reached from.
+        addresses = [address.strip() for address in forwarded.split(",")]
+        return addresses[max(len(addresses) - proxies, 0)]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def client_credentials(request):
+    # In the order authentication tries them: sessions, then api keys.
+    credentials = request.COOKIES.get(
+        settings.SESSION_COOKIE_NAME
+    ) or request.META.get("HTTP_AUTHORIZATION")
+    if not credentials and request.GET.get("api_key"):
+        credentials = "%s:%s" % (
+            request.GET.get("username", ""),
+            request.GET["api_key"],
+        )
+    if not credentials:
+        return None
+    return hashlib.sha1(credentials.encode("utf-8")).hexdigest()
+
+
+def check(request):
+    """Seconds until ``request`` may be served, 0 when it may be now."""
+    match = request.resolver_match
+    limits = getattr(settings, "API_THROTTLE_RATES", {}).get(
+        match.url_name if match is not None else None
+    )
+    if not limits:
+        return 0
+    buckets = get_buckets()
+    now = time.time()
+    for kind, client in (
+        ("user", client_credentials(request)),
+        ("ip", client_address(request)),
+    ):
+        if kind not in limits or client is None:
+            continue
+        capacity, seconds = limits[kind]
+        wait = buckets.take(
+            "%s:%s:%s" % (match.url_name, kind, client),
+            capacity,
+            capacity / float(seconds),
+            now,
+        )
+        # A request the user bucket turns down leaves the address alone.
+        if wait:
+            return wait
+    return 0
+
+
+def too_many_requests(wait):
+    response = HttpTooManyRequests(
+        RENDERED_ERRORS["TOO_MANY_REQUESTS"], content_type="application/json"
+    )
+    response["Retry-After"] = str(int(math.ceil(wait)))
+    return response
+
+
+def throttled(view):
+    """Wraps a resource view to answer 429 to requests over their limits."""
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        wait = check(request)
+        if wait:
+            return too_many_requests(wait)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def forget_buckets(setting, **kwargs):
+    if setting.startswith("API_THROTTLE_"):
+        local_buckets.clear()
+
+
+setting_changed.connect(forget_buckets)
@@ -0,0 +1,5 @@
+from django.contrib import admin
+from .models import FeedEntry, HighFanoutAuthor
+# Register your models here.
+admin.site.register(FeedEntry)
+admin.site.register(HighFanoutAuthor)
@@ -0,0 +1,72 @@
+from tastypie.authorization import ReadOnlyAuthorization
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
+from ..account import friend_graph
+from ..account.authentication import CachedApiKeyAuthentication
+from ..commons.cursor import encode_cursor, decode_cursor
+from ..commons.resources import BaseResource
+from ..post.apis import PostResource
+from . import fanout
+
+
+class FeedResource(BaseResource):
+    """Home timeline of the authenticated user, newest posts first."""
+
+    post_resource = PostResource()
+
+    class Meta:
+        resource_name = "feed"
+        list_allowed_methods = ["get"]
+        detail_allowed_methods = []
+        include_resource_uri = False
+        authentication = CachedApiKeyAuthentication()
+        authorization = ReadOnlyAuthorization()
+        limit = 20
+        max_limit = 100
+
+    def get_list(self, request, **kwargs):
+        limit = Paginator(
+            request.GET,
+            [],
+            limit=self._meta.limit,
+            max_limit=self._meta.max_limit,
+        ).get_limit()
+        before = None
+        cursor = request.GET.get("cursor")
+        if cursor:
+            try:
+                before = int(decode_cursor(cursor)[0])
+            except ValueError:
+                raise BadRequest("Invalid cursor '%s' provided." % cursor)
+
+        post_ids = fanout.timeline(
+            request.user.id, before=before, limit=limit + 1
+        )
+        next_cursor = None
+        if len(post_ids) > limit:
+            post_ids = post_ids[:limit]
+            next_cursor = encode_cursor(post_ids[-1])
+
+        posts = self.post_resource.get_object_list(request).in_bulk(
+            post_ids
+        )
+        # Entries fanned out before a block, or pulled from a high fanout
+        # author, may belong to a blocked user.
+        hidden = friend_graph.blocked_ids(request.user.id)
+        objects = [
+            self.post_resource.full_dehydrate(
+                self.post_resource.build_bundle(
+                    obj=posts[post_id], request=request
+                ),
+                for_list=True,
+            )
+            for post_id in post_ids
+            if post_id in posts and posts[post_id].author_id not in hidden
+        ]
+        return self.create_response(
+            request,
+            {
+                "meta": {"limit": limit, "next": next_cursor},
+                "objects": objects,
+            },
+        )
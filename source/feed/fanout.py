@@ -0,0 +1,158 @@
+"""
+Home timeline maintenance.
+
+Posts are pushed into the ``FeedEntry`` rows of the author's friends when
+they are created (fan-out-on-write). Authors with more friends than
+``FEED_FANOUT_THRESHOLD`` are recorded as ``HighFanoutAuthor`` instead, and
+their posts are merged into each reader's timeline when it is read
+(fan-out-on-read), so a single post never costs millions of inserts.
+An author falling back under the threshold keeps the posts written
+meanwhile merged on read. New friends get each other's latest
+``FEED_BACKFILL_POSTS`` fanned out posts copied into their timelines.
+"""
+from __future__ import absolute_import
+from django.conf import settings
+from django.db.models import Q
+from ..account.models import Relationship
+from ..post.models import Post
+from .models import FeedEntry, HighFanoutAuthor
+
+
+def get_fanout_threshold():
+    return getattr(settings, "FEED_FANOUT_THRESHOLD", 5000)
+
+
+def fan_out_post(post):
+    """Materialize ``post`` into the timelines of its author's friends."""
+    threshold = get_fanout_threshold()
+    # Never load more ids than needed to know the author is over the limit.
+    friend_ids = list(
+        Relationship.objects.friend_ids(post.author_id)[: threshold + 1]
+    )
+    owner_ids = [post.author_id]
+    if len(friend_ids) > threshold:
+        HighFanoutAuthor.objects.update_or_create(
+            user_id=post.author_id, defaults={"merged_before": None}
+        )
+    else:
+        HighFanoutAuthor.objects.filter(
+            user_id=post.author_id, merged_before=None
+        ).update(merged_before=post.id)
+        owner_ids.extend(friend_ids)
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(owner_id=owner_id, post_id=post.id,
+                      author_id=post.author_id)
+            for owner_id in owner_ids
+        ],
+        batch_size=getattr(settings, "FEED_FANOUT_BATCH_SIZE", 1000),
+    )
+
+
+def prune(user_id, other_ids):
+    """Drop posts between ``user_id`` and each of ``other_ids`` from feeds."""
+    FeedEntry.objects.filter(
+        Q(owner_id=user_id, author_id__in=other_ids)
+        | Q(owner_id__in=other_ids, author_id=user_id)
+    ).delete()
+
+
+def backfill(user_id, other_ids):
+    """
+    Copies the latest posts of ``user_id`` and of each of its new friends
+    ``other_ids`` into the other side's timeline, leaving out the posts
+    merged on read.
+    """
+    author_ids = [user_id] + list(other_ids)
+    merged = dict(
+        HighFanoutAuthor.objects.filter(user_id__in=author_ids).values_list(
+            "user_id", "merged_before"
+        )
+    )
+    limit = getattr(settings, "FEED_BACKFILL_POSTS", 20)
+    posts = Post.objects.filter(author_id__in=author_ids).order_by("-id")
+    kept = {}
+    for post_id, author_id in posts.values_list("id", "author_id")[
+        : limit * len(author_ids)
+    ]:
+        if author_id in merged and (
+            merged[author_id] is None or post_id < merged[author_id]
+        ):
+            continue
+        author_posts = kept.setdefault(author_id, [])
+        if len(author_posts) < limit:
+            author_posts.append(post_id)
+    if not kept:
+        return
+
+    entries = []
+    for author_id, post_ids in kept.items():
+        owner_ids = other_ids if author_id == user_id else [user_id]
+        entries.extend(
+            FeedEntry(owner_id=owner_id, post_id=post_id, author_id=author_id)
+            for owner_id in owner_ids
+            for post_id in post_ids
+        )
+    existing = set(
+        FeedEntry.objects.filter(
+            owner_id__in=author_ids,
+            post_id__in=[entry.post_id for entry in entries],
+        ).values_list("owner_id", "post_id")
+    )
+    FeedEntry.objects.bulk_create(
+        [
+            entry
+            for entry in entries
+            if (entry.owner_id, entry.post_id) not in existing
+        ],
+        batch_size=getattr(settings, "FEED_FANOUT_BATCH_SIZE", 1000),
+    )
+
+
+def high_fanout_friends(user_id):
+    """``(author id, merged_before)`` of the friends merged on read."""
+    accepted = Relationship.objects.filter(status=Relationship.ACCEPTED)
+    return list(
+        HighFanoutAuthor.objects.filter(
+            Q(user_id__in=accepted.filter(user_two_id=user_id).values(
+                "user_one_id"))
+            | Q(user_id__in=accepted.filter(user_one_id=user_id).values(
+                "user_two_id"))
+        ).values_list("user_id", "merged_before")
+    )
+
+
+def timeline(user_id, before=None, limit=20):
+    """
+    Returns up to ``limit`` post ids for ``user_id``'s timeline, newest
+    first, restricted to ids lower than ``before`` when it is given.
+    """
+    entries = FeedEntry.objects.filter(owner_id=user_id)
+    if before is not None:
+        entries = entries.filter(post_id__lt=before)
+    post_ids = list(
+        entries.order_by("-post_id").values_list("post_id", flat=True)[
+            :limit
+        ]
+    )
+
+    authors = high_fanout_friends(user_id)
+    if authors:
+        merged = Q(
+            author_id__in=[
+                author_id
+                for author_id, merged_before in authors
+                if merged_before is None
+            ]
+        )
+        for author_id, merged_before in authors:
+            if merged_before is not None:
+                merged |= Q(author_id=author_id, id__lt=merged_before)
+        pulled = Post.objects.filter(merged)
+        if before is not None:
+            pulled = pulled.filter(id__lt=before)
+        post_ids.extend(
+            pulled.order_by("-id").values_list("id", flat=True)[:limit]
+        )
+        post_ids = sorted(set(post_ids), reverse=True)[:limit]
+    return post_ids
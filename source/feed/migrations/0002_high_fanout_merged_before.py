@@ -0,0 +1,18 @@
+# Generated by Django 2.0.13 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='highfanoutauthor',
+            name='merged_before',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
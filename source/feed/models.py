@@ -0,0 +1,44 @@
+from django.db import models
+from django.contrib.auth.models import User
+from ..post.models import Post
+
+
+class FeedEntry(models.Model):
+    """One post materialized into one user's home timeline."""
+
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="feed_entries"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="feed_entries"
+    )
+    # Denormalized from ``post`` so unfriending can prune without a join.
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+"
+    )
+
+    class Meta:
+        # The unique index also serves timeline reads, newest post first.
+        unique_together = ("owner", "post")
+        indexes = [
+            models.Index(
+                fields=["owner", "author"], name="feed_owner_author_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return "Post %s in feed of %s" % (self.post_id, self.owner_id)
+
+
+class HighFanoutAuthor(models.Model):
+    """Authors whose posts are merged into feeds at read time."""
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True
+    )
+    # Once the author falls back under the threshold, only their posts
+    # with lower ids are merged, the newer ones are fanned out on write.
+    merged_before = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return str(self.user_id)
@@ -0,0 +1,166 @@
+import json
+from django.test import TestCase, override_settings
+from ..account.models import Relationship
+from ..account.testing import create_user
+from ..post.models import Post
+from .models import FeedEntry, HighFanoutAuthor
+
+
+class FeedTestCase(TestCase):
+    def setUp(self):
+        self.reader = create_user("reader")
+        self.friend = create_user("friend")
+        self.stranger = create_user("stranger")
+        Relationship.objects.create(
+            user_one=self.friend,
+            user_two=self.reader,
+            status=Relationship.ACCEPTED,
+        )
+
+    def create_post(self, author, title="title"):
+        self.client.force_login(author)
+        response = self.client.post(
+            "/api/v1/posts/",
+            json.dumps(
+                {
+                    "title": title,
+                    "content": "content",
+                    "image_path": "",
+                    "image_title": "",
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.client.logout()
+        return Post.objects.latest("id")
+
+    def get_feed(self, **params):
+        params.update(
+            username=self.reader.username, api_key=self.reader.api_key.key
+        )
+        response = self.client.get("/api/v1/feed/", params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode("utf-8"))
+
+    def test_fan_out_on_write_to_friends_only(self):
+        post = self.create_post(self.friend)
+        self.create_post(self.stranger)
+        self.assertTrue(
+            FeedEntry.objects.filter(owner=self.reader, post=post).exists()
+        )
+        data = self.get_feed()
+        self.assertEqual([obj["id"] for obj in data["objects"]], [post.id])
+
+    def test_cursor_pagination(self):
+        posts = [self.create_post(self.friend, str(i)) for i in range(3)]
+        first = self.get_feed(limit=2)
+        self.assertEqual(
+            [obj["id"] for obj in first["objects"]],
+            [posts[2].id, posts[1].id],
+        )
+        second = self.get_feed(limit=2, cursor=first["meta"]["next"])
+        self.assertEqual(
+            [obj["id"] for obj in second["objects"]], [posts[0].id]
+        )
+        self.assertIsNone(second["meta"]["next"])
+
+    @override_settings(FEED_FANOUT_THRESHOLD=0)
+    def test_high_fanout_author_is_merged_on_read(self):
+        post = self.create_post(self.friend)
+        self.assertTrue(
+            HighFanoutAuthor.objects.filter(user=self.friend).exists()
+        )
+        self.assertFalse(
+            FeedEntry.objects.filter(owner=self.reader).exists()
+        )
+        data = self.get_feed()
+        self.assertEqual([obj["id"] for obj in data["objects"]], [post.id])
+
+    def test_author_back_under_threshold_keeps_merged_posts(self):
+        with self.settings(FEED_FANOUT_THRESHOLD=0):
+            merged = self.create_post(self.friend, "merged")
+        fanned_out = self.create_post(self.friend, "fanned out")
+        self.assertEqual(
+            HighFanoutAuthor.objects.get(user=self.friend).merged_before,
+            fanned_out.id,
+        )
+        self.assertEqual(
+            list(
+                FeedEntry.objects.filter(owner=self.reader).values_list(
+                    "post_id", flat=True
+                )
+            ),
+            [fanned_out.id],
+        )
+        data = self.get_feed()
+        self.assertEqual(
+            [obj["id"] for obj in data["objects"]], [fanned_out.id, merged.id]
+        )
+
+    def test_accept_backfills_both_timelines(self):
+        sender = create_user("sender")
+        sent = self.create_post(sender)
+        received = self.create_post(self.reader)
+        self.client.force_login(sender)
+        self.client.post(
+            "/api/v1/relationship/%s/send_friends/" % self.reader.id
+        )
+        self.client.force_login(self.reader)
+        self.client.post(
+            "/api/v1/relationship/%s/accept_friends/" % sender.id
+        )
+        self.assertEqual(
+            [obj["id"] for obj in self.get_feed()["objects"]],
+            [received.id, sent.id],
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(owner=sender, post=received).exists()
+        )
+
+    def test_accept_skips_posts_merged_on_read(self):
+        sender = create_user("sender")
+        post = self.create_post(sender)
+        HighFanoutAuthor.objects.create(user=sender)
+        self.client.force_login(sender)
+        self.client.post(
+            "/api/v1/relationship/%s/send_friends/" % self.reader.id
+        )
+        self.client.force_login(self.reader)
+        self.client.post(
+            "/api/v1/relationship/%s/accept_friends/" % sender.id
+        )
+        self.assertFalse(
+            FeedEntry.objects.filter(owner=self.reader, post=post).exists()
+        )
+        self.assertEqual(
+            [obj["id"] for obj in self.get_feed()["objects"]], [post.id]
+        )
+
+    def test_unfriend_prunes_timeline(self):
+        self.create_post(self.friend)
+        self.client.force_login(self.reader)
+        self.client.post(
+            "/api/v1/relationship/%s/un_friends/" % self.friend.id
+        )
+        self.assertEqual(self.get_feed()["objects"], [])
+
+    def test_blocked_friend_is_hidden(self):
+        sender = create_user("sender")
+        self.client.force_login(sender)
+        self.client.post(
+            "/api/v1/relationship/%s/send_friends/" % self.reader.id
+        )
+        self.client.force_login(self.reader)
+        for action in ("accept_friends", "block_friends"):
+            self.client.post(
+                "/api/v1/relationship/%s/%s/" % (sender.id, action)
+            )
+        self.client.logout()
+        self.assertFalse(
+            Relationship.objects.filter(
+                user_one=sender, is_friends=True
+            ).exists()
+        )
+        self.create_post(sender)
+        self.assertEqual(self.get_feed()["objects"], [])
@@ -1,23 +1,34 @@
+from django.conf import settings
 from django.conf.urls import url
+from django.db import IntegrityError, transaction
 
 # from django.contrib.auth.models import User
-from tastypie.resources import ModelResource
 from tastypie.authorization import Authorization
-from tastypie.authentication import ApiKeyAuthentication, Authentication
+from tastypie.authentication import Authentication
 
 # from tastypie.exceptions import BadRequest
 from tastypie import fields
+from ..account import friend_graph
 from ..account.apis import UserResource
 from ..account.models import Relationship
+from ..account.authentication import (
+    CachedApiKeyAuthentication,
+    signed_in_user_id,
+)
+from ..commons import fieldsets
 from ..commons.custom_exception import CustomBadRequest
-from .models import Post, Like, Comment
+from ..commons.paginator import CursorPaginator, IdCursorPaginator
+from ..commons.resources import BaseModelResource
+from ..feed import fanout
+from . import counters
+from .models import Post, Like, Comment, post_responses
 from .authorization import (
     UserPostObjectsOnlyAuthorization,
     UserCommentObjectsOnlyAuthorization,
 )
 
 
-class LikeResource(ModelResource):
+class LikeResource(BaseModelResource):
     author = fields.ForeignKey(UserResource, "author")
     # post = fields.ForeignKey(PostResource, 'post')
 
@@ -26,8 +37,10 @@ class LikeResource(ModelResource):
         resource_name = "likes"
         allowed_methods = ["get", "post"]
         include_resource_uri = False
-        authentication = ApiKeyAuthentication()
+        authentication = CachedApiKeyAuthentication()
         authorization = Authorization()
+        paginator_class = IdCursorPaginator
+        query_budget = 2
         always_return_data = True
 
     def prepend_urls(self):
@@ -47,44 +60,72 @@ class LikeResource(ModelResource):
         ]
 
 
-class CommentResource(ModelResource):
+class CommentResource(BaseModelResource):
     author = fields.ForeignKey(UserResource, "author", full=True)
     post = fields.ForeignKey(
         "source.post.apis.PostResource", "post", full=True
     )
+    created_at = fields.DateTimeField(attribute="created_at", readonly=True)
 
     class Meta:
         queryset = Comment.objects.all()
         resource_name = "comments"
         include_resource_uri = False
-        authentication = ApiKeyAuthentication()
+        authentication = CachedApiKeyAuthentication()
         authorization = UserCommentObjectsOnlyAuthorization()
+        paginator_class = CursorPaginator
+        # One more than the list itself for a cold block set of the reader.
+        query_budget = 4
         always_return_data = True
 
     def prepend_urls(self):
         return [
+            # Comments of one post, newest first, a cursor page at a time.
             url(
-                r"(?P<pk>[\w\d_.-]+)/commented/$",
+                r"^(?P<resource_name>%s)/post/(?P<post_id>\d+)/$"
+                % (self._meta.resource_name),
                 self.wrap_view("dispatch_list"),
-                name="api_dispatch_list",
+                name="api_post_comments",
             )
         ]
 
-    def obj_create(self, bundle, **kwargs):
-        post_id = bundle.request.resolver_match.kwargs["pk"]
-        post = Post.objects.get(id=post_id)
-        post.comments_count += 1
-        post.save()
-        return super(CommentResource, self).obj_create(
-            bundle, post_id=post_id, author=bundle.request.user
+    def obj_get_list(self, bundle, **kwargs):
+        post_id = kwargs.pop("post_id", None)
+        object_list = super(CommentResource, self).obj_get_list(
+            bundle, **kwargs
         )
+        if post_id is not None:
+            object_list = object_list.filter(post_id=post_id)
+        return object_list
+
+    def obj_create(self, bundle, **kwargs):
+        post_id = kwargs.get("post_id")
+        if post_id is None:
+            raise CustomBadRequest(
+                error_type="INVALID_OPERATOR",
+                error_message="Comment through /comments/post/<post_id>/",
+            )
+        try:
+            with transaction.atomic():
+                counters.increment(post_id, "comments_count")
+                return super(CommentResource, self).obj_create(
+                    bundle, post_id=post_id, author=bundle.request.user
+                )
+        except Post.DoesNotExist:
+            raise CustomBadRequest(error_message="Can not find this post")
+
+    def obj_delete(self, bundle, **kwargs):
+        with transaction.atomic():
+            super(CommentResource, self).obj_delete(bundle, **kwargs)
+            counters.increment(bundle.obj.post_id, "comments_count", -1)
 
 
-class PostResource(ModelResource):
+class PostResource(BaseModelResource):
     author = fields.ForeignKey(UserResource, "author", full=True)
-    list_comment = fields.ToManyField(
-        CommentResource, "post_commented", null=True
-    )
+    # The newest ``POST_LATEST_COMMENTS`` comments, the others are read
+    # from /comments/post/<id>/.
+    latest_comments = fields.ListField(readonly=True, null=True)
+    created_at = fields.DateTimeField(attribute="created_at", readonly=True)
 
     class Meta:
         queryset = Post.objects.all()
@@ -93,6 +134,12 @@ class PostResource(ModelResource):
         include_resource_uri = False
         authentication = Authentication()
         authorization = UserPostObjectsOnlyAuthorization()
+        paginator_class = CursorPaginator
+        response_cache = post_responses
+        read_from_replica = True
+        # The page and its latest comments, plus the session, the user and
+        # a cold block set for a signed in reader and the optional count.
+        query_budget = 6
         always_return_data = True
 
     def prepend_urls(self):
@@ -117,41 +164,72 @@ class PostResource(ModelResource):
             ),
         ]
 
+    def get_object_list(self, request):
+        object_list = super(PostResource, self).get_object_list(request)
+        if not fieldsets.current(request).includes("latest_comments"):
+            return object_list
+        hidden = ()
+        if getattr(request.user, "id", None) is not None:
+            hidden = friend_graph.blocked_ids(request.user.id)
+        return object_list.with_latest_comments(
+            settings.POST_LATEST_COMMENTS, hidden
+        )
+
+    def dehydrate_latest_comments(self, bundle):
+        comments = getattr(bundle.obj, "latest_comments", None)
+        if comments is None:
+            # Not loaded, as for a post nested in a comment.
+            return None
+        return [
+            {
+                "id": comment.id,
+                "text": comment.text,
+                "created_at": comment.created_at,
+                "author": {
+                    "id": comment.author_id,
+                    "username": comment.author_username,
+                },
+            }
+            for comment in comments
+        ]
+
     def like_post(self, request, **kwargs):
         self.method_check(request, allowed=["post"])
-        user_id = request.user.id
+        user_id = signed_in_user_id(request)
         if user_id is None:
             raise CustomBadRequest(
                 error_type="UNAUTHORIZED", error_message="Please signin first"
             )
         post_id = request.resolver_match.kwargs["pk"]
-        post = Post.objects.get(id=post_id)
-        if Like.objects.filter(author=user_id, post_id=post_id).exists():
+        try:
+            with transaction.atomic():
+                counters.increment(post_id, "like_count")
+                Like.objects.create(author_id=user_id, post_id=post_id)
+        except Post.DoesNotExist:
+            raise CustomBadRequest(error_message="Can not find this post")
+        except IntegrityError:
             raise CustomBadRequest(error_message="You liked this post")
-        if post is not None:
-            Like.objects.create(author_id=user_id, post_id=post_id)
-            post.like_count += 1
-            post.save()
 
         return self.create_response(request, {"success": True})
 
     def disliked_post(self, request, **kwargs):
         self.method_check(request, allowed=["post"])
-        user_id = request.user.id
+        user_id = signed_in_user_id(request)
         if user_id is None:
             raise CustomBadRequest(
                 error_type="UNAUTHORIZED", error_message="Please signin first"
             )
         post_id = request.resolver_match.kwargs["pk"]
-        post = Post.objects.get(id=post_id)
-        if post is not None:
-            if Like.objects.filter(author=user_id, post_id=post_id).exists():
-                liked = Like.objects.get(author=user_id, post_id=post_id)
-                liked.delete()
-            post.like_count -= 1
-            post.save()
-        else:
-            raise CustomBadRequest(error_message="Can not find this post")
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(
+                author=user_id, post_id=post_id
+            ).delete()
+            if deleted:
+                counters.increment(post_id, "like_count", -deleted)
+            elif not Post.objects.filter(id=post_id).exists():
+                raise CustomBadRequest(
+                    error_message="Can not find this post"
+                )
 
         return self.create_response(request, {"success": True})
 
@@ -165,6 +243,9 @@ class PostResource(ModelResource):
     #     return PostResource().get_list(request, author=user)
 
     def obj_create(self, bundle, **kwargs):
-        return super(PostResource, self).obj_create(
+        bundle = super(PostResource, self).obj_create(
             bundle, author=bundle.request.user
         )
+        bundle.obj.latest_comments = []
+        fanout.fan_out_post(bundle.obj)
+        return bundle
@@ -3,11 +3,30 @@ from __future__ import absolute_import
 # from django.contrib.auth.models import User
 from tastypie.authorization import Authorization
 from tastypie.exceptions import Unauthorized, BadRequest
+from ..account import friend_graph
 
 # from ...account.models import Relationship
 
 
-class UserPostObjectsOnlyAuthorization(Authorization):
+class HideBlockedAuthorsMixin(object):
+    """Drops objects written by users blocked by or blocking the reader."""
+
+    def read_list(self, object_list, bundle):
+        object_list = super(HideBlockedAuthorsMixin, self).read_list(
+            object_list, bundle
+        )
+        user_id = getattr(bundle.request.user, "id", None)
+        if user_id is None:
+            return object_list
+        blocked = friend_graph.blocked_ids(user_id)
+        if blocked:
+            object_list = object_list.exclude(author_id__in=blocked)
+        return object_list
+
+
+class UserPostObjectsOnlyAuthorization(
+    HideBlockedAuthorsMixin, Authorization
+):
     def update_list(self, object_list, bundle):
         raise Unauthorized("Sorry, no update by bundle.")
 
@@ -21,7 +40,9 @@ class UserPostObjectsOnlyAuthorization(Authorization):
         raise Unauthorized("Sorry, no deletes by bundle")
 
 
-class UserCommentObjectsOnlyAuthorization(Authorization):
+class UserCommentObjectsOnlyAuthorization(
+    HideBlockedAuthorsMixin, Authorization
+):
     pass
     # def read_list(self, object_list, bundle):
     #     print(bundle.request.user)
@@ -0,0 +1,66 @@
+"""
+Denormalized ``Post`` counters.
+
+Counters are only ever changed with a single ``UPDATE ... SET col = col + n``
+so concurrent likes and comments can't lose updates, and no other column of
+the post is rewritten. ``reconcile`` rebuilds them from ``Like`` and
+``Comment`` when they drift.
+"""
+from __future__ import absolute_import
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Post, Like, Comment, post_responses
+
+COUNTER_FIELDS = ("like_count", "comments_count", "watchers_count")
+
+
+def increment(post_id, field, delta=1):
+    """
+    Atomically adds ``delta`` to ``field`` of the post ``post_id``.
+
+    Raises ``Post.DoesNotExist`` when there is no such post.
+    """
+    if field not in COUNTER_FIELDS:
+        raise ValueError("Unknown post counter '%s'" % field)
+    updated = Post.objects.filter(pk=post_id).update(
+        **{field: F(field) + delta}
+    )
+    if not updated:
+        raise Post.DoesNotExist("Post %s does not exist" % post_id)
+    post_responses.invalidate(post_id)
+
+
+def _count_of(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(post_id=OuterRef("pk"))
+            .order_by()
+            .values("post_id")
+            .annotate(total=Count("id"))
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile(batch_size=1000):
+    """
+    Recomputes ``like_count`` and ``comments_count`` of every post from
+    ``Like`` and ``Comment``, one ``UPDATE`` per ``batch_size`` posts.
+
+    Returns the number of posts visited.
+    """
+    post_ids = Post.objects.order_by("pk").values_list("pk", flat=True)
+    visited = 0
+    last_id = 0
+    while True:
+        batch = list(post_ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            post_responses.invalidate_all()
+            return visited
+        Post.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).update(
+            like_count=_count_of(Like), comments_count=_count_of(Comment)
+        )
+        visited += len(batch)
+        last_id = batch[-1]
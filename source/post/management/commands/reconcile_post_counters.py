@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from ...counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recomputes Post.like_count and Post.comments_count in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of posts updated per UPDATE statement.",
+        )
+
+    def handle(self, *args, **options):
+        visited = reconcile(batch_size=options["batch_size"])
+        self.stdout.write("Reconciled counters of %d posts." % visited)
@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def dedup_likes(apps, schema_editor):
+    """Keep the first like of each (author, post) pair, fixing like_count."""
+    Like = apps.get_model("post", "Like")
+    Post = apps.get_model("post", "Post")
+    duplicates = (
+        Like.objects.values("author_id", "post_id")
+        .annotate(rows=Count("id"), keep_id=Min("id"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for pair in duplicates.iterator():
+        deleted, _ = Like.objects.filter(
+            author_id=pair["author_id"], post_id=pair["post_id"]
+        ).exclude(id=pair["keep_id"]).delete()
+        Post.objects.filter(id=pair["post_id"]).update(
+            like_count=F("like_count") - deleted
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedup_likes, migrations.RunPython.noop),
+    ]
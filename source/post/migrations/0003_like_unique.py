@@ -0,0 +1,25 @@
+# Generated by Django 2.0.5 on 2026-10-18 16:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('post', '0002_dedup_likes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='like',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='author_liked', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together={('author', 'post')},
+        ),
+    ]
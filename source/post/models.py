@@ -1,8 +1,47 @@
-from django.db import models
+from django.db import connections, models
 from django.contrib.auth.models import User
+from django.db.models import signals
+from django.utils import timezone
+from ..commons.response_cache import ResponseCache
 
 # Create your models here.
 
+# Posts whose latest comments are read by one query, below the 999 bound
+# parameters SQLite allows.
+LATEST_COMMENTS_BATCH_SIZE = 500
+
+
+class PostQuerySet(models.QuerySet):
+    """
+    Posts that can come with their latest comments, loaded for every post
+    fetched by one query, like ``prefetch_related`` does.
+    """
+
+    _latest_comments = None
+
+    def with_latest_comments(self, count, hidden_author_ids=()):
+        """
+        Sets ``latest_comments`` on each post to its ``count`` newest
+        comments, leaving out those of ``hidden_author_ids``.
+        """
+        clone = self._chain()
+        clone._latest_comments = (count, frozenset(hidden_author_ids))
+        return clone
+
+    def _clone(self):
+        clone = super(PostQuerySet, self)._clone()
+        clone._latest_comments = self._latest_comments
+        return clone
+
+    def _fetch_all(self):
+        loaded = self._result_cache is not None
+        super(PostQuerySet, self)._fetch_all()
+        if not loaded and self._latest_comments and self._result_cache:
+            posts = [
+                post for post in self._result_cache if isinstance(post, Post)
+            ]
+            attach_latest_comments(posts, *self._latest_comments)
+
 
 class Post(models.Model):
     title = models.CharField(max_length=255)
@@ -15,19 +54,33 @@ class Post(models.Model):
     comments_count = models.IntegerField(default=0)
     like_count = models.IntegerField(default=0)
     watchers_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'],
+                         name='post_created_idx'),
+        ]
 
     def __str__(self):
         return '{} - Post of {}'.format(str(self.title), str(self.author.username))
 
 
 class Like(models.Model):
+    # Served by the (author, post) unique index.
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
-                               related_name='author_liked')
+                               related_name='author_liked',
+                               db_index=False)
     post = models.ForeignKey(Post,
                              on_delete=models.CASCADE,
                              related_name='post_liked')
 
+    class Meta:
+        unique_together = ('author', 'post')
+
     def __str__(self):
         return '{} liked {}'.format(str(self.author.last_name), str(self.post.title))
 
@@ -40,6 +93,105 @@ class Comment(models.Model):
     post = models.ForeignKey(Post,
                              on_delete=models.CASCADE,
                              related_name='post_commented')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'],
+                         name='comment_created_idx'),
+            # Newest comments of a post, for previews and per post pages.
+            models.Index(fields=['post', '-created_at', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return 'Comment by {}'.format(str(self.author.username))
+
+
+def supports_window_functions(connection):
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 25, 0)
+    return connection.vendor in ('postgresql', 'oracle')
+
+
+def attach_latest_comments(posts, count, hidden_author_ids=()):
+    """
+    Sets ``latest_comments`` on each of ``posts`` to its ``count`` newest
+    comments, newest first, with one query per ``LATEST_COMMENTS_BATCH_SIZE``
+    posts. Each comment carries its author's username as
+    ``author_username``.
+    """
+    for post in posts:
+        post.latest_comments = []
+    by_id = {post.pk: post for post in posts}
+    post_ids = list(by_id)
+    for start in range(0, len(post_ids), LATEST_COMMENTS_BATCH_SIZE):
+        comments = latest_comments(
+            post_ids[start:start + LATEST_COMMENTS_BATCH_SIZE],
+            count,
+            hidden_author_ids,
+        )
+        for comment in comments:
+            by_id[comment.post_id].latest_comments.append(comment)
+
+
+def latest_comments(post_ids, count, hidden_author_ids):
+    connection = connections[Comment.objects.db]
+    qn = connection.ops.quote_name
+    comment = Comment._meta.db_table
+    params = list(post_ids)
+    where = '%s.%s IN (%s)' % (
+        qn('c'), qn('post_id'), ', '.join(['%s'] * len(params)),
+    )
+    # Hidden authors are written as integer literals rather than bound, a
+    # long block list must not run into the database's parameter limit.
+    hidden = ', '.join(str(int(pk)) for pk in sorted(hidden_author_ids))
+    if hidden:
+        where += ' AND %s.%s NOT IN (%s)' % (qn('c'), qn('author_id'), hidden)
+    columns = 'c.*, u.%s AS %s' % (qn('username'), qn('author_username'))
+    tables = '%s c INNER JOIN %s u ON u.%s = c.%s' % (
+        qn(comment), qn(User._meta.db_table), qn('id'), qn('author_id'),
+    )
+    if supports_window_functions(connection):
+        sql = (
+            'SELECT * FROM (SELECT %s, ROW_NUMBER() OVER ('
+            'PARTITION BY c.%s ORDER BY c.%s DESC, c.%s DESC) AS %s '
+            'FROM %s WHERE %s) ranked WHERE %s <= %%s' % (
+                columns, qn('post_id'), qn('created_at'), qn('id'),
+                qn('comment_rank'), tables, where, qn('comment_rank'),
+            )
+        )
+    else:
+        # Counts the newer comments of the same post instead, served by
+        # the (post, created_at, id) index.
+        newer = (
+            'SELECT COUNT(*) FROM %s n WHERE n.%s = c.%s AND (n.%s > c.%s '
+            'OR (n.%s = c.%s AND n.%s > c.%s))' % (
+                qn(comment), qn('post_id'), qn('post_id'),
+                qn('created_at'), qn('created_at'),
+                qn('created_at'), qn('created_at'), qn('id'), qn('id'),
+            )
+        )
+        if hidden:
+            newer += ' AND n.%s NOT IN (%s)' % (qn('author_id'), hidden)
+        sql = 'SELECT %s FROM %s WHERE %s AND (%s) < %%s' % (
+            columns, tables, where, newer,
+        )
+    params.append(count)
+    return sorted(
+        Comment.objects.raw(sql, params),
+        key=lambda comment: (comment.created_at, comment.pk),
+        reverse=True,
+    )
+
+
+# Anonymous PostResource reads, invalidated by every change to a post.
+post_responses = ResponseCache("posts")
+
+
+def invalidate_post_responses(sender, instance, **kwargs):
+    post_responses.invalidate(instance.pk)
+
+
+signals.post_save.connect(invalidate_post_responses, sender=Post)
+signals.post_delete.connect(invalidate_post_responses, sender=Post)
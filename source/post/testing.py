@@ -0,0 +1,14 @@
+"""Helpers shared by the test modules of the apps."""
+from __future__ import absolute_import
+from .models import Post
+
+
+def create_post(author, **kwargs):
+    return Post.objects.create(
+        author=author,
+        title=kwargs.pop("title", "title"),
+        content="content",
+        image_path="",
+        image_title="",
+        **kwargs
+    )
@@ -1,3 +1,491 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from todo_social_app.urls import v1_api
+from ..account.testing import create_user
+from ..commons.custom_exception import CustomBadRequest
+from ..commons import resources, routers
+from ..commons.resources import QueryBudgetExceeded
+from ..commons.serializers import ENCODERS, FastJSONSerializer
+from .models import Post, Like, Comment, post_responses
+from .testing import create_post
 
-# Create your tests here.
+
+class PostCounterTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user("liker")
+        self.post = create_post(self.user)
+        self.client.force_login(self.user)
+
+    def test_like_and_dislike_update_like_count(self):
+        response = self.client.post("/api/v1/posts/%s/liked/" % self.post.id)
+        self.assertEqual(response.status_code, 200)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+        self.client.post("/api/v1/posts/%s/disliked/" % self.post.id)
+        self.client.post("/api/v1/posts/%s/disliked/" % self.post.id)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_like_only_touches_the_counter_column(self):
+        Post.objects.filter(pk=self.post.pk).update(title="changed")
+        self.client.post("/api/v1/posts/%s/liked/" % self.post.id)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.title, "changed")
+
+    def test_like_missing_post(self):
+        response = self.client.post("/api/v1/posts/999/liked/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Like.objects.exists())
+
+    def test_comment_updates_comments_count(self):
+        response = self.client.post(
+            "/api/v1/comments/post/%s/?username=%s&api_key=%s"
+            % (self.post.id, self.user.username, self.user.api_key.key),
+            json.dumps({"text": "nice"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_comment_on_missing_post(self):
+        response = self.client.post(
+            "/api/v1/comments/post/999/?username=%s&api_key=%s"
+            % (self.user.username, self.user.api_key.key),
+            json.dumps({"text": "nice"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_reconcile_post_counters(self):
+        other = create_post(self.user)
+        Like.objects.create(author=self.user, post=self.post)
+        Comment.objects.create(author=self.user, post=self.post, text="a")
+        Comment.objects.create(author=self.user, post=self.post, text="b")
+        Post.objects.update(like_count=7, comments_count=7)
+
+        call_command(
+            "reconcile_post_counters", batch_size=1, stdout=StringIO()
+        )
+
+        self.post.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(
+            (self.post.like_count, self.post.comments_count), (1, 2)
+        )
+        self.assertEqual((other.like_count, other.comments_count), (0, 0))
+
+    def test_like_twice(self):
+        self.client.post("/api/v1/posts/%s/liked/" % self.post.id)
+        response = self.client.post("/api/v1/posts/%s/liked/" % self.post.id)
+        self.assertEqual(response.status_code, 400)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+
+@override_settings(API_QUERY_BUDGET_ENFORCED=True)
+class PostQueryBudgetTestCase(TestCase):
+    def setUp(self):
+        self.users = [create_user("user%d" % i) for i in range(3)]
+        self.posts = [create_post(self.users[i % 3]) for i in range(20)]
+        for post in self.posts:
+            for user in self.users:
+                Like.objects.create(author=user, post=post)
+                Comment.objects.create(author=user, post=post, text="a")
+        self.auth = {
+            "username": self.users[0].username,
+            "api_key": self.users[0].api_key.key,
+        }
+
+    def test_lists_stay_within_budget(self):
+        for url, params in (
+            ("/api/v1/posts/", {}),
+            ("/api/v1/posts/%s/" % self.posts[0].id, {}),
+            ("/api/v1/comments/", self.auth),
+            ("/api/v1/likes/", self.auth),
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_going_over_budget_fails(self):
+        meta = v1_api._registry["posts"]._meta
+        with mock.patch.object(meta, "query_budget", 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/v1/posts/")
+
+    def test_every_database_counts(self):
+        meta = v1_api._registry["posts"]._meta
+        # The page and its comments, seen once more on a second database.
+        with mock.patch.object(meta, "query_budget", 3), mock.patch.object(
+            resources.connections, "all", return_value=[connection] * 2
+        ):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/v1/posts/")
+
+
+class LatestCommentsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user("author")
+        self.posts = [create_post(self.author) for _ in range(3)]
+        now = timezone.now()
+        for post in self.posts[:2]:
+            for i in range(5):
+                Comment.objects.create(
+                    author=self.author,
+                    post=post,
+                    text="%s-%d" % (post.id, i),
+                    created_at=now + timedelta(seconds=i),
+                )
+        self.auth = {"username": "author", "api_key": self.author.api_key.key}
+
+    def expected(self, post, count=3):
+        return ["%s-%d" % (post.id, i) for i in range(4, 4 - count, -1)]
+
+    def test_posts_embed_latest_comments(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/v1/posts/")
+        posts = {
+            post["id"]: post
+            for post in json.loads(response.content.decode())["objects"]
+        }
+        for post in self.posts[:2]:
+            comments = posts[post.id]["latest_comments"]
+            self.assertEqual(
+                [comment["text"] for comment in comments],
+                self.expected(post),
+            )
+            self.assertEqual(comments[0]["author"]["username"], "author")
+        self.assertEqual(posts[self.posts[2].id]["latest_comments"], [])
+
+    def test_correlated_count_fallback(self):
+        with mock.patch(
+            "source.post.models.supports_window_functions", return_value=False
+        ):
+            post = Post.objects.with_latest_comments(2).get(
+                pk=self.posts[0].pk
+            )
+        self.assertEqual(
+            [comment.text for comment in post.latest_comments],
+            self.expected(self.posts[0], 2),
+        )
+
+    def test_blocked_authors_are_left_out(self):
+        Comment.objects.create(
+            author=create_user("blocked"), post=self.posts[0], text="x"
+        )
+        post = Post.objects.with_latest_comments(3, {self.author.id}).get(
+            pk=self.posts[0].pk
+        )
+        self.assertEqual(
+            [comment.text for comment in post.latest_comments], ["x"]
+        )
+
+    def test_many_posts_and_blocked_authors(self):
+        Post.objects.bulk_create(
+            Post(author=self.author, title="t", content="c")
+            for _ in range(1200)
+        )
+        hidden = set(range(10000, 12000))
+        posts = {
+            post.id: post
+            for post in Post.objects.with_latest_comments(3, hidden)
+        }
+        self.assertEqual(len(posts), 1203)
+        comments = posts[self.posts[0].id].latest_comments
+        self.assertEqual(
+            [comment.text for comment in comments],
+            self.expected(self.posts[0]),
+        )
+
+    def test_comments_of_a_post_are_paginated(self):
+        url = "/api/v1/comments/post/%s/" % self.posts[0].id
+        data = json.loads(
+            self.client.get(url, dict(self.auth, limit=2)).content.decode()
+        )
+        texts = [comment["text"] for comment in data["objects"]]
+        data = json.loads(
+            self.client.get(
+                url, dict(self.auth, limit=10, cursor=data["meta"]["next"])
+            ).content.decode()
+        )
+        texts += [comment["text"] for comment in data["objects"]]
+        self.assertEqual(texts, self.expected(self.posts[0], 5))
+        self.assertIsNone(data["meta"]["next"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTestCase(TestCase):
+    def test_only_gets_read_from_replicas(self):
+        user = create_user("reader")
+        self.client.force_login(user)
+        with mock.patch.object(routers, "replica_reads") as replica_reads:
+            self.client.get("/api/v1/posts/")
+            self.client.post(
+                "/api/v1/posts/",
+                json.dumps({"title": "t", "content": "c", "image_path": "",
+                            "image_title": ""}),
+                content_type="application/json",
+            )
+        self.assertEqual(replica_reads.call_count, 1)
+
+
+class SerializerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = create_user("author")
+        for i in range(5):
+            create_post(author, title="bài %d" % i)
+
+    def test_only_json_is_served(self):
+        response = self.client.get("/api/v1/posts/", {"format": "xml"})
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(len(json.loads(response.content)["objects"]), 5)
+
+    def test_large_lists_are_streamed(self):
+        rendered = self.client.get("/api/v1/posts/").content
+        cache.clear()
+        with override_settings(API_STREAM_MIN_OBJECTS=3):
+            response = self.client.get("/api/v1/posts/")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), rendered)
+
+    def test_encoders_agree(self):
+        data = {
+            "meta": {"next": None, "total_count": 2},
+            "objects": [{"title": "bài/1", "id": 1}, {"id": 2, "b": 1.5}],
+        }
+        expected = FastJSONSerializer("json").to_json(data)
+        self.assertEqual(json.loads(expected.decode()), data)
+        for name in ENCODERS:
+            serializer = FastJSONSerializer(name)
+            self.assertEqual(serializer.to_json(data), expected, name)
+            self.assertEqual(
+                b"".join(serializer.stream(data, chunk_size=1)), expected
+            )
+
+    def test_error_payloads(self):
+        for error in (
+            CustomBadRequest("INVALID_DATA"),
+            CustomBadRequest("MISSING_FIELD", field="title", obj="Post"),
+            CustomBadRequest("UNKNOWNERROR", error_message="Gãy"),
+            CustomBadRequest(),
+        ):
+            self.assertEqual(
+                json.loads(error.response.content.decode()), error._response
+            )
+
+
+class PostFieldsetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = create_user("author")
+        self.post = create_post(self.author)
+        Comment.objects.create(author=self.author, post=self.post, text="a")
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode())
+        return data["objects"], [query["sql"] for query in queries]
+
+    def test_fields_skip_joins_and_prefetches(self):
+        posts, queries = self.get("/api/v1/posts/", fields="id,title")
+        self.assertEqual(posts, [{"id": self.post.id, "title": "title"}])
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("auth_user", queries[0])
+        self.assertNotIn("content", queries[0])
+
+    def test_nested_fields(self):
+        posts, queries = self.get(
+            "/api/v1/posts/", fields="title,author.username"
+        )
+        self.assertEqual(
+            posts, [{"title": "title", "author": {"username": "author"}}]
+        )
+        self.assertNotIn("account_profile", queries[0])
+        self.assertNotIn("email", queries[0])
+
+    def test_expand(self):
+        posts, _ = self.get("/api/v1/posts/", expand="")
+        self.assertEqual(
+            posts[0]["author"], "/api/v1/auth/users/%s/" % self.author.id
+        )
+        posts, _ = self.get("/api/v1/posts/", expand="author")
+        self.assertEqual(posts[0]["author"]["username"], "author")
+        self.assertNotIn("profile", posts[0]["author"])
+        posts, _ = self.get("/api/v1/posts/", expand="author.profile")
+        self.assertIn("photo_url", posts[0]["author"]["profile"])
+
+    def test_unknown_fields(self):
+        response = self.client.get("/api/v1/posts/", {"fields": "bogus"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_comment_fields(self):
+        auth = {"username": "author", "api_key": self.author.api_key.key}
+        comments, queries = self.get(
+            "/api/v1/comments/", fields="text", **auth
+        )
+        self.assertEqual(comments, [{"text": "a"}])
+        listed = [sql for sql in queries if "post_comment" in sql][-1]
+        self.assertNotIn("post_post", listed)
+
+
+class CursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user("author")
+        self.posts = [create_post(self.user) for i in range(5)]
+        # Same timestamp everywhere so only the id breaks ties.
+        Post.objects.update(created_at=self.posts[0].created_at)
+
+    def get_page(self, **params):
+        response = self.client.get("/api/v1/posts/", params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode("utf-8"))
+
+    def test_pages_newest_first(self):
+        seen = []
+        params = {"limit": 2}
+        while True:
+            data = self.get_page(**params)
+            seen.extend(obj["id"] for obj in data["objects"])
+            if data["meta"]["next"] is None:
+                break
+            params["cursor"] = data["meta"]["next"]
+        self.assertEqual(seen, [post.id for post in reversed(self.posts)])
+
+    def test_total_count_is_optional(self):
+        self.assertNotIn("total_count", self.get_page()["meta"])
+        self.assertEqual(self.get_page(count=1)["meta"]["total_count"], 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/v1/posts/", {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+class PostResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        post_responses.stats.reset()
+        self.user = create_user("author")
+        self.post = create_post(self.user)
+        self.url = "/api/v1/posts/%s/" % self.post.id
+
+    def test_anonymous_reads_are_cached(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(post_responses.stats.snapshot()["hit_ratio"], 0.5)
+        body = self.client.get("/metrics").content.decode("utf-8")
+        self.assertIn(
+            'api_response_cache_hit_ratio{cache="%s"} 0.5'
+            % post_responses.namespace,
+            body,
+        )
+        self.assertIn(
+            'api_response_cache_requests_total{cache="%s",outcome="hit"} 1'
+            % post_responses.namespace,
+            body,
+        )
+
+    def test_format_is_part_of_the_key(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url, {"format": "xml"})
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        for if_none_match, status_code in (
+            ('"other", W/%s' % etag, 304),
+            ("*", 304),
+            ('"other"', 200),
+            ('"x%s"' % etag, 200),
+        ):
+            response = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=if_none_match
+            )
+            self.assertEqual(response.status_code, status_code, if_none_match)
+
+    def test_like_invalidates_list_and_detail(self):
+        self.client.get(self.url)
+        self.client.get("/api/v1/posts/")
+        self.client.force_login(self.user)
+        self.client.post("/api/v1/posts/%s/liked/" % self.post.id)
+        self.client.logout()
+        for url in (self.url, "/api/v1/posts/"):
+            response = self.client.get(url)
+            self.assertEqual(response["X-Cache"], "MISS")
+        data = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(data["objects"][0]["like_count"], 1)
+
+    def test_other_posts_stay_cached(self):
+        other = create_post(self.user)
+        self.client.get(self.url)
+        other.title = "changed"
+        other.save()
+        self.assertEqual(self.client.get(self.url)["X-Cache"], "HIT")
+
+    def test_authenticated_reads_bypass_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(self.user)
+        self.assertFalse(self.client.get(self.url).has_header("X-Cache"))
+
+
+class BlockedAuthorsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me = create_user("me")
+        self.other = create_user("other")
+        self.post = create_post(self.other)
+        create_post(self.me)
+        Comment.objects.create(author=self.other, post=self.post, text="a")
+        self.client.force_login(self.me)
+
+    def authors(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode("utf-8"))
+        return [obj["author"]["username"] for obj in data["objects"]]
+
+    def block(self):
+        self.client.post(
+            "/api/v1/relationship/%s/block_friends/" % self.other.id
+        )
+
+    def test_block_hides_posts_of_blocked_user(self):
+        self.assertEqual(self.authors("/api/v1/posts/"), ["me", "other"])
+        self.block()
+        self.assertEqual(self.authors("/api/v1/posts/"), ["me"])
+
+    def test_blocked_user_no_longer_sees_blocker(self):
+        self.block()
+        self.client.force_login(self.other)
+        self.assertEqual(self.authors("/api/v1/posts/"), ["other"])
+
+    def test_block_hides_comments(self):
+        auth = {"username": "me", "api_key": self.me.api_key.key}
+        self.assertEqual(self.authors("/api/v1/comments/", auth), ["other"])
+        self.block()
+        self.assertEqual(self.authors("/api/v1/comments/", auth), [])
+
+    def test_anonymous_reads_are_not_filtered(self):
+        self.block()
+        self.client.logout()
+        self.assertEqual(len(self.authors("/api/v1/posts/")), 2)
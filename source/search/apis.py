@@ -0,0 +1,92 @@
+from tastypie.authorization import ReadOnlyAuthorization
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
+from ..account import friend_graph
+from ..account.authentication import CachedApiKeyAuthentication
+from ..commons.custom_exception import CustomBadRequest
+from ..commons.resources import BaseResource
+from ..post.apis import CommentResource, PostResource
+from . import backends
+from .models import SearchEntry
+
+
+class SearchResource(BaseResource):
+    """Posts and comments matching ``q``, best matches first."""
+
+    resources = {
+        SearchEntry.POST: PostResource(),
+        SearchEntry.COMMENT: CommentResource(),
+    }
+
+    class Meta:
+        resource_name = "search"
+        list_allowed_methods = ["get"]
+        detail_allowed_methods = []
+        include_resource_uri = False
+        authentication = CachedApiKeyAuthentication()
+        authorization = ReadOnlyAuthorization()
+        limit = 20
+        max_limit = 100
+
+    def get_list(self, request, **kwargs):
+        query = request.GET.get("q", "").strip()
+        if not query:
+            raise CustomBadRequest(
+                error_type="MISSING_FIELD", field="q", obj="search"
+            )
+        kind = request.GET.get("type") or None
+        if kind is not None and kind not in self.resources:
+            raise BadRequest("Invalid type '%s' provided." % kind)
+        paginator = Paginator(
+            request.GET,
+            [],
+            limit=self._meta.limit,
+            max_limit=self._meta.max_limit,
+        )
+        limit, offset = paginator.get_limit(), paginator.get_offset()
+
+        hits = backends.search(
+            query,
+            kind=kind,
+            exclude_authors=friend_graph.blocked_ids(request.user.id),
+            limit=limit + 1,
+            offset=offset,
+        )
+        next_offset = None
+        if len(hits) > limit:
+            hits = hits[:limit]
+            next_offset = offset + limit
+
+        found = {}
+        for hit_kind, resource in self.resources.items():
+            ids = [hit.object_id for hit in hits if hit.kind == hit_kind]
+            if ids:
+                objects = resource.get_object_list(request)
+                found[hit_kind] = objects.in_bulk(ids)
+        objects = []
+        for hit in hits:
+            obj = found.get(hit.kind, {}).get(hit.object_id)
+            if obj is None:
+                continue
+            resource = self.resources[hit.kind]
+            objects.append(
+                {
+                    "type": hit.kind,
+                    "rank": hit.rank,
+                    "object": resource.full_dehydrate(
+                        resource.build_bundle(obj=obj, request=request),
+                        for_list=True,
+                    ),
+                }
+            )
+        return self.create_response(
+            request,
+            {
+                "meta": {
+                    "limit": limit,
+                    "offset": offset,
+                    "next": next_offset,
+                },
+                "objects": objects,
+            },
+        )
@@ -0,0 +1,116 @@
+"""
+Ranked full-text queries over ``SearchEntry``.
+
+``search`` uses the FTS5 table on sqlite and the GIN indexed tsvector on
+Postgres, both created by ``migrations/0002_fulltext_index``, and falls
+back to unranked ``LIKE`` scans on any other database.
+"""
+from __future__ import absolute_import
+import re
+from collections import namedtuple
+from django.db import connection
+from django.db.models import Q
+from .models import SearchEntry
+
+Hit = namedtuple("Hit", "kind object_id post_id rank")
+
+# Title matches count this many times more than body matches.
+TITLE_WEIGHT = 10.0
+
+POSTGRES_DOCUMENT = (
+    "(setweight(to_tsvector('english', title), 'A') "
+    "|| setweight(to_tsvector('english', body), 'B'))"
+)
+
+
+def terms(query):
+    return re.findall(r"\w+", query)
+
+
+def filters(kind, exclude_authors, alias):
+    sql, params = [], []
+    if kind:
+        sql.append("%s.kind = %%s" % alias)
+        params.append(kind)
+    if exclude_authors:
+        sql.append(
+            "%s.author_id NOT IN (%s)"
+            % (alias, ", ".join(["%s"] * len(exclude_authors)))
+        )
+        params.extend(exclude_authors)
+    return "".join(" AND " + part for part in sql), params
+
+
+def search_sqlite(words, kind, exclude_authors, limit, offset):
+    # Quoting every term keeps FTS5 operators in the input literal, the
+    # terms are then ANDed together.
+    match = " ".join('"%s"' % word for word in words)
+    extra, params = filters(kind, exclude_authors, "entry")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT entry.kind, entry.object_id, entry.post_id, "
+            "bm25(search_fts, %s, 1.0) AS score "
+            "FROM search_fts "
+            "JOIN search_searchentry entry ON entry.id = search_fts.rowid "
+            "WHERE search_fts MATCH %s" + extra + " "
+            "ORDER BY score, entry.id DESC LIMIT %s OFFSET %s",
+            [TITLE_WEIGHT, match] + params + [limit, offset],
+        )
+        # bm25 is lower for better matches.
+        return [Hit(*row[:3], rank=-row[3]) for row in cursor.fetchall()]
+
+
+def search_postgresql(words, kind, exclude_authors, limit, offset):
+    extra, params = filters(kind, exclude_authors, "entry")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT entry.kind, entry.object_id, entry.post_id, "
+            "ts_rank(%(document)s, query, 1) AS score "
+            "FROM search_searchentry entry, "
+            "plainto_tsquery('english', %%s) query "
+            "WHERE %(document)s @@ query" % {"document": POSTGRES_DOCUMENT}
+            + extra
+            + " ORDER BY score DESC, entry.id DESC LIMIT %s OFFSET %s",
+            [" ".join(words)] + params + [limit, offset],
+        )
+        return [Hit(*row) for row in cursor.fetchall()]
+
+
+def search_fallback(words, kind, exclude_authors, limit, offset):
+    entries = SearchEntry.objects.all()
+    for word in words:
+        entries = entries.filter(
+            Q(title__icontains=word) | Q(body__icontains=word)
+        )
+    if kind:
+        entries = entries.filter(kind=kind)
+    if exclude_authors:
+        entries = entries.exclude(author_id__in=exclude_authors)
+    rows = entries.order_by("-id").values_list(
+        "kind", "object_id", "post_id"
+    )[offset:offset + limit]
+    return [Hit(*row, rank=None) for row in rows]
+
+
+BACKENDS = {
+    "sqlite": search_sqlite,
+    "postgresql": search_postgresql,
+}
+
+
+def search(query, kind=None, exclude_authors=(), limit=20, offset=0):
+    """Best matches of ``query`` first, as a list of ``Hit``."""
+    words = terms(query)
+    if not words:
+        return []
+    backend = BACKENDS.get(connection.vendor, search_fallback)
+    return backend(words, kind, list(exclude_authors), limit, offset)
+
+
+def optimize():
+    """Merges the index segments after a bulk reindex, where supported."""
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO search_fts(search_fts) VALUES ('optimize')"
+            )
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ....post.models import Post, Comment
+from ...backends import optimize
+from ...models import SearchEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the search index of every post and comment."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of entries written per INSERT statement.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        posts = (
+            SearchEntry(
+                kind=SearchEntry.POST,
+                object_id=pk,
+                post_id=pk,
+                author_id=author_id,
+                title=title,
+                body=content,
+            )
+            for pk, author_id, title, content in Post.objects.values_list(
+                "pk", "author_id", "title", "content"
+            ).iterator()
+        )
+        comments = (
+            SearchEntry(
+                kind=SearchEntry.COMMENT,
+                object_id=pk,
+                post_id=post_id,
+                author_id=author_id,
+                body=text,
+            )
+            for pk, post_id, author_id, text in Comment.objects.values_list(
+                "pk", "post_id", "author_id", "text"
+            ).iterator()
+        )
+        indexed = 0
+        with transaction.atomic():
+            SearchEntry.objects.all().delete()
+            for entries in (posts, comments):
+                batch = []
+                for entry in entries:
+                    batch.append(entry)
+                    if len(batch) == batch_size:
+                        SearchEntry.objects.bulk_create(batch)
+                        indexed += len(batch)
+                        batch = []
+                SearchEntry.objects.bulk_create(batch)
+                indexed += len(batch)
+        optimize()
+        self.stdout.write("Indexed %d posts and comments." % indexed)
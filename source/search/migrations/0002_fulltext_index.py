@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# Keep the Postgres document in step with ``backends.POSTGRES_DOCUMENT``.
+FULLTEXT_SQL = {
+    "sqlite": (
+        [
+            "CREATE VIRTUAL TABLE search_fts USING fts5("
+            "title, body, content='search_searchentry', content_rowid='id')",
+            "CREATE TRIGGER search_fts_insert AFTER INSERT ON "
+            "search_searchentry BEGIN "
+            "INSERT INTO search_fts(rowid, title, body) "
+            "VALUES (new.id, new.title, new.body); END",
+            "CREATE TRIGGER search_fts_delete AFTER DELETE ON "
+            "search_searchentry BEGIN "
+            "INSERT INTO search_fts(search_fts, rowid, title, body) "
+            "VALUES ('delete', old.id, old.title, old.body); END",
+            "CREATE TRIGGER search_fts_update AFTER UPDATE ON "
+            "search_searchentry BEGIN "
+            "INSERT INTO search_fts(search_fts, rowid, title, body) "
+            "VALUES ('delete', old.id, old.title, old.body); "
+            "INSERT INTO search_fts(rowid, title, body) "
+            "VALUES (new.id, new.title, new.body); END",
+        ],
+        [
+            "DROP TRIGGER search_fts_update",
+            "DROP TRIGGER search_fts_delete",
+            "DROP TRIGGER search_fts_insert",
+            "DROP TABLE search_fts",
+        ],
+    ),
+    "postgresql": (
+        [
+            "CREATE INDEX search_document_idx ON search_searchentry "
+            "USING GIN ((setweight(to_tsvector('english', title), 'A') "
+            "|| setweight(to_tsvector('english', body), 'B')))",
+        ],
+        ["DROP INDEX search_document_idx"],
+    ),
+}
+
+
+def run(index):
+    def operation(apps, schema_editor):
+        statements = FULLTEXT_SQL.get(schema_editor.connection.vendor)
+        for sql in statements[index] if statements else ():
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index over ``SearchEntry``: an external content FTS5 table
+    kept in sync by triggers on sqlite, a GIN index over the weighted
+    tsvector on Postgres. Other databases fall back to ``LIKE`` scans.
+    """
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(0), run(1)),
+    ]
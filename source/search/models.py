@@ -0,0 +1,88 @@
+from django.db import models
+from django.db.models import signals
+from django.contrib.auth.models import User
+from ..post.models import Post, Comment
+
+
+class SearchEntry(models.Model):
+    """
+    Searchable text of one post or comment.
+
+    The full-text index over ``title`` and ``body`` is maintained by the
+    database itself (see ``backends``), this table only has to follow the
+    posts and comments.
+    """
+
+    POST = "post"
+    COMMENT = "comment"
+    KIND_CHOICES = ((POST, "Post"), (COMMENT, "Comment"))
+
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    # The post itself or the commented post, so both go with the post.
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+"
+    )
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ("kind", "object_id")
+
+    def __str__(self):
+        return "%s %s" % (self.kind, self.object_id)
+
+
+def index_post(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields and not {"title", "content"} & set(update_fields):
+        return
+    values = {
+        "post_id": instance.pk,
+        "author_id": instance.author_id,
+        "title": instance.title,
+        "body": instance.content,
+    }
+    if created:
+        SearchEntry.objects.create(
+            kind=SearchEntry.POST, object_id=instance.pk, **values
+        )
+    else:
+        SearchEntry.objects.update_or_create(
+            kind=SearchEntry.POST, object_id=instance.pk, defaults=values
+        )
+
+
+def index_comment(sender, instance, created=False, update_fields=None,
+                  **kwargs):
+    if update_fields and "text" not in update_fields:
+        return
+    values = {
+        "post_id": instance.post_id,
+        "author_id": instance.author_id,
+        "body": instance.text,
+    }
+    if created:
+        SearchEntry.objects.create(
+            kind=SearchEntry.COMMENT, object_id=instance.pk, **values
+        )
+    else:
+        SearchEntry.objects.update_or_create(
+            kind=SearchEntry.COMMENT, object_id=instance.pk, defaults=values
+        )
+
+
+def unindex(kind):
+    def handler(sender, instance, **kwargs):
+        SearchEntry.objects.filter(kind=kind, object_id=instance.pk).delete()
+
+    return handler
+
+
+unindex_post = unindex(SearchEntry.POST)
+unindex_comment = unindex(SearchEntry.COMMENT)
+
+signals.post_save.connect(index_post, sender=Post)
+signals.post_save.connect(index_comment, sender=Comment)
+signals.post_delete.connect(unindex_post, sender=Post)
+signals.post_delete.connect(unindex_comment, sender=Comment)
@@ -0,0 +1,115 @@
+import json
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from ..account.models import Relationship
+from ..account.testing import create_user
+from ..post.models import Post, Comment
+from . import backends
+from .models import SearchEntry
+
+
+def create_post(author, title, content="content"):
+    return Post.objects.create(
+        author=author,
+        title=title,
+        content=content,
+        image_path="",
+        image_title="",
+    )
+
+
+class SearchIndexTestCase(TestCase):
+    def setUp(self):
+        self.user = create_user("author")
+
+    def found(self, query, **kwargs):
+        return [
+            (hit.kind, hit.object_id)
+            for hit in backends.search(query, **kwargs)
+        ]
+
+    def test_title_matches_rank_first(self):
+        in_body = create_post(self.user, "holiday", "the beach in Da Nang")
+        in_title = create_post(self.user, "Da Nang beach", "photos")
+        self.assertEqual(
+            self.found("beach"),
+            [("post", in_title.id), ("post", in_body.id)],
+        )
+        self.assertEqual(self.found("nang holiday"), [("post", in_body.id)])
+
+    def test_index_follows_saves_and_deletes(self):
+        post = create_post(self.user, "first title")
+        comment = Comment.objects.create(
+            author=self.user, post=post, text="lovely first comment"
+        )
+        self.assertEqual(
+            sorted(self.found("first")),
+            [("comment", comment.id), ("post", post.id)],
+        )
+        self.assertEqual(
+            self.found("first", kind="comment"), [("comment", comment.id)]
+        )
+
+        post.title = "renamed"
+        post.save()
+        self.assertEqual(self.found("renamed"), [("post", post.id)])
+        comment.delete()
+        self.assertEqual(self.found("first"), [])
+        post.delete()
+        self.assertFalse(SearchEntry.objects.exists())
+
+    def test_operators_are_literal(self):
+        create_post(self.user, "NEAR OR NOT")
+        self.assertEqual(len(self.found('"NEAR" OR * -(')), 1)
+        self.assertEqual(self.found("*"), [])
+
+    def test_reindex_command(self):
+        post = create_post(self.user, "rebuilt")
+        Comment.objects.create(author=self.user, post=post, text="rebuilt")
+        SearchEntry.objects.all().delete()
+        out = StringIO()
+        call_command("reindex_search", batch_size=1, stdout=out)
+        self.assertIn("Indexed 2", out.getvalue())
+        self.assertEqual(len(self.found("rebuilt")), 2)
+
+
+class SearchResourceTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user("reader")
+        self.other = create_user("other")
+        for i in range(3):
+            create_post(self.user, "kitten %d" % i)
+        self.auth = {"username": "reader", "api_key": self.user.api_key.key}
+
+    def get(self, **params):
+        params.update(self.auth)
+        return self.client.get("/api/v1/search/", params)
+
+    def test_paginated_results(self):
+        data = json.loads(self.get(q="kitten", limit=2).content.decode())
+        self.assertEqual(data["meta"]["next"], 2)
+        self.assertEqual(len(data["objects"]), 2)
+        self.assertEqual(data["objects"][0]["type"], "post")
+        self.assertIn("kitten", data["objects"][0]["object"]["title"])
+        data = json.loads(
+            self.get(q="kitten", limit=2, offset=2).content.decode()
+        )
+        self.assertEqual(data["meta"]["next"], None)
+        self.assertEqual(len(data["objects"]), 1)
+
+    def test_blocked_authors_are_hidden(self):
+        create_post(self.other, "kitten from other")
+        Relationship.objects.create(
+            user_one=self.user,
+            user_two=self.other,
+            status=Relationship.BLOCKED,
+        )
+        data = json.loads(self.get(q="other").content.decode())
+        self.assertEqual(data["objects"], [])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.get().status_code, 400)
+        self.assertEqual(self.get(q="a", type="user").status_code, 400)
@@ -41,9 +41,12 @@ INSTALLED_APPS = [
     'tastypie',
     'source.account',
     'source.post',
+    'source.feed',
+    'source.search',
 ]
 
 MIDDLEWARE = [
+    'source.commons.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -105,6 +108,83 @@ DATABASES = {
     }
 }
 
+# Production profile: setting DATABASE_NAME switches to Postgres, configured
+# from the environment. Connections persist for DATABASE_CONN_MAX_AGE
+# seconds and are checked before their first use in each request, or are
+# borrowed from a per process pool of DATABASE_POOL_SIZE connections.
+# Hosts in DATABASE_REPLICA_HOSTS become read replicas (see
+# DATABASE_REPLICAS).
+
+
+def postgres_database(host, **extra):
+    pool_size = int(os.environ.get('DATABASE_POOL_SIZE', 0))
+    database = {
+        'ENGINE': 'source.commons.postgresql',
+        'NAME': os.environ['DATABASE_NAME'],
+        'USER': os.environ.get('DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.environ.get('DATABASE_PORT', ''),
+        # The pool keeps connections open, requests hand them back.
+        'CONN_MAX_AGE': 0 if pool_size else int(
+            os.environ.get('DATABASE_CONN_MAX_AGE', 600)
+        ),
+        'HEALTH_CHECKS': True,
+        'POOL_SIZE': pool_size,
+        'POOL_TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+    }
+    database.update(extra)
+    return database
+
+
+if os.environ.get('DATABASE_NAME'):
+    DATABASES['default'] = postgres_database(
+        os.environ.get('DATABASE_HOST', '')
+    )
+    for index, host in enumerate(
+        filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(','))
+    ):
+        DATABASES['replica%d' % (index + 1)] = postgres_database(
+            host.strip(), TEST={'MIRROR': 'default'}
+        )
+
+# GETs of resources with ``read_from_replica`` in their Meta read from one
+# of these aliases, everything else uses the default database.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['source.commons.routers.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Production profile: setting CACHE_LOCATION to memcached servers
+# ('host:port', comma separated) makes the default cache one shared by all
+# the workers, as the api key, response, friend graph, throttle and session
+# caches must be once WEB_CONCURRENCY is more than one (see
+# source.commons.checks).
+
+
+def memcached_cache(location):
+    return {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': [
+            server.strip() for server in location.split(',') if server.strip()
+        ],
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+    }
+
+
+if os.environ.get('CACHE_LOCATION'):
+    CACHES['default'] = memcached_cache(os.environ['CACHE_LOCATION'])
+
+# Processes serving the api, gunicorn.conf.py exports its worker count.
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -124,6 +204,41 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# PBKDF2 iterations of new hashes. Passwords hashed with another count are
+# re-hashed with this one when their user signs in.
+
+PASSWORD_HASH_ITERATIONS = int(
+    os.environ.get("PASSWORD_HASH_ITERATIONS", 100000)
+)
+
+PASSWORD_HASHERS = [
+    'source.account.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+
+# Sessions
+# How sign in keeps users signed in: 'db' stores a django_session row per
+# sign in, 'cookie' keeps the session in a signed cookie, 'cache' in the
+# SESSION_CACHE_ALIAS cache, which must be set to a cache shared by the
+# workers, and 'none' creates no session, clients send their api key with
+# every request. The system checks refuse any other mode.
+# Purge the rows left by 'db' with ``manage.py purge_sessions``.
+
+API_SESSION_MODE = os.environ.get("API_SESSION_MODE", "db")
+
+SESSION_ENGINE = {
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+    'cache': 'django.contrib.sessions.backends.cache',
+}.get(API_SESSION_MODE, 'django.contrib.sessions.backends.db')
+
+if os.environ.get("SESSION_CACHE_ALIAS"):
+    SESSION_CACHE_ALIAS = os.environ["SESSION_CACHE_ALIAS"]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.0/topics/i18n/
 
@@ -144,3 +259,90 @@ USE_TZ = True
 STATIC_URL = '/static/'
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 STATIC_ROOT = os.path.join(PROJECT_ROOT, 'static')
+
+# Home feed
+# Authors with more accepted friends than this are merged into timelines at
+# read time instead of being pushed to every friend when they post.
+FEED_FANOUT_THRESHOLD = 5000
+FEED_FANOUT_BATCH_SIZE = 1000
+# Latest posts of each side copied into the timelines of new friends.
+FEED_BACKFILL_POSTS = 20
+
+# Posts embed their newest POST_LATEST_COMMENTS comments.
+POST_LATEST_COMMENTS = 3
+
+# Api
+# Fail GET requests that run more queries than the ``query_budget`` of their
+# resource, on any database. TEST_RUNNER enables it for the whole test run,
+# a budget is never enforced in production.
+API_QUERY_BUDGET_ENFORCED = False
+TEST_RUNNER = 'source.commons.runner.TestRunner'
+
+# Successful api key checks are cached per worker for API_KEY_CACHE_TTL
+# seconds and, when API_KEY_CACHE_ALIAS names one of CACHES, shared between
+# workers for API_KEY_CACHE_SHARED_TTL seconds.
+API_KEY_CACHE_SIZE = 10000
+API_KEY_CACHE_TTL = 60
+API_KEY_CACHE_ALIAS = 'default'
+API_KEY_CACHE_SHARED_TTL = 300
+
+# Anonymous PostResource GETs are cached in this cache for at most
+# API_RESPONSE_CACHE_TTL seconds, writes to posts invalidate them earlier.
+API_RESPONSE_CACHE_ALIAS = 'default'
+API_RESPONSE_CACHE_TTL = 300
+# /metrics serves the hit ratio and latencies of each response cache, they
+# are also logged every N requests.
+API_RESPONSE_CACHE_REPORT_EVERY = 1000
+
+# Api responses are JSON only, encoded with API_JSON_ENCODER ('orjson',
+# 'ujson' or 'json'), or the fastest one installed when None. Lists of at
+# least API_STREAM_MIN_OBJECTS objects are streamed.
+API_JSON_ENCODER = None
+API_STREAM_MIN_OBJECTS = 200
+
+# Token buckets of the rate limited routes, by url name: (capacity, seconds)
+# allows bursts of capacity requests refilled at capacity per seconds, per
+# session or api key ('user') and per client address ('ip'). Buckets are
+# shared in the API_THROTTLE_CACHE_ALIAS cache. With None they are kept per
+# worker instead, and each limit is multiplied by the number of workers.
+# Set API_THROTTLE_TRUSTED_PROXIES to the number of proxies in
+# front of the app to read client addresses from X-Forwarded-For.
+API_THROTTLE_RATES = {
+    'api_sign_in': {'ip': (20, 60)},
+    'api_sign_up': {'ip': (10, 60)},
+    'api_like_post': {'user': (60, 60), 'ip': (300, 60)},
+    'api_disliked_post': {'user': (60, 60), 'ip': (300, 60)},
+    'api_send_request': {'user': (30, 60), 'ip': (150, 60)},
+    'api_bulk_request': {'user': (5, 60), 'ip': (25, 60)},
+}
+API_THROTTLE_CACHE_ALIAS = 'default'
+API_THROTTLE_LOCAL_SIZE = 100000
+API_THROTTLE_TRUSTED_PROXIES = int(
+    os.environ.get("API_THROTTLE_TRUSTED_PROXIES", 0)
+)
+
+# Requests get a Server-Timing header with their SQL, serialization and
+# total time. Requests slower than API_METRICS_SLOW_REQUEST_MS are logged
+# with their SQL. /metrics serves the per route histograms and the response
+# cache counters to API_METRICS_ALLOWED_IPS in the Prometheus text format.
+API_SERVER_TIMING = True
+API_METRICS_SLOW_REQUEST_MS = 500
+API_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Most user ids accepted by one bulk relationship request.
+RELATIONSHIP_BULK_LIMIT = 5000
+
+# Friend lists are cached in this cache for FRIEND_GRAPH_CACHE_TTL seconds,
+# relationship transitions drop them earlier. Suggestions walk at most
+# FRIEND_GRAPH_SUGGESTION_SAMPLE friends of the user.
+FRIEND_GRAPH_CACHE_ALIAS = 'default'
+FRIEND_GRAPH_CACHE_TTL = 86400
+FRIEND_GRAPH_SUGGESTION_SAMPLE = 1000
+
+# Typeahead: when fewer friends than asked for match a prefix, the first
+# NAME_INDEX_CANDIDATES other matches are ranked by mutual friends after them.
+NAME_INDEX_CANDIDATES = 50
+# Cached friend names are refreshed after at most this many seconds.
+NAME_INDEX_FRIENDS_TTL = 300
+NAME_INDEX_LIMIT = 10
+NAME_INDEX_MAX_LIMIT = 50
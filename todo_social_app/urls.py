@@ -24,6 +24,9 @@ from source.account.apis import (
     UserResource,
 )
 from source.post.apis import PostResource, LikeResource, CommentResource
+from source.feed.apis import FeedResource
+from source.search.apis import SearchResource
+from source.commons.metrics import metrics_view
 
 v1_api = Api(api_name="v1")
 
@@ -37,8 +40,15 @@ v1_api.register(PostResource())
 v1_api.register(LikeResource())
 v1_api.register(CommentResource())
 
+# Api for Feed
+v1_api.register(FeedResource())
+
+# Api for Search
+v1_api.register(SearchResource())
+
 
 urlpatterns = [
     url(r"admin/", admin.site.urls),
     url(r"api/", include(v1_api.urls)),
+    url(r"^metrics$", metrics_view, name="metrics"),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
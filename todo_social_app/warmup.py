@@ -0,0 +1,62 @@
+"""
+Work done once when the application loads instead of on the first requests
+each worker serves: URL resolution tables, the lazily built parts of the
+Tastypie resources, the password hasher and the JSON encoder.
+
+Under gunicorn with ``preload_app`` this runs in the master before it
+forks, so every worker starts warm and shares those pages copy-on-write.
+It never queries the database, and closes any connection it finds so none
+is inherited by the workers.
+"""
+from django.contrib.auth.hashers import get_hasher
+from django.db import connections
+from django.urls import Resolver404, get_resolver, resolve
+
+# One path per kind of route, resolving them compiles every pattern
+# tried on the way.
+PATHS = (
+    "/api/v1/posts/",
+    "/api/v1/posts/1/",
+    "/api/v1/comments/post/1/",
+    "/api/v1/feed/",
+    "/api/v1/authentication/sign_in/",
+    "/api/v1/relationship/friends/",
+    "/api/v1/search/",
+)
+
+
+def warm_resources(api):
+    from source.commons.resources import BaseModelResource, related_lookups
+
+    for resource in api._registry.values():
+        resource.urls
+        for field in resource.fields.values():
+            if not getattr(field, "is_related", False):
+                continue
+            to_class = field.to_class
+            model = getattr(to_class._meta, "object_class", None)
+            if model is not None:
+                # Instantiates and caches the related resource.
+                field.get_related_resource(model())
+        if isinstance(resource, BaseModelResource):
+            resource._related_lookups = related_lookups(type(resource))
+
+
+def warm_up():
+    from source.commons.serializers import default_serializer
+    from todo_social_app.urls import v1_api
+
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for path in PATHS:
+        try:
+            resolve(path)
+        except Resolver404:
+            pass
+    warm_resources(v1_api)
+
+    hasher = get_hasher()
+    hasher.encode("warm-up", hasher.salt())
+    default_serializer.to_json({"meta": {}, "objects": []})
+
+    connections.close_all()
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "todo_social_app.settings")
 
 application = get_wsgi_application()
+
+from django.core.management import call_command  # noqa: E402
+from todo_social_app.warmup import warm_up  # noqa: E402
+
+# Servers do not run the system checks, refuse to start on an error.
+call_command("check")
+warm_up()